@@ -66,5 +66,21 @@ class ExecutionCannotStartError(ConductorError):
     pass
 
 
+class InputsNotAvailableError(ExecutionCannotStartError):
+    pass
+
+
 class InvalidExecutionError(ConductorError):
     pass
+
+
+class TaskDependencyCycleError(InvalidSettingsError):
+    pass
+
+
+class DecompressionError(ConductorError):
+    pass
+
+
+class OutputsNotPublishedError(ConductorError):
+    pass
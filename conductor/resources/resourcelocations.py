@@ -2,6 +2,7 @@
 Resource location classes for conductor
 """
 
+import posixpath
 import logging
 
 from .. import ConductorScheme
@@ -22,11 +23,13 @@ class ResourceLocation(object):
     relative_paths = []
     authorization = u""
     media_type = u""
+    _urls_cache = None
 
     def __init__(self, relative_paths, media_type, server=None, scheme=None,
                  authorization=u"", location_for=ServerSchemeMethod.GET,
                  parent=None):
         self.parent = parent
+        self._urls_cache = None
         server = server or server_factory.get_server()
         scheme = scheme or ConductorScheme.FILE
         config = {
@@ -60,6 +63,35 @@ class ResourceLocation(object):
                 "{0.scheme})".format(self))
 
     def create_urls(self):
+        """
+        Create the URLs that are described by this location.
+
+        One URL is created for each combination of relative path and base
+        path of the scheme configuration. URLs that turn out to be
+        duplicates, for example because of overlapping base paths, are
+        dropped.
+
+        The generated URLs are cached, keyed on the parent resource's
+        timeslot and parameters, so repeated calls for the same resource
+        state do not rebuild them.
+
+        :return: A new list with the URLs
+        :rtype: [conductor.urlparser.Url]
+        """
+
+        key = self._urls_cache_key()
+        if self._urls_cache is None or self._urls_cache[0] != key:
+            self._urls_cache = key, self._build_urls()
+        return list(self._urls_cache[1])
+
+    def _urls_cache_key(self):
+        result = None
+        if self.parent is not None:
+            result = (id(self.parent), self.parent.timeslot,
+                      tuple(sorted(self.parent.parameters.items())))
+        return result
+
+    def _build_urls(self):
         url_params = []
         for p in self.relative_paths:
             query_params, dequeried = Url.extract_query_params(p)
@@ -71,6 +103,7 @@ class ResourceLocation(object):
                     full_path = "/".join((base_path, dequeried))
                     url_params.append((full_path, query_params, hash_part))
         result = []
+        seen = set()
         for path, query_params, hash_part in url_params:
             url = Url(self.scheme_configuration.scheme,
                       host_name=self.server.domain,
@@ -79,7 +112,11 @@ class ResourceLocation(object):
                       user_password=self.scheme_configuration.user_password,
                       path_part=path, hash_part=hash_part,
                       parent=self.parent, **query_params)
-            result.append(url)
+            identity = (posixpath.normpath(url.path_part), url.query_part,
+                        url.hash_part)
+            if identity not in seen:
+                seen.add(identity)
+                result.append(url)
         return result
 
 
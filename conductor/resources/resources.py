@@ -4,6 +4,7 @@ Resource class for conductor
 
 import re
 import os
+import copy
 import logging
 import pytz
 import datetime
@@ -17,6 +18,7 @@ from ..servers import server_factory
 from ..collections import collection_factory
 from ..settings import settings
 from ..urlhandlers import url_handler_factory
+from ..tasks import timeslotdisplacement
 from . import resourcelocations
 
 logger = logging.getLogger(__name__)
@@ -46,6 +48,22 @@ class ResourceFactory(object):
                 loc.parent = r
         return r
 
+    def get_locations(self, location_settings, location_type):
+        """
+        Create resource locations from their settings.
+
+        :param location_settings: A list of location settings, with the same
+            structure as the `get_locations`, `post_locations` and
+            `find_locations` of a resource's settings
+        :param location_type: The type of the locations to create
+        :type location_type: conductor.ServerSchemeMethod
+        :return: The new locations, without a parent resource
+        :rtype: [conductor.resources.resourcelocations.ResourceLocation]
+        """
+
+        return self._parse_resource_locations(location_settings,
+                                              location_type)
+
     @staticmethod
     def _parse_resource_locations(locations, mover_method):
         result = []
@@ -146,8 +164,7 @@ class Resource(object):
     def dekade(self):
         result = None
         if self.timeslot is not None:
-            day = self.timeslot.day
-            result = 1 if day < 11 else (2 if day < 21 else 3)
+            result = timeslotdisplacement.dekade_of_day(self.timeslot.day)
         return result
 
     @property
@@ -204,6 +221,27 @@ class Resource(object):
                 "collection={1.collection!r}, "
                 "timeslot={1.timeslot!r})".format(__name__, self))
 
+    def __copy__(self):
+        """
+        Return a shallow copy of this resource.
+
+        The resource locations are copied as well and re-parented to the new
+        instance, so that the URLs they create are formatted with the new
+        resource's timeslot and parameters.
+        """
+
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new.parameters = self.parameters.copy()
+        for attr in ("_get_locations", "_post_locations", "_find_locations"):
+            locations = []
+            for rl in getattr(self, attr):
+                new_rl = copy.copy(rl)
+                new_rl.parent = new
+                locations.append(new_rl)
+            setattr(new, attr, locations)
+        return new
+
     def __str__(self):
         return self.urn
 
@@ -229,7 +267,36 @@ class Resource(object):
         }[location_type]
         group.append(resource_location)
 
-    def get_representation(self, destination_directory):
+    def get_urls(self):
+        """
+        Return the URLs where a representation of the resource may be found.
+
+        The URLs are ordered in the same way as they are tried by the
+        `get_representation` method.
+
+        :return: A list with the URLs of all of the get_locations
+        :rtype: [conductor.urlparser.Url]
+        """
+
+        urls = []
+        for rl in self.sort_locations(self._get_locations):
+            urls.extend(rl.create_urls())
+        return urls
+
+    def post_urls(self):
+        """
+        Return the URLs where representations of the resource are posted to.
+
+        :return: A list with the URLs of all of the post_locations
+        :rtype: [conductor.urlparser.Url]
+        """
+
+        urls = []
+        for rl in self.sort_locations(self._post_locations):
+            urls.extend(rl.create_urls())
+        return urls
+
+    def get_representation(self, destination_directory, decompress=False):
         """
         Get a resource's representation.
 
@@ -237,7 +304,11 @@ class Resource(object):
         for the resource and tries to fetch the its representation using
         the URLs defined in each resource_location. It stops at the first
         successful URL retrieval. Locations that specify the file scheme
-        are tried first.
+        are tried first. Each retrieval waits for a free connection slot on
+        the location's server.
+
+        When `decompress` is True, compressed representations are
+        decompressed while they are being retrieved.
         """
 
         representation = None
@@ -252,8 +323,9 @@ class Resource(object):
                 logger.debug("Trying URL: {}".format(u.url))
                 handler = url_handler_factory.get_handler(u.scheme)
                 try:
-                    representation = handler.get_from_url(
-                        u, destination_directory)
+                    with rl.server.connection_slot():
+                        representation = handler.get_from_url(
+                            u, destination_directory, decompress=decompress)
                     logger.debug("found resource")
                 except errors.ResourceNotFoundError:
                     logger.debug("did not find resource")
@@ -313,7 +385,7 @@ class Resource(object):
             j = 0
             urls = rl.create_urls()
             while not found_info and j < len(urls):
-                url = urls[j]
+                url = copy.copy(urls[j])
                 url.parent = None  # to access the format marks on the urls
                 handler = url_handler_factory.get_handler(url.scheme)
                 logger.debug("Trying to find in: {}".format(url.url))
@@ -3,6 +3,8 @@ Server classes for conductor
 """
 
 import logging
+import threading
+import contextlib
 from socket import gethostname
 
 from . import ConductorScheme
@@ -41,12 +43,17 @@ class ServerFactory(object):
                 server_post_schemes.append(ss)
         instance = Server(name, domain=s["domain"],
                           schemes_get=server_get_schemes,
-                          schemes_post=server_post_schemes)
+                          schemes_post=server_post_schemes,
+                          max_connections=s.get("max_connections"))
         return instance
 
 
 server_factory = ServerFactory()
 
+# connection slots are shared by all Server instances with the same name
+_connection_slots = dict()
+_connection_slots_lock = threading.Lock()
+
 
 class Server(object):
     """
@@ -67,12 +74,15 @@ class Server(object):
     domain = None
     schemes_get = []
     schemes_post = []
+    max_connections = None
 
-    def __init__(self, name, domain=None, schemes_get=None, schemes_post=None):
+    def __init__(self, name, domain=None, schemes_get=None, schemes_post=None,
+                 max_connections=None):
         self.name = name
         self.domain = domain
         self.schemes_get = schemes_get if schemes_get is not None else []
         self.schemes_post = schemes_post if schemes_post is not None else []
+        self.max_connections = max_connections
 
     def __repr__(self):
         return ("{0}.{1.__class__.__name__}({1.name!r}, domain={1.domain!r}, "
@@ -83,6 +93,27 @@ class Server(object):
                                        self.domain,
                                        [s.scheme for s in self.schemes_get])
 
+    @contextlib.contextmanager
+    def connection_slot(self):
+        """
+        Wait for a free connection slot on the server.
+
+        The number of simultaneous connections to a server is limited by its
+        `max_connections` setting. Servers without this setting accept any
+        number of connections.
+        """
+
+        if self.max_connections is None:
+            yield
+        else:
+            with _connection_slots_lock:
+                slot = _connection_slots.setdefault(
+                    (self.name, self.max_connections),
+                    threading.BoundedSemaphore(self.max_connections)
+                )
+            with slot:
+                yield
+
 
 class ServerScheme(object):
 
@@ -17,6 +17,13 @@ class Settings(object):
     collections = []
     resources = []
     tasks = []
+    working_directories = dict()
+    fingerprints = dict()
+    journals = dict()
+    http_cache = dict()
+    segmented_downloads = dict()
+    events = dict()
+    sftp = dict()
 
     def __init__(self):
         self.settings_source = None
@@ -24,6 +31,13 @@ class Settings(object):
         self.collections = []
         self.resources = []
         self.tasks = []
+        self.working_directories = dict()
+        self.fingerprints = dict()
+        self.journals = dict()
+        self.http_cache = dict()
+        self.segmented_downloads = dict()
+        self.events = dict()
+        self.sftp = dict()
 
     def __repr__(self):
         return "{0}.{1.__class__.__name__}({1.settings_source!r})".format(
@@ -58,6 +72,15 @@ class Settings(object):
                 self.collections = all_settings.get("collections", [])
                 self.resources = all_settings.get("resources", [])
                 self.tasks = all_settings.get("tasks", [])
+                self.working_directories = all_settings.get(
+                    "working_directories", dict())
+                self.fingerprints = all_settings.get("fingerprints", dict())
+                self.journals = all_settings.get("journals", dict())
+                self.http_cache = all_settings.get("http_cache", dict())
+                self.segmented_downloads = all_settings.get(
+                    "segmented_downloads", dict())
+                self.events = all_settings.get("events", dict())
+                self.sftp = all_settings.get("sftp", dict())
         except IOError as e:
             logger.error(e)
 
@@ -0,0 +1,216 @@
+"""
+Backfill runs of conductor tasks over ranges of timeslots
+"""
+
+import time
+import logging
+import argparse
+import multiprocessing
+import multiprocessing.util
+from collections import namedtuple
+
+import dateutil.parser
+
+from .. import tracing
+from ..settings import settings
+from .tasks import task_factory
+from .workingdirs import working_dir_manager
+from . import taskobserver
+from . import timeslotdisplacement as tsd
+
+logger = logging.getLogger(__name__)
+
+BackfillOutcome = namedtuple("BackfillOutcome", ["timeslot", "success",
+                                                 "details", "seconds",
+                                                 "spans"])
+
+# run modes that have already been created in the current process
+_run_modes = dict()
+
+
+class BackfillReport(object):
+    """
+    The outcome of a backfill run.
+
+    :arg task_name: The name of the task that was run
+    :arg outcomes: The outcome of each timeslot
+    :type outcomes: [BackfillOutcome]
+    :arg seconds: The total time of the backfill run
+    """
+
+    def __init__(self, task_name, outcomes, seconds):
+        self.task_name = task_name
+        self.outcomes = outcomes
+        self.seconds = seconds
+
+    def __repr__(self):
+        return ("{0}.{1.__class__.__name__}({1.task_name!r}, "
+                "{2} outcomes)".format(__name__, self, len(self.outcomes)))
+
+    @property
+    def succeeded(self):
+        return [o for o in self.outcomes if o.success]
+
+    @property
+    def failed(self):
+        return [o for o in self.outcomes if not o.success]
+
+    @property
+    def throughput(self):
+        """
+        The number of timeslots processed per second.
+        """
+
+        return len(self.outcomes) / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self):
+        lines = ["{}: {} timeslots, {} failed, {:.1f}s, "
+                 "{:.2f} timeslots/s".format(self.task_name,
+                                             len(self.outcomes),
+                                             len(self.failed), self.seconds,
+                                             self.throughput)]
+        for outcome in self.failed:
+            lines.append("  {:%Y%m%d%H%M}: {}".format(outcome.timeslot,
+                                                      outcome.details))
+        return "\n".join(lines)
+
+
+def backfill(task_name, timeslots, jobs=1, mode_name="CREATION_MODE",
+             trace_path=None):
+    """
+    Run a task for every input timeslot on a pool of worker processes.
+
+    Each worker process handles many timeslots. The settings are loaded only
+    once in each worker, when they are not inherited from the parent
+    process, and the run mode is created only once per worker and backfill.
+
+    :param task_name: The name of the task to run
+    :param timeslots: The timeslots to run, for example a
+        conductor.tasks.timeslotdisplacement.TimeslotSchedule
+    :param jobs: The number of worker processes. With a single job the
+        timeslots are run in the current process
+    :param mode_name: The name of the run mode to use
+    :param trace_path: When given, the runs of every worker are traced and
+        written to this path in the Chrome trace event format
+    :return: The outcome of each timeslot and the total throughput
+    :rtype: BackfillReport
+    """
+
+    start = time.time()
+    trace = trace_path is not None
+    arguments = ((task_name, ts, mode_name, trace) for ts in timeslots)
+    outcomes = []
+    # the settings may have been reloaded since the last backfill
+    _run_modes.clear()
+    tracing_was_enabled = tracing.tracer.enabled
+    tracing.tracer.enabled = tracing_was_enabled or trace
+    try:
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs, initializer=_initialize_worker,
+                                        initargs=(settings.settings_source,
+                                                  trace))
+            try:
+                for outcome in pool.imap(_run_timeslot, arguments):
+                    outcomes.append(outcome)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            outcomes.extend(_run_timeslot(a) for a in arguments)
+    finally:
+        tracing.tracer.enabled = tracing_was_enabled
+    if trace:
+        tracing.tracer.export(trace_path,
+                              [s for o in outcomes for s in o.spans])
+    report = BackfillReport(task_name, outcomes, time.time() - start)
+    logger.info(report.summary())
+    return report
+
+
+def _initialize_worker(settings_source, trace):
+    if settings_source is not None and not any(settings.tasks):
+        settings.get_settings(settings_source)
+    tracing.tracer.enabled = trace
+    tracing.tracer.pop_spans()
+    _run_modes.clear()
+    # pool workers do not run atexit handlers, only finalizers
+    multiprocessing.util.Finalize(None, working_dir_manager.clear,
+                                  exitpriority=10)
+
+
+def _run_timeslot(arguments):
+    return run_timeslot(*arguments)
+
+
+def run_timeslot(task_name, timeslot, mode_name="CREATION_MODE",
+                 trace=False):
+    """
+    Run a task for a single timeslot and report the outcome.
+
+    Run modes are created once per process and reused. Failures are
+    reported in the outcome instead of being raised.
+
+    :param trace: Whether to return the spans recorded during the run
+    :rtype: BackfillOutcome
+    """
+
+    start = time.time()
+    success = False
+    details = ""
+    task = None
+    try:
+        with tracing.span("backfill", "backfill", task=task_name,
+                          timeslot=timeslot.strftime("%Y%m%d%H%M")):
+            key = task_name, mode_name
+            if key not in _run_modes:
+                _run_modes[key] = task_factory.get_run_mode(task_name,
+                                                            mode_name)
+            task = task_factory.get_task(task_name, timeslot)
+            _run_modes[key].run(task)
+        success = True
+    except Exception as err:
+        logger.exception("{} failed for {}".format(task_name, timeslot))
+        details = repr(err)
+    finally:
+        if task is not None:
+            task.clean_temporary_resources()
+        taskobserver.event_bus.flush()
+    outcome = BackfillOutcome(timeslot, success, details, time.time() - start,
+                              tracing.tracer.pop_spans() if trace else [])
+    logger.info("{} {:%Y%m%d%H%M}: {} ({:.1f}s)".format(
+        task_name, timeslot, "ok" if success else "failed", outcome.seconds))
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a conductor task for a range of timeslots")
+    parser.add_argument("settings", help="URL of the settings, for example "
+                                         "file:///path/to/settings.json")
+    parser.add_argument("task", help="Name of the task to run")
+    parser.add_argument("start", help="First timeslot, for example "
+                                      "201501010000")
+    parser.add_argument("end", help="Last timeslot")
+    parser.add_argument("-f", "--frequency", type=int, default=1,
+                        help="Number of units between timeslots")
+    parser.add_argument("-u", "--unit", default="hours",
+                        choices=tsd.TimeslotSchedule.UNITS,
+                        help="Unit of the frequency")
+    parser.add_argument("-j", "--jobs", type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="Number of worker processes")
+    parser.add_argument("-m", "--mode", default="CREATION_MODE",
+                        help="Run mode")
+    parser.add_argument("-t", "--trace",
+                        help="Write a Chrome trace of the runs to this path")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    settings.get_settings(args.settings)
+    frequency = {"frequency_{}".format(args.unit): args.frequency}
+    schedule = tsd.TimeslotSchedule(dateutil.parser.parse(args.start),
+                                    end=dateutil.parser.parse(args.end),
+                                    **frequency)
+    report = backfill(args.task, schedule, jobs=args.jobs,
+                      mode_name=args.mode, trace_path=args.trace)
+    print(report.summary())
+    return 0 if not any(report.failed) else 1
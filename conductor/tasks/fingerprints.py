@@ -0,0 +1,108 @@
+"""
+Fingerprints of the inputs and outputs of task runs
+
+A fingerprint records the identity of every input that was used to produce
+a task's outputs for a timeslot, together with the identity of the
+published outputs. Identities are made of a URL, a size and a modification
+time. A run whose inputs still match the stored fingerprint does not need
+to be repeated.
+"""
+
+import os
+import json
+import errno
+import logging
+import tempfile
+
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(fingerprint):
+    """
+    Return the input fingerprint as it is after being stored and loaded.
+    """
+
+    return json.loads(json.dumps(fingerprint))
+
+
+class FingerprintStore(object):
+    """
+    Store fingerprints as JSON files, one per task and timeslot.
+
+    :arg root: The directory where fingerprints are stored. It defaults to
+        the `root` of the `fingerprints` settings. Without a root the store
+        is disabled
+    """
+
+    def __init__(self, root=None):
+        self._root = root
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.root!r})".format(__name__, self)
+
+    @property
+    def root(self):
+        return self._root or settings.fingerprints.get("root")
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    def load(self, task_name, timeslot):
+        """
+        Return the stored fingerprint or None, if there is none.
+        """
+
+        try:
+            with open(self._get_path(task_name, timeslot)) as fh:
+                result = json.load(fh)
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            result = None
+        except ValueError:
+            logger.warning("Ignoring corrupt fingerprint for {} {}".format(
+                task_name, timeslot))
+            result = None
+        return result
+
+    def save(self, task_name, timeslot, fingerprint):
+        """
+        Store a fingerprint, replacing the previous one atomically.
+        """
+
+        path = self._get_path(task_name, timeslot)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(handle, "w") as fh:
+                json.dump(fingerprint, fh, sort_keys=True)
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def forget(self, task_name, timeslot):
+        """
+        Remove a stored fingerprint, forcing the next run to be repeated.
+        """
+
+        try:
+            os.remove(self._get_path(task_name, timeslot))
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+
+    def _get_path(self, task_name, timeslot):
+        return os.path.join(self.root, task_name.replace(" ", "_"),
+                            "{:%Y%m%d%H%M}.json".format(timeslot))
+
+
+fingerprint_store = FingerprintStore()
@@ -0,0 +1,223 @@
+"""
+Journals of task runs that can be resumed after a crash
+
+Each run of a task for a timeslot appends its completed steps to a journal
+file that lives next to the run's working directory. When a run fails or
+the process dies, the next attempt reuses the working directory and skips
+every step that the journal records as completed.
+"""
+
+import os
+import json
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+
+from ..settings import settings
+from ..urlhandlers.base import TRANSFER_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def file_checksum(path):
+    """
+    Return the SHA-1 hex digest of a file's contents.
+    """
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        chunk = fh.read(TRANSFER_CHUNK_SIZE)
+        while chunk:
+            digest.update(chunk)
+            chunk = fh.read(TRANSFER_CHUNK_SIZE)
+    return digest.hexdigest()
+
+
+class RunJournal(object):
+    """
+    An append-only record of the completed steps of a task run.
+
+    :arg directory: The directory of the journal. It holds the journal file
+        and the run's working directory
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, "journal.jsonl")
+        self.working_dir = os.path.join(directory, "work")
+        self.attempts = 0
+        self.executed = False
+        self.executed_inputs = None
+        self._fetched = dict()
+        self._published = dict()
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(self.working_dir)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        self._load()
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.directory!r})".format(
+            __name__, self)
+
+    def record_start(self):
+        self._append({"event": "started"})
+
+    def fetched_path(self, key):
+        """
+        Return the path of an input fetched by a previous attempt.
+
+        :arg key: The (URN, timeslot string) of the input
+        :return: The path, or None if the input was not fetched or if its
+            file no longer matches the recorded checksum
+        """
+
+        record = self._fetched.get(tuple(key))
+        result = None
+        if record is not None and os.path.isfile(record["path"]):
+            if file_checksum(record["path"]) == record["sha1"]:
+                result = record["path"]
+            else:
+                logger.warning("{} changed since it was fetched".format(
+                    record["path"]))
+        return result
+
+    def record_fetch(self, key, path):
+        self._append({"event": "fetched", "input": list(key), "path": path,
+                      "sha1": file_checksum(path)})
+
+    def record_execution(self, inputs):
+        """
+        Record that the task was executed with the input identities.
+
+        :arg inputs: A list with the [URN, timeslot string, SHA-1 digest]
+            of each fetched input, as returned by `input_identities`
+        """
+
+        self._append({"event": "executed", "inputs": inputs})
+
+    def executed_with(self, inputs):
+        """
+        Return whether a previous attempt executed the task with the inputs.
+
+        :arg inputs: A list as returned by `input_identities`
+        """
+
+        return (self.executed_inputs is not None and
+                sorted(self.executed_inputs) ==
+                sorted(json.loads(json.dumps(inputs))))
+
+    @staticmethod
+    def input_identities(fetched):
+        """
+        Identify fetched inputs by their key and the checksum of their file.
+
+        :arg fetched: A mapping with the path of each input, or None for
+            the inputs that were not fetched, indexed by the input's
+            (URN, timeslot string) key
+        :rtype: list
+        """
+
+        return sorted([urn, timeslot, file_checksum(path)
+                       if path is not None else None]
+                      for (urn, timeslot), path in fetched.items())
+
+    def published_path(self, output, destination):
+        """
+        Return the path where a previous attempt published an output.
+
+        :return: The published path, or None if it was not published
+        """
+
+        return self._published.get((output, destination))
+
+    def record_publish(self, output, destination, path):
+        self._append({"event": "published", "output": output,
+                      "destination": destination, "path": path})
+
+    def finish(self):
+        """
+        Remove the journal and the working directory of a successful run.
+        """
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _append(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            with open(self.path, "a") as fh:
+                fh.write(line)
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._apply(record)
+
+    def _load(self):
+        try:
+            with open(self.path) as fh:
+                lines = fh.readlines()
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            lines = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line is incomplete when the process died while
+                # writing it
+                logger.warning("Ignoring incomplete journal record")
+                continue
+            self._apply(record)
+
+    def _apply(self, record):
+        event = record["event"]
+        if event == "started":
+            self.attempts += 1
+        elif event == "fetched":
+            self._fetched[tuple(record["input"])] = record
+        elif event == "executed":
+            self.executed = True
+            self.executed_inputs = record.get("inputs")
+        elif event == "published":
+            self._published[(record["output"],
+                             record["destination"])] = record["path"]
+
+
+class JournalStore(object):
+    """
+    Create the journals of task runs.
+
+    :arg root: The directory where journals are kept. It defaults to the
+        `root` of the `journals` settings. Without a root, runs are not
+        journaled
+    """
+
+    def __init__(self, root=None):
+        self._root = root
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.root!r})".format(__name__, self)
+
+    @property
+    def root(self):
+        return self._root or settings.journals.get("root")
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    def open(self, task_name, timeslot):
+        """
+        Return the journal of a task's run, resuming any previous attempt.
+        """
+
+        return RunJournal(os.path.join(self.root,
+                                       task_name.replace(" ", "_"),
+                                       "{:%Y%m%d%H%M}".format(timeslot)))
+
+
+journal_store = JournalStore()
@@ -0,0 +1,212 @@
+"""
+Pipelined runs of a task over consecutive timeslots
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from .. import tracing
+from .tasks import task_factory
+from .backfill import BackfillOutcome, BackfillReport
+from .workingdirs import working_dir_manager
+
+logger = logging.getLogger(__name__)
+
+
+class InputCache(object):
+    """
+    Fetched inputs shared by the runs of consecutive timeslots.
+
+    Each run retains the keys of the inputs it needs and releases them when
+    it is done. Inputs are deleted once no run retains them.
+
+    :arg directory: The directory where cached inputs are stored
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._paths = dict()
+        self._sizes = dict()
+        self._references = dict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.directory!r})".format(
+            __name__, self)
+
+    @property
+    def size(self):
+        """
+        The total size of the cached inputs, in bytes.
+        """
+
+        with self._lock:
+            return sum(self._sizes.values())
+
+    @staticmethod
+    def get_key(resource):
+        return resource.urn, resource.timeslot_string
+
+    def get_directory(self, key):
+        """
+        Return the directory where the input with the given key is stored.
+        """
+
+        path = self._get_path(key)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+
+    def get(self, key):
+        with self._lock:
+            path = self._paths.get(key)
+            if path is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return path
+
+    def put(self, key, path):
+        size = os.path.getsize(path) if os.path.isfile(path) else 0
+        with self._lock:
+            self._paths[key] = path
+            self._sizes[key] = size
+
+    def retain(self, keys):
+        with self._lock:
+            for key in keys:
+                self._references[key] = self._references.get(key, 0) + 1
+
+    def release(self, keys):
+        """
+        Stop using the inputs and delete the ones that are no longer used.
+        """
+
+        to_delete = []
+        with self._lock:
+            for key in keys:
+                self._references[key] -= 1
+                if self._references[key] == 0:
+                    del self._references[key]
+                    self._paths.pop(key, None)
+                    self._sizes.pop(key, None)
+                    to_delete.append(key)
+        for key in to_delete:
+            shutil.rmtree(self._get_path(key), ignore_errors=True)
+
+    def _get_path(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(repr(key)).hexdigest())
+
+
+class PipelinedRunner(object):
+    """
+    Run a task for consecutive timeslots, fetching ahead of execution.
+
+    While the task executes for a timeslot, the inputs of the following
+    timeslots are fetched in the background. Inputs shared by consecutive
+    timeslots, such as rolling windows of multiple timeslots, are fetched
+    only once.
+
+    :arg task_name: The name of the task to run
+    :arg timeslots: The timeslots to run, in order
+    :arg prefetch_depth: How many timeslots ahead of the one executing may
+        have their inputs fetched
+    :arg disk_budget: Maximum size, in bytes, of the cached inputs before
+        fetching ahead is paused. With a budget, the next timeslot is only
+        fetched once the previous fetch is done. None means unlimited. The
+        inputs of the timeslot about to execute are always fetched
+    :arg mode_name: The name of the run mode used for every timeslot
+    """
+
+    def __init__(self, task_name, timeslots, prefetch_depth=1,
+                 disk_budget=None, mode_name="CREATION_MODE"):
+        self.task_name = task_name
+        self.timeslots = timeslots
+        self.prefetch_depth = prefetch_depth
+        self.disk_budget = disk_budget
+        self.mode_name = mode_name
+        self.cache = None
+
+    def __repr__(self):
+        return ("{0}.{1.__class__.__name__}({1.task_name!r}, "
+                "prefetch_depth={1.prefetch_depth!r})".format(__name__, self))
+
+    def run(self):
+        """
+        Run the task for every timeslot.
+
+        :return: The outcome of each timeslot
+        :rtype: conductor.tasks.backfill.BackfillReport
+        """
+
+        start = time.time()
+        mode = task_factory.get_run_mode(self.task_name, self.mode_name)
+        cache_directory = working_dir_manager.acquire()
+        self.cache = InputCache(cache_directory)
+        timeslots = iter(self.timeslots)
+        pending = deque()
+        outcomes = []
+        fetcher = ThreadPool(1)
+        try:
+            self._fill(pending, timeslots, fetcher)
+            while any(pending):
+                task, keys, fetching = pending.popleft()
+                fetching.wait()
+                self._fill(pending, timeslots, fetcher)
+                outcomes.append(self._execute(mode, task, fetching))
+                self.cache.release(keys)
+                task.clean_temporary_resources()
+                self._fill(pending, timeslots, fetcher)
+        finally:
+            fetcher.close()
+            fetcher.join()
+            working_dir_manager.release(cache_directory)
+        logger.info("Reused {} inputs, fetched {}".format(self.cache.hits,
+                                                           self.cache.misses))
+        return BackfillReport(self.task_name, outcomes, time.time() - start)
+
+    def _fill(self, pending, timeslots, fetcher):
+        while len(pending) <= self.prefetch_depth:
+            if any(pending) and self.disk_budget is not None:
+                # the size of a fetch in progress is not known yet
+                if (not pending[-1][2].ready() or
+                        self.cache.size > self.disk_budget):
+                    break
+            try:
+                timeslot = next(timeslots)
+            except StopIteration:
+                break
+            task = task_factory.get_task(self.task_name, timeslot)
+            keys = [self.cache.get_key(inp.resource) for inp in
+                    task.active_inputs]
+            self.cache.retain(keys)
+            pending.append((task, keys,
+                            fetcher.apply_async(self._fetch, (task,))))
+
+    def _fetch(self, task):
+        with tracing.span("prefetch", "pipeline", task=task.name,
+                          timeslot=task.timeslot_string):
+            return task.fetch_inputs(cache=self.cache)
+
+    def _execute(self, mode, task, fetching):
+        start = time.time()
+        success = False
+        details = ""
+        try:
+            task.prefetched_inputs = fetching.get()
+            mode.run(task)
+            success = True
+        except Exception as err:
+            logger.exception("{} failed".format(task))
+            details = repr(err)
+        return BackfillOutcome(task.timeslot, success, details,
+                               time.time() - start, [])
@@ -0,0 +1,224 @@
+"""
+Dependency aware scheduling of conductor tasks
+"""
+
+import time
+import heapq
+import Queue
+import logging
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from .. import errors
+from ..settings import settings
+from .tasks import task_factory
+
+logger = logging.getLogger(__name__)
+
+TaskOutcome = namedtuple("TaskOutcome", ["task_name", "timeslot", "success",
+                                         "details", "seconds"])
+
+
+class TaskNode(object):
+    """
+    A task run for a single timeslot in the scheduler's graph.
+
+    :arg task: The task to run
+    :type task: conductor.tasks.tasks.Task
+    :arg weight: The expected duration of the task, in seconds
+    """
+
+    def __init__(self, task, weight=1):
+        self.task = task
+        self.weight = weight
+        self.upstream = set()
+        self.downstream = set()
+        self.priority = weight
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.key!r})".format(__name__, self)
+
+    @property
+    def key(self):
+        return self.task.name, self.task.timeslot
+
+
+class TaskScheduler(object):
+    """
+    Run tasks as soon as the tasks that produce their inputs are done.
+
+    The dependencies between tasks are derived from the settings: a task
+    depends on another one when it has an active input with the same URN
+    and timeslot as one of the other task's active outputs. Inputs that are
+    not produced by any of the scheduled tasks are expected to exist
+    already.
+
+    Ready tasks are run on a pool of threads. When there are more ready tasks
+    than free workers, those on the critical path run first. The critical
+    path is estimated with each task's `expected_duration` setting, which
+    defaults to one second.
+
+    :arg task_names: The names of the tasks to schedule
+    :arg timeslots: The timeslots to schedule each task for
+    :arg max_workers: The number of tasks that can run at the same time
+    :arg mode_name: The name of the run mode used for every task
+    """
+
+    def __init__(self, task_names, timeslots, max_workers=4,
+                 mode_name="CREATION_MODE"):
+        self.task_names = list(task_names)
+        self.timeslots = list(timeslots)
+        self.max_workers = max_workers
+        self.mode_name = mode_name
+        self.nodes = dict()
+        self._run_modes = dict()
+
+    def __repr__(self):
+        return ("{0}.{1.__class__.__name__}({1.task_names!r}, "
+                "max_workers={1.max_workers!r})".format(__name__, self))
+
+    def build_graph(self):
+        """
+        Create the tasks and find the dependencies between them.
+
+        :return: The nodes of the graph, indexed by (task name, timeslot)
+        :rtype: dict
+        :raises: conductor.errors.TaskDependencyCycleError
+        """
+
+        self.nodes = dict()
+        producers = dict()
+        for name in self.task_names:
+            weight = self._get_task_settings(name).get("expected_duration", 1)
+            for timeslot in self.timeslots:
+                node = TaskNode(task_factory.get_task(name, timeslot),
+                                weight=weight)
+                self.nodes[node.key] = node
+                for out in node.task.active_outputs:
+                    producers.setdefault(self._resource_key(out),
+                                         []).append(node)
+        for node in self.nodes.values():
+            for inp in node.task.active_inputs:
+                for producer in producers.get(self._resource_key(inp), []):
+                    if producer is not node:
+                        node.upstream.add(producer)
+                        producer.downstream.add(node)
+        for node in reversed(self.topological_order()):
+            node.priority = node.weight + max(
+                [n.priority for n in node.downstream] or [0])
+        return self.nodes
+
+    def topological_order(self):
+        """
+        Return the nodes sorted so that each comes after all of its upstream.
+
+        :raises: conductor.errors.TaskDependencyCycleError
+        """
+
+        pending = dict((n, len(n.upstream)) for n in self.nodes.values())
+        ready = [n for n, count in pending.items() if count == 0]
+        result = []
+        while any(ready):
+            node = ready.pop()
+            result.append(node)
+            for child in node.downstream:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    ready.append(child)
+        if len(result) != len(self.nodes):
+            cyclic = sorted(set(n.key[0] for n in self.nodes.values()
+                                if n not in result))
+            raise errors.TaskDependencyCycleError(
+                "Tasks depend on each other: {}".format(", ".join(cyclic)))
+        return result
+
+    def run(self):
+        """
+        Run all of the scheduled tasks.
+
+        A task whose upstream tasks failed is not run and is reported as
+        failed too.
+
+        :return: The outcome of every task, indexed by (task name, timeslot)
+        :rtype: dict
+        """
+
+        if not any(self.nodes):
+            self.build_graph()
+        pending = dict((n, len(n.upstream)) for n in self.nodes.values())
+        ready = []
+        for node, count in pending.items():
+            if count == 0:
+                self._push(ready, node)
+        finished = Queue.Queue()
+        outcomes = dict()
+        running = 0
+        pool = ThreadPool(self.max_workers)
+        try:
+            while any(ready) or running > 0:
+                while any(ready) and running < self.max_workers:
+                    node = heapq.heappop(ready)[-1]
+                    failed = [n for n in node.upstream if
+                              not outcomes[n.key].success]
+                    if any(failed):
+                        outcome = self._outcome(
+                            node, False, "upstream tasks failed: {}".format(
+                                ", ".join(n.key[0] for n in failed)), 0)
+                        finished.put((node, outcome))
+                    else:
+                        logger.info("Starting {}".format(node.key))
+                        pool.apply_async(self._run_node, (node,),
+                                         callback=finished.put)
+                    running += 1
+                node, outcome = finished.get()
+                running -= 1
+                outcomes[node.key] = outcome
+                for child in node.downstream:
+                    pending[child] -= 1
+                    if pending[child] == 0:
+                        self._push(ready, child)
+        finally:
+            pool.close()
+            pool.join()
+        return outcomes
+
+    def _run_node(self, node):
+        start = time.time()
+        success = False
+        details = ""
+        try:
+            self._get_run_mode(node.key[0]).run(node.task)
+            success = True
+        except Exception as err:
+            logger.exception("{} failed".format(node.key))
+            details = repr(err)
+        return node, self._outcome(node, success, details,
+                                   time.time() - start)
+
+    def _get_run_mode(self, task_name):
+        if task_name not in self._run_modes:
+            self._run_modes[task_name] = task_factory.get_run_mode(
+                task_name, self.mode_name)
+        return self._run_modes[task_name]
+
+    @staticmethod
+    def _push(heap, node):
+        # highest priority first, then earliest timeslot
+        heapq.heappush(heap, (-node.priority, node.key[1], node.key[0], node))
+
+    @staticmethod
+    def _outcome(node, success, details, seconds):
+        return TaskOutcome(node.key[0], node.key[1], success, details, seconds)
+
+    @staticmethod
+    def _resource_key(task_resource):
+        resource = task_resource.resource
+        return resource.urn, resource.timeslot_string
+
+    @staticmethod
+    def _get_task_settings(name):
+        try:
+            return [i for i in settings.tasks if i["name"] == name][0]
+        except IndexError:
+            raise errors.TaskNotDefinedError(
+                "Task {!r} is not defined in the settings".format(name))
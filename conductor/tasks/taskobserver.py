@@ -1,11 +1,129 @@
 """
 Observers for running tasks
+
+Tasks publish their progress as events on an event bus. The bus delivers
+events to the observers from a background thread, coalescing the events of
+each task and limiting the rate of deliveries, so that updating a task's
+progress never waits for slow observers.
 """
 
+import os
+import json
+import time
+import atexit
 import logging
+import threading
+from collections import namedtuple, OrderedDict
+
+from ..settings import settings
 
 logger = logging.getLogger(__name__)
 
+MAX_RATE = 10  # delivery rounds per second
+
+TaskEvent = namedtuple("TaskEvent", ["task_name", "timeslot", "run_progress",
+                                     "run_state", "run_details", "created"])
+
+
+class EventBus(object):
+    """
+    Deliver task events to observers asynchronously.
+
+    Only the latest pending event of each task is delivered. Observers are
+    called with the event as their single argument.
+
+    :arg max_rate: Maximum number of delivery rounds per second. It
+        defaults to the `max_rate` of the `events` settings or, without
+        one, to MAX_RATE. Zero means unlimited
+    """
+
+    def __init__(self, max_rate=None):
+        self._max_rate = max_rate
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._delivery_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dispatcher = None
+        self._pid = os.getpid()
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}(max_rate={1.max_rate!r})".format(
+            __name__, self)
+
+    @property
+    def max_rate(self):
+        if self._max_rate is not None:
+            return self._max_rate
+        return settings.events.get("max_rate", MAX_RATE)
+
+    def publish(self, key, observers, event):
+        """
+        Queue an event for delivery.
+
+        :arg key: Identifies the source of the event. A pending event with
+            the same key is replaced by the new one
+        :arg observers: The observers that receive the event
+        :arg event: The event
+        :type event: TaskEvent
+        """
+
+        if not any(observers):
+            return
+        self._check_process()
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = (list(observers), event)
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_loop, name="task-event-bus")
+                self._dispatcher.daemon = True
+                self._dispatcher.start()
+        self._wakeup.set()
+
+    def flush(self):
+        """
+        Deliver all of the pending events on the calling thread.
+        """
+
+        self._deliver()
+
+    def _check_process(self):
+        # forked processes need their own dispatcher thread
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._delivery_lock = threading.Lock()
+            self._wakeup = threading.Event()
+            self._pending = OrderedDict()
+            self._dispatcher = None
+
+    def _dispatch_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._deliver()
+            if self.max_rate:
+                time.sleep(1.0 / self.max_rate)
+
+    def _deliver(self):
+        with self._delivery_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = OrderedDict()
+            for observers, event in pending.values():
+                for observer in observers:
+                    try:
+                        observer(event)
+                    except Exception:
+                        logger.exception("Observer {!r} failed".format(
+                            observer))
+
+
+event_bus = EventBus()
+# events that are still pending when the interpreter exits are delivered
+atexit.register(event_bus.flush)
+
+
 class ConsoleObserver(object):
 
     def __init__(self, processing_task):
@@ -14,17 +132,35 @@ class ConsoleObserver(object):
         self.state = ""
         self.details = ""
 
-    def __call__(self):
+    def __call__(self, event):
         msg = ""
-        if self.processing_task.run_progress != self.progress:
-            self.progress = self.processing_task.run_progress
+        if event.run_progress != self.progress:
+            self.progress = event.run_progress
             msg += " run_progress: {0.run_progress:03d}%"
-        if self.processing_task.run_state != self.state:
-            self.state = self.processing_task.run_state
+        if event.run_state != self.state:
+            self.state = event.run_state
             msg += " run_state: {0.run_state}"
-        if self.processing_task.run_details != self.details:
-            self.details = self.processing_task.run_details
+        if event.run_details != self.details:
+            self.details = event.run_details
             msg += " run_details: {0.run_details}"
         if msg != "":
-            msg = ("{0.name}" + msg).format(self.processing_task)
+            msg = ("{0.task_name}" + msg).format(event)
             print(msg)
+
+
+class JsonLinesObserver(object):
+    """
+    Write each event as a compact JSON object in its own line.
+
+    :arg stream: A file-like object opened for writing
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __call__(self, event):
+        record = event._asdict()
+        if record["timeslot"] is not None:
+            record["timeslot"] = record["timeslot"].strftime("%Y%m%d%H%M")
+        self.stream.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.stream.flush()
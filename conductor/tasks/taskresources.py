@@ -61,15 +61,19 @@ class TaskResourceFactory(object):
         multiple_parameters = multiple_parameters or []
         base_timeslot = tsd.TimeslotDisplacement.offset_timeslot(
             base_resource.timeslot, **displace_timeslot)
-        slots = []
         if multiple_timeslots is not None:
-            for i in xrange(multiple_timeslots.get("number_of_timeslots", 1)):
-                v = multiple_timeslots.get("frequency", 1) * i
-                param = {multiple_timeslots.get("frequency_unit", "hour"): v}
-                slots.append(tsd.TimeslotDisplacement.offset_timeslot(
-                    base_timeslot, **param))
+            unit = multiple_timeslots.get("frequency_unit", "hour")
+            frequency = {
+                "frequency_{}s".format(unit): multiple_timeslots.get(
+                    "frequency", 1)
+            }
+            slots = tsd.TimeslotSchedule(
+                base_timeslot,
+                count=multiple_timeslots.get("number_of_timeslots", 1),
+                **frequency
+            )
         else:
-            slots.append(base_timeslot)
+            slots = [base_timeslot]
         new_resources = []
         for s in slots:
             if len(multiple_parameters) > 0:
@@ -95,53 +99,156 @@ class TaskResourceFactory(object):
 task_resource_factory = TaskResourceFactory()
 
 
+TEMPORAL_CONDITIONS = ("year", "month", "day", "hour", "minute", "dekade")
+
+
+def compile_conditions(conditions):
+    """
+    Compile a mapping of temporal conditions into a hashable form.
+
+    :param conditions: A mapping like the `except_when` and `optional_when`
+        parameters of TaskResourceFactory.get_task_resources
+    :type conditions: dict
+    :return: A tuple of (temporal part, frozenset of values) pairs. Parts
+        without any values are left out
+    :rtype: tuple
+    """
+
+    compiled = []
+    for part in TEMPORAL_CONDITIONS:
+        values = (conditions or {}).get(part, [])
+        if len(values) > 0:
+            compiled.append((part, frozenset(values)))
+    return tuple(compiled)
+
+
+def conditions_match(compiled, timeslot):
+    """
+    Return True if the timeslot matches any of the compiled conditions.
+    """
+
+    result = False
+    if timeslot is not None:
+        for part, values in compiled:
+            if part == "dekade":
+                value = tsd.dekade_of_day(timeslot.day)
+            else:
+                value = getattr(timeslot, part)
+            if value in values:
+                result = True
+                break
+    return result
+
+
+def evaluate_conditions(compiled, timeslots):
+    """
+    Evaluate the compiled conditions for many timeslots at once.
+
+    The evaluation is vectorized with NumPy, when it is available.
+
+    :param compiled: Conditions, as returned by `compile_conditions`
+    :param timeslots: A sequence of datetime instances
+    :return: A NumPy boolean array, or a list of booleans if NumPy is not
+        available, that is True where the timeslot matches any condition
+    """
+
+    np = tsd.np
+    if np is not None and (isinstance(timeslots, np.ndarray) or
+                           None not in timeslots):
+        result = np.zeros(len(timeslots), dtype=bool)
+        if len(compiled) > 0 and len(timeslots) > 0:
+            parts = tsd.split_datetime64(tsd.to_datetime64(timeslots))
+            for part, values in compiled:
+                result |= np.in1d(parts[part], list(values))
+    else:
+        result = [conditions_match(compiled, t) for t in timeslots]
+    return result
+
+
 class TaskResource(object):
 
     resource = None
-    optional_when = dict()
-    except_when = dict()
+    _optional_when = dict()
+    _except_when = dict()
+    _optional_conditions = ()
+    _except_conditions = ()
+
+    @property
+    def optional_when(self):
+        return self._optional_when
+
+    @optional_when.setter
+    def optional_when(self, conditions):
+        self._optional_when = dict((p, []) for p in TEMPORAL_CONDITIONS)
+        self._optional_when.update(conditions or {})
+        self._optional_conditions = compile_conditions(self._optional_when)
+
+    @property
+    def except_when(self):
+        return self._except_when
+
+    @except_when.setter
+    def except_when(self, conditions):
+        self._except_when = dict((p, []) for p in TEMPORAL_CONDITIONS)
+        self._except_when.update(conditions or {})
+        self._except_conditions = compile_conditions(self._except_when)
+
+    @property
+    def conditions_key(self):
+        """
+        A hashable key that is shared by TaskResources with equal conditions
+        """
+
+        return self._except_conditions, self._optional_conditions
 
     @property
     def active(self):
-        result = True
-        if self.resource.timeslot is not None:
-            f = self.resource
-            y = f.timeslot.year in self.except_when["year"]
-            m = f.timeslot.month in self.except_when["month"]
-            d = f.timeslot.day in self.except_when["day"]
-            H = f.timeslot.hour in self.except_when["hour"]
-            M = f.timeslot.minute in self.except_when["minute"]
-            D = f.dekade in self.except_when["dekade"]
-            if any((y, m, d, H, M, D)):
-                result = False
-        return result
+        return not conditions_match(self._except_conditions,
+                                    self.resource.timeslot)
 
     @property
     def optional(self):
-        result = False
-        if self.resource.timeslot is not None:
-            f = self.resource
-            y = f.timeslot.year in self.optional_when["year"]
-            m = f.timeslot.month in self.optional_when["month"]
-            d = f.timeslot.day in self.optional_when["day"]
-            H = f.timeslot.hour in self.optional_when["hour"]
-            M = f.timeslot.minute in self.optional_when["minute"]
-            D = f.dekade in self.optional_when["dekade"]
-            if any((y, m, d, H, M, D)):
-                result = True
-        return result
+        return conditions_match(self._optional_conditions,
+                                self.resource.timeslot)
 
     def __init__(self, resource, optional_when=None,
                  except_when=None, can_get_representation=True):
         self.resource = resource
-        self.optional_when = dict(year=[], month=[], day=[], hour=[],
-                                  minute=[], dekade=[])
-        self.optional_when.update(optional_when or {})
-        self.except_when = dict(year=[], month=[], day=[], hour=[],
-                                minute=[], dekade=[])
-        self.except_when.update(except_when or {})
+        self.optional_when = optional_when
+        self.except_when = except_when
         self.can_get_representation = can_get_representation
 
     def __repr__(self):
         return "{0}.{1.__class__.__name__}({1.resource!r})".format(
             __name__, self)
+
+    def fetch(self, destination_directory, decompress=False):
+        """
+        Get a representation of the resource into the input directory.
+
+        :param decompress: Whether to decompress the representation while it
+            is being fetched
+        :return: The path to the fetched representation or None, if the
+            resource could not be found
+        """
+
+        return self.resource.get_representation(destination_directory,
+                                                decompress=decompress)
+
+    def evaluate(self, timeslots):
+        """
+        Compute the active and optional flags for many timeslots at once.
+
+        :param timeslots: A sequence of datetime instances
+        :return: A tuple with the active flags and the optional flags. Each
+            is a NumPy boolean array, or a list of booleans if NumPy is not
+            available
+        """
+
+        excepted = evaluate_conditions(self._except_conditions, timeslots)
+        optional = evaluate_conditions(self._optional_conditions, timeslots)
+        if tsd.np is not None and isinstance(excepted, tsd.np.ndarray):
+            active = ~excepted
+        else:
+            active = [not e for e in excepted]
+        return active, optional
@@ -2,11 +2,25 @@
 Run modes for conductor's ProcessingTasks
 """
 
+import os
+import re
+import copy
+import time
+import errno
 import logging
+import posixpath
+from collections import OrderedDict, namedtuple
+from multiprocessing.pool import ThreadPool
 
 from enum import Enum
 
-import errors
+from .. import ConductorScheme
+from .. import ServerSchemeMethod
+from .. import errors
+from ..resources.resources import resource_factory
+from ..urlparser import Url
+from ..urlhandlers import url_handler_factory, stream_url
+from . import timeslotdisplacement as tsd
 
 logger = logging.getLogger(__name__)
 
@@ -37,21 +51,39 @@ class TaskRunMode(object):
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__, self.execution_code)
 
+    def run(self, task):
+        """
+        Run the task in this mode.
+
+        :type task: conductor.tasks.tasks.Task
+        """
+
+        raise NotImplementedError
+
 
 class CreationMode(TaskRunMode):
 
     def __init__(self, execution_code):
         super(CreationMode, self).__init__(execution_code)
 
+    def run(self, task):
+        return task.run(self)
+
 
-class DeletionMode(TaskRunMode):
+class ScheduledMode(TaskRunMode):
+    """
+    Base class for run modes that operate over a schedule of timeslots.
+
+    The schedule is defined by start offsets, frequency offsets and the
+    number of timeslots, all relative to the task's timeslot.
+    """
 
     def __init__(self, execution_code, start_years=0, start_months=0,
                  start_days=0, start_hours=0, start_minutes=0,
                  start_dekades=0, frequency_years=0, frequency_months=0,
                  frequency_days=0, frequency_hours=0, frequency_minutes=0,
                  frequency_dekades=0, number_of_timeslots=1):
-        super(DeletionMode, self).__init__(execution_code)
+        super(ScheduledMode, self).__init__(execution_code)
         self.start_years = start_years
         self.start_months = start_months
         self.start_days = start_days
@@ -66,6 +98,30 @@ class DeletionMode(TaskRunMode):
         self.frequency_dekades = frequency_dekades
         self.number_of_timeslots = number_of_timeslots
 
+    def get_schedule(self, reference_timeslot):
+        """
+        Return the timeslots that this mode operates on.
+
+        :param reference_timeslot: The timeslot that the start offsets are
+            applied to
+        :type reference_timeslot: datetime.datetime
+        :rtype: conductor.tasks.timeslotdisplacement.TimeslotSchedule
+        """
+
+        return tsd.TimeslotSchedule(
+            reference_timeslot, count=self.number_of_timeslots,
+            start_years=self.start_years, start_months=self.start_months,
+            start_days=self.start_days, start_hours=self.start_hours,
+            start_minutes=self.start_minutes,
+            start_dekades=self.start_dekades,
+            frequency_years=self.frequency_years,
+            frequency_months=self.frequency_months,
+            frequency_days=self.frequency_days,
+            frequency_hours=self.frequency_hours,
+            frequency_minutes=self.frequency_minutes,
+            frequency_dekades=self.frequency_dekades
+        )
+
     def __repr__(self):
         sy = "y:{:+}".format(self.start_years)
         sm = "m:{:+}".format(self.start_months)
@@ -85,6 +141,396 @@ class DeletionMode(TaskRunMode):
             ", ".join((sy, sm, sd, sH, sM, sD, fy, fm, fd, fH, fM, fD))
         )
 
+    def iterate_outputs(self, task):
+        """
+        Yield the task's active outputs for every timeslot of the schedule.
+
+        The task's timeslot is changed while iterating and it is restored
+        afterwards.
+
+        :type task: conductor.tasks.tasks.Task
+        :return: A generator of (timeslot, output) tuples
+        """
+
+        original_timeslot = task.timeslot
+        try:
+            for timeslot in self.get_schedule(original_timeslot):
+                task.timeslot = timeslot
+                for output in task.active_outputs:
+                    yield timeslot, output
+        finally:
+            task.timeslot = original_timeslot
+
+
+class DeletionReport(object):
+    """
+    The outcome of a deletion run, grouped by location.
+
+    Each location is a directory in a server. For each one the report
+    keeps the URLs that matched the task's outputs, the ones that were
+    deleted, the errors and the time that the workers spent listing and
+    deleting.
+    """
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.locations = OrderedDict()
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}(dry_run={1.dry_run!r})".format(
+            __name__, self)
+
+    @property
+    def matched(self):
+        return [u for s in self.locations.values() for u in s["matched"]]
+
+    @property
+    def deleted(self):
+        return [u for s in self.locations.values() for u in s["deleted"]]
+
+    @property
+    def errors(self):
+        result = dict()
+        for stats in self.locations.values():
+            result.update(stats["errors"])
+        return result
+
+    def get_stats(self, location):
+        return self.locations.setdefault(location, {
+            "matched": [],
+            "deleted": [],
+            "errors": dict(),
+            "listing_seconds": 0.0,
+            "deletion_seconds": 0.0,
+        })
+
+    def add_matches(self, location, urls, seconds, error=None):
+        stats = self.get_stats(location)
+        stats["matched"].extend(u.url for u in urls)
+        stats["listing_seconds"] += seconds
+        if error is not None:
+            stats["errors"][location] = error
+
+    def add_deletions(self, location, results, seconds):
+        stats = self.get_stats(location)
+        for url, error in results.items():
+            if error is None:
+                stats["deleted"].append(url)
+            else:
+                stats["errors"][url] = error
+        stats["deletion_seconds"] += seconds
+
+    def throughput(self, location):
+        """
+        Return the number of files deleted per second of worker time.
+        """
+
+        stats = self.get_stats(location)
+        seconds = stats["deletion_seconds"]
+        return len(stats["deleted"]) / seconds if seconds > 0 else 0.0
+
+    def summary(self):
+        lines = []
+        for location, stats in self.locations.items():
+            if self.dry_run:
+                lines.append("{}: {} files would be deleted".format(
+                    location, len(stats["matched"])))
+            else:
+                lines.append(
+                    "{}: {}/{} files deleted, {} errors, "
+                    "{:.1f} files/s".format(
+                        location, len(stats["deleted"]),
+                        len(stats["matched"]), len(stats["errors"]),
+                        self.throughput(location))
+                )
+        return "\n".join(lines)
+
+
+class DeletionMode(ScheduledMode):
+    """
+    Delete the outputs of a task over a schedule of timeslots.
+
+    :arg max_workers: Number of worker threads that list directories and
+        delete files in parallel
+    :arg batch_size: Maximum number of files that a worker deletes with a
+        single connection before picking up the next batch
+    """
+
+    def __init__(self, execution_code, start_years=0, start_months=0,
+                 start_days=0, start_hours=0, start_minutes=0,
+                 start_dekades=0, frequency_years=0, frequency_months=0,
+                 frequency_days=0, frequency_hours=0, frequency_minutes=0,
+                 frequency_dekades=0, number_of_timeslots=1, max_workers=4,
+                 batch_size=50):
+        super(DeletionMode, self).__init__(
+            execution_code, start_years=start_years,
+            start_months=start_months, start_days=start_days,
+            start_hours=start_hours, start_minutes=start_minutes,
+            start_dekades=start_dekades, frequency_years=frequency_years,
+            frequency_months=frequency_months, frequency_days=frequency_days,
+            frequency_hours=frequency_hours,
+            frequency_minutes=frequency_minutes,
+            frequency_dekades=frequency_dekades,
+            number_of_timeslots=number_of_timeslots
+        )
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+
+    def run(self, task, dry_run=False):
+        """
+        Delete the task's outputs for every timeslot of the schedule.
+
+        All of the affected output locations are resolved first and grouped
+        by server and directory. Each directory is then listed only once
+        and the matching files are deleted in batches, spread over a pool
+        of worker threads that use the URL handlers' pooled connections.
+
+        The schedule is relative to the task's current timeslot.
+
+        :param task: The task whose outputs are to be deleted
+        :type task: conductor.tasks.tasks.Task
+        :param dry_run: If True, nothing is deleted and the report only
+            shows what would have been deleted
+        :return: The report with the per-location results
+        :rtype: DeletionReport
+        """
+
+        report = DeletionReport(dry_run=dry_run)
+        directories = self.resolve_directories(task)
+        pool = ThreadPool(self.max_workers)
+        try:
+            batches = []
+            for location, urls, seconds, error in pool.map(
+                    self._match_directory, directories.items()):
+                report.add_matches(location, urls, seconds, error=error)
+                for i in xrange(0, len(urls), self.batch_size):
+                    batches.append((location, urls[i:i + self.batch_size]))
+            if not dry_run:
+                for location, results, seconds in pool.imap_unordered(
+                        self._delete_batch, batches):
+                    report.add_deletions(location, results, seconds)
+        finally:
+            pool.close()
+            pool.join()
+        logger.info("Deletion run finished:\n{}".format(report.summary()))
+        return report
+
+    def resolve_directories(self, task):
+        """
+        Find every directory that may hold an output of the task.
+
+        :return: A mapping with location strings as keys. Each value holds
+            the URL of the directory and the exact names and the patterns
+            of the files to delete in it
+        :rtype: collections.OrderedDict
+        """
+
+        directories = OrderedDict()
+        for timeslot, output in self.iterate_outputs(task):
+            resource = output.resource
+            for url in resource.get_urls():
+                directory, name = posixpath.split(url.path_part)
+                targets = self._get_targets(directories, url, directory)
+                targets["names"].add(name)
+            for url in resource.post_urls():
+                targets = self._get_targets(directories, url, url.path_part)
+                targets["patterns"].add(resource.local_pattern)
+        return directories
+
+    @staticmethod
+    def _get_targets(directories, url, directory):
+        directory = posixpath.normpath(directory)
+        location = "{}://{}{}".format(url.scheme.name.lower(), url.host_name,
+                                      directory)
+        if location not in directories:
+            directories[location] = {
+                "url": url.with_path(directory),
+                "names": set(),
+                "patterns": set(),
+            }
+        return directories[location]
+
+    @staticmethod
+    def _match_directory(item):
+        location, targets = item
+        directory_url = targets["url"]
+        handler = url_handler_factory.get_handler(directory_url.scheme)
+        start = time.time()
+        error = None
+        try:
+            names = handler.list_directory(directory_url)
+        except errors.ResourceNotFoundError:
+            names = []
+        except (NotImplementedError, errors.ConductorError) as err:
+            logger.warning("Cannot list {}: {!r}".format(location, err))
+            names = []
+            error = "Cannot list directory: {!r}".format(err)
+        patterns = [re.compile(r"(?:{})\Z".format(p)) for
+                    p in targets["patterns"]]
+        matched = []
+        for name in sorted(names):
+            if name in targets["names"] or any(p.match(name) for
+                                               p in patterns):
+                matched.append(directory_url.with_path(
+                    posixpath.join(directory_url.path_part, name)))
+        return location, matched, time.time() - start, error
+
+    @staticmethod
+    def _delete_batch(batch):
+        location, urls = batch
+        handler = url_handler_factory.get_handler(urls[0].scheme)
+        start = time.time()
+        try:
+            results = handler.delete_urls(urls)
+        except errors.ConductorError as err:
+            results = dict((u.url, repr(err)) for u in urls)
+        return location, results, time.time() - start
+
+
+MoveResult = namedtuple("MoveResult", ["source", "destinations", "method",
+                                       "error", "seconds"])
+
+
+class MovingMode(ScheduledMode):
+    """
+    Move the outputs of a task to other locations over a schedule.
+
+    When the source and a destination are both in the local filesystem the
+    file is moved with an atomic `os.rename`. Otherwise it is streamed
+    straight from the source URL handler into the destination URL handler,
+    without staging a copy on the local disk. The source is only removed
+    after every destination has received the file.
+
+    :arg destinations: Location settings that define where the outputs are
+        moved to. They have the same structure as a resource's
+        `post_locations` settings
+    :arg max_workers: Maximum number of files that are moved at the same
+        time
+    :raises: conductor.errors.InvalidSettingsError, when none of the
+        destinations can be resolved
+    """
+
+    def __init__(self, execution_code, destinations=None, max_workers=4,
+                 **schedule):
+        super(MovingMode, self).__init__(execution_code, **schedule)
+        self.destinations = destinations or []
+        self.max_workers = max_workers
+        self.locations = resource_factory.get_locations(
+            self.destinations, ServerSchemeMethod.POST)
+        if not any(self.locations):
+            raise errors.InvalidSettingsError(
+                "MovingMode needs at least one valid destination, got "
+                "{!r}".format(self.destinations))
+
+    def run(self, task):
+        """
+        Move the task's outputs for every timeslot of the schedule.
+
+        :param task: The task whose outputs are to be moved
+        :type task: conductor.tasks.tasks.Task
+        :return: The outcome of each move
+        :rtype: [MoveResult]
+        """
+
+        moves, missing = self.resolve_moves(task)
+        results = [MoveResult(None, [], None, "Could not find {}".format(urn),
+                              0.0) for urn in missing]
+        pool = ThreadPool(self.max_workers)
+        try:
+            results.extend(pool.map(self._move, moves))
+        finally:
+            pool.close()
+            pool.join()
+        return results
+
+    def resolve_moves(self, task):
+        """
+        Find the source and destination URLs of each output to move.
+
+        The sources are the first existing URLs of each output's GET
+        locations. Their existence is checked in batches.
+
+        :return: A tuple with a list of (source, destinations) tuples and a
+            list with the URNs of the outputs that could not be found
+        """
+
+        locations = self.locations
+        candidates = []
+        for timeslot, output in self.iterate_outputs(task):
+            resource = output.resource
+            destinations = []
+            for rl in locations:
+                located = copy.copy(rl)
+                located.parent = resource
+                destinations.extend(_frozen_url(u) for u in
+                                    located.create_urls())
+            sources = [_frozen_url(u) for u in resource.get_urls()]
+            candidates.append((resource.urn, sources, destinations))
+        scheme_urls = dict()
+        for urn, sources, destinations in candidates:
+            for u in sources:
+                scheme_urls.setdefault(u.scheme, []).append(u)
+        found = dict()
+        for scheme, urls in scheme_urls.items():
+            handler = url_handler_factory.get_handler(scheme)
+            found.update(handler.stat_urls(urls))
+        moves = []
+        missing = []
+        for urn, sources, destinations in candidates:
+            existing = [u for u in sources if found.get(u.url) is not None]
+            if any(existing):
+                moves.append((existing[0], destinations))
+            else:
+                missing.append(urn)
+        return moves, missing
+
+    @staticmethod
+    def _move(item):
+        source, destinations = item
+        start = time.time()
+        name = posixpath.basename(source.path_part)
+        source_handler = url_handler_factory.get_handler(source.scheme)
+        rename_to = None
+        if source.scheme == ConductorScheme.FILE:
+            local = [d for d in destinations if
+                     d.scheme == ConductorScheme.FILE]
+            rename_to = local[-1] if any(local) else None
+        method = "stream"
+        posted = []
+        error = None
+        try:
+            for destination in destinations:
+                if destination is not rename_to:
+                    posted.append(stream_url(source, destination, name))
+            moved = False
+            if rename_to is not None:
+                target = os.path.join(rename_to.path_part, name)
+                try:
+                    source_handler.create_local_directory(
+                        rename_to.path_part)
+                    os.rename(source.path_part, target)
+                    posted.append(target)
+                    moved = True
+                    method = "rename"
+                except OSError as err:
+                    if err.errno != errno.EXDEV:
+                        raise
+                    posted.append(stream_url(source, rename_to, name))
+            if not moved:
+                if not any(posted):
+                    raise errors.InvalidSettingsError(
+                        "No destination to move {} to".format(source.url))
+                error = source_handler.delete_urls([source])[source.url]
+        except (errors.ConductorError, OSError, IOError) as err:
+            logger.error("Could not move {}: {!r}".format(source.url, err))
+            error = repr(err)
+        return MoveResult(source.url, posted, method, error,
+                          time.time() - start)
+
+
+def _frozen_url(url):
+    """
+    Return a copy of the URL that no longer depends on its parent resource.
+    """
 
-class MovingMode(TaskRunMode):
-    pass
+    return Url.from_string(url.url)
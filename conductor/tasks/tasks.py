@@ -3,20 +3,64 @@ Processing tasks for conductor.
 """
 
 import os
-import shutil
+import time
+import errno
 import logging
+import posixpath
 from datetime import datetime
-from tempfile import mkdtemp
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
+from .. import ConductorScheme
 from .. import TaskResourceRole
 from .. import errors
+from .. import tracing
 from ..resources.resources import resource_factory
 from ..settings import settings
+from ..urlhandlers import url_handler_factory, stream_url
+from ..urlparser import Url
 from .taskresources import task_resource_factory
 from . import taskobserver
+from . import taskrunmode
+from .workingdirs import working_dir_manager
+from .fingerprints import fingerprint_store, normalize
+from .journal import journal_store
 
 logger = logging.getLogger(__name__)
 
+PublishResult = namedtuple("PublishResult", ["output", "destination", "path",
+                                             "method", "error", "seconds"])
+
+
+def stat_urls(urls):
+    """
+    Stat URLs in batches, one batch per URL scheme.
+
+    URLs whose scheme does not support existence checks are assumed to
+    exist, with an unknown size and modification time.
+
+    :param urls: The URLs to check
+    :type urls: [conductor.urlparser.Url]
+    :return: A mapping with the (size, modification time) of each URL, or
+        None for the URLs that do not exist, indexed by URL string
+    :rtype: dict
+    """
+
+    scheme_urls = dict()
+    for u in urls:
+        scheme_urls.setdefault(u.scheme, []).append(u)
+    found = dict()
+    for scheme, batch in scheme_urls.items():
+        handler = url_handler_factory.get_handler(scheme)
+        try:
+            found.update(handler.stat_urls(batch))
+        except NotImplementedError:
+            logger.debug("Cannot check URLs with scheme {}. Assuming "
+                         "they exist".format(scheme.name))
+            found.update((u.url, (None, None)) for u in batch)
+    return found
+
+
 class TaskFactory(object):
 
     def get_task(self, name, timeslot=None):
@@ -28,7 +72,10 @@ class TaskFactory(object):
         t = Task(name, s["urn"], timeslot,
                  description=s.get("description", u""),
                  remove_working_dir=s.get("remove_working_directory", True),
-                 decompress_inputs=s.get("decompress_inputs", True))
+                 decompress_inputs=s.get("decompress_inputs", True),
+                 fetch_workers=s.get("fetch_workers", 4),
+                 publish_workers=s.get("publish_workers", 4),
+                 skip_up_to_date=s.get("skip_up_to_date", True))
         for inp in s.get("inputs", []):
             resource = resource_factory.get_resource(inp["name"], t.timeslot)
             task_resources = task_resource_factory.get_task_resources(
@@ -42,21 +89,52 @@ class TaskFactory(object):
             for tr in task_resources:
                 t.add_task_resource(tr, TaskResourceRole.INPUT)
         for out in s.get("outputs", []):
-            pass
+            resource = resource_factory.get_resource(out["name"], t.timeslot)
+            task_resources = task_resource_factory.get_task_resources(
+                resource, except_when=out.get("except_when", {}),
+                optional_when=out.get("optional_when", {}),
+                displace_timeslot=out.get("displace_timeslot", {}),
+                multiple_timeslots=out.get("generate_multiple_timeslots", {}),
+                multiple_parameters=out.get("generate_multiple_parameters", [])
+            )
+            for tr in task_resources:
+                t.add_task_resource(tr, TaskResourceRole.OUTPUT)
         return t
 
+    def get_run_mode(self, name, mode_name):
+        """
+        Create the run mode of a task, as configured in the settings.
+
+        :param name: The name of the task
+        :param mode_name: The name of the run mode, as in
+            conductor.tasks.taskrunmode.RUN_MODE
+        :rtype: conductor.tasks.taskrunmode.TaskRunMode
+        """
+
+        try:
+            s = [i for i in settings.tasks if i["name"] == name][0]
+        except IndexError:
+            raise errors.TaskNotDefinedError(
+                "Task {!r} is not defined in the settings".format(name))
+        mode_settings = s.get("run_modes", {}).get(mode_name, {})
+        return taskrunmode.get_run_mode(
+            mode_name, mode_settings.get("execution_code"),
+            **mode_settings.get("parameters", {})
+        )
+
 
 task_factory = TaskFactory()
 
 
 class Task(object):
     description = u""
-    working_dir = None
+    _working_dir = None
     name = u""
     _urn = u""
     _timeslot = None
     _inputs = []
     _outputs = []
+    _partitions = None
     _run_observers = []
     _run_progress = 0
     _run_details = u""
@@ -76,19 +154,19 @@ class Task(object):
 
     @property
     def active_inputs(self):
-        return [r for r in self._inputs if r.active]
+        return self._get_partition(TaskResourceRole.INPUT)["active"]
 
     @property
     def active_outputs(self):
-        return [r for r in self._outputs if r.active]
+        return self._get_partition(TaskResourceRole.OUTPUT)["active"]
 
     @property
     def mandatory_inputs(self):
-        return [r for r in self._inputs if not r.optional]
+        return self._get_partition(TaskResourceRole.INPUT)["mandatory"]
 
     @property
     def mandatory_outputs(self):
-        return [r for r in self._outputs if not r.optional]
+        return self._get_partition(TaskResourceRole.OUTPUT)["mandatory"]
 
     @property
     def timeslot(self):
@@ -101,6 +179,7 @@ class Task(object):
         old_timeslot = self._timeslot
         self._timeslot = timeslot
         self._reconfigure_resources(old_timeslot)
+        self._partitions = None
 
     @property
     def timeslot_string(self):
@@ -137,6 +216,16 @@ class Task(object):
         self._run_details = value
         self.update_observers()
 
+    @property
+    def working_dir(self):
+        """
+        The task's working directory, created on first use.
+        """
+
+        if self._working_dir is None:
+            self._working_dir = working_dir_manager.acquire()
+        return self._working_dir
+
     @property
     def working_dir_inputs(self):
         return os.path.join(self.working_dir, "inputs")
@@ -146,23 +235,47 @@ class Task(object):
         return os.path.join(self.working_dir, "outputs")
 
     def __init__(self, name, urn, timeslot, description="",
-                 remove_working_dir=True, decompress_inputs=True):
+                 remove_working_dir=True, decompress_inputs=True,
+                 fetch_workers=4, publish_workers=4, skip_up_to_date=True):
         self.name = name
         self._urn = urn
         self.timeslot = timeslot
         self.description = description
         self._inputs = []
         self._outputs = []
+        self._partitions = None
         self.remove_working_dir = remove_working_dir
         self.decompress_inputs = decompress_inputs
-        self.working_dir = mkdtemp()
+        self.fetch_workers = fetch_workers
+        self.publish_workers = publish_workers
+        self.skip_up_to_date = skip_up_to_date
+        self.fetch_errors = dict()
+        self.prefetched_inputs = None
+        self.journal = None
+        self._working_dir = None
         self._run_observers = [taskobserver.ConsoleObserver(self)]
         self.run_details = ""
         self.run_progress = 0
         self.run_state = "Not running"
 
+    def add_observer(self, observer):
+        """
+        Register a callable that receives the task's TaskEvent instances.
+        """
+
+        self._run_observers.append(observer)
+
     def update_observers(self):
-        [obs() for obs in self._run_observers]
+        """
+        Publish the current run progress, state and details.
+
+        Observers are notified asynchronously by the event bus.
+        """
+
+        event = taskobserver.TaskEvent(self.name, self.timeslot,
+                                       self._run_progress, self._run_state,
+                                       self._run_details, time.time())
+        taskobserver.event_bus.publish(id(self), self._run_observers, event)
 
     def _reconfigure_resources(self, old_timeslot):
         """
@@ -174,9 +287,53 @@ class Task(object):
         """
 
         logger.info("Reconfiguring input and output timeslots...")
-        for resource in self._inputs + self._outputs:
-            delta = resource.file_resource.timeslot - old_timeslot
-            resource.file_resource.timeslot = self.timeslot + delta
+        if old_timeslot is not None:
+            for task_resource in self._inputs + self._outputs:
+                delta = (task_resource.resource.timeslot.replace(tzinfo=None) -
+                         old_timeslot.replace(tzinfo=None))
+                task_resource.resource.timeslot = self.timeslot + delta
+
+    def _get_partition(self, role):
+        """
+        Return the active and mandatory task resources for the input role.
+
+        The partitions are computed once, with a batch evaluation of the
+        task resources that share the same conditions, and are then
+        reused until the task's timeslot or its resources change.
+
+        :param role: The role of the task resources
+        :type role: conductor.TaskResourceRole
+        :return: A mapping with the `active` and `mandatory` lists and
+            the `mandatory_set` frozenset
+        :rtype: dict
+        """
+
+        if self._partitions is None:
+            self._partitions = dict()
+        if role not in self._partitions:
+            task_resources = {
+                TaskResourceRole.INPUT: self._inputs,
+                TaskResourceRole.OUTPUT: self._outputs,
+            }[role]
+            groups = dict()
+            for tr in task_resources:
+                groups.setdefault(tr.conditions_key, []).append(tr)
+            active = set()
+            mandatory = set()
+            for members in groups.values():
+                flags = members[0].evaluate(
+                    [tr.resource.timeslot for tr in members])
+                for tr, is_active, is_optional in zip(members, *flags):
+                    if is_active:
+                        active.add(tr)
+                    if not is_optional:
+                        mandatory.add(tr)
+            self._partitions[role] = {
+                "active": [tr for tr in task_resources if tr in active],
+                "mandatory": [tr for tr in task_resources if tr in mandatory],
+                "mandatory_set": frozenset(mandatory),
+            }
+        return self._partitions[role]
 
     def add_task_resource(self, task_resource, role):
         group = {
@@ -184,45 +341,373 @@ class Task(object):
             TaskResourceRole.OUTPUT: self._outputs,
         }[role]
         group.append(task_resource)
+        self._partitions = None
+
+    def fetch_inputs(self, cache=None):
+        """
+        Fetch the active inputs concurrently.
+
+        Up to `fetch_workers` inputs are fetched at the same time. Each
+        server's `max_connections` setting further limits the number of
+        simultaneous transfers from that server. When `decompress_inputs`
+        is set, compressed inputs are decompressed while they are being
+        downloaded. The task's run progress and details are updated as each
+        input is fetched.
+
+        Errors, including those of the local filesystem and of the network,
+        are kept per input in the `fetch_errors` mapping and the
+        corresponding inputs are reported as not fetched.
+
+        :param cache: An optional cache of inputs that are shared with other
+            runs. Inputs found in the cache are not fetched again and newly
+            fetched inputs are stored in it
+        :type cache: conductor.tasks.pipeline.InputCache
+        :return: A mapping with the path of each fetched input, or None for
+            the inputs that could not be fetched
+        :rtype: dict
+        """
 
-    def fetch_inputs(self):
+        to_fetch = self.active_inputs
         fetched = dict()
-        for inp in self.active_inputs:
-            logger.info("fetching '{}'...".format(inp.resource.name))
-            fetched_path = inp.fetch(self.working_dir_inputs)
-            if fetched_path is not None and self.decompress_inputs:
-                fetched_path, = inp.file_resource.decompress(fetched_path)
-            fetched[inp] = fetched_path
+        self.fetch_errors = dict()
+        if not any(to_fetch):
+            return fetched
+        start = time.time()
+        try:
+            os.makedirs(self.working_dir_inputs)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        pool = ThreadPool(max(1, min(self.fetch_workers, len(to_fetch))))
+        try:
+            results = pool.imap_unordered(
+                lambda inp: self._fetch_input(inp, cache), to_fetch)
+            for index, (inp, path, error) in enumerate(results, start=1):
+                fetched[inp] = path
+                if error is not None:
+                    self.fetch_errors[inp] = error
+                elapsed = time.time() - start
+                self.run_details = "fetched {}/{} inputs ({:.2f}/s)".format(
+                    index, len(to_fetch), index / elapsed if elapsed else 0)
+                self.run_progress = index * 100 // len(to_fetch)
+        finally:
+            pool.close()
+            pool.join()
         return fetched
 
-    def clean_temporary_resources(self):
-        parent = os.path.dirname(self.working_dir)
-        shutil.rmtree(self.working_dir)
+    def _fetch_input(self, inp, cache=None):
+        path = None
+        error = None
+        key = cache.get_key(inp.resource) if cache is not None else None
+        if key is not None:
+            path = cache.get(key)
+            if path is not None:
+                logger.info("reusing '{}'".format(inp.resource.name))
+                return inp, path, error
+        journal_key = inp.resource.urn, inp.resource.timeslot_string
+        if key is None and self.journal is not None:
+            path = self.journal.fetched_path(journal_key)
+            if path is not None:
+                logger.info("'{}' was fetched by a previous "
+                            "attempt".format(inp.resource.name))
+                return inp, path, error
+        logger.info("fetching '{}'...".format(inp.resource.name))
+        directory = (cache.get_directory(key) if key is not None else
+                     self.working_dir_inputs)
         try:
-            os.removedirs(parent)
-        except OSError:
-            pass
+            with tracing.span("fetch", "input", input=inp.resource.name):
+                path = inp.fetch(directory,
+                                 decompress=self.decompress_inputs)
+            if key is not None and path is not None:
+                cache.put(key, path)
+            elif self.journal is not None and path is not None:
+                self.journal.record_fetch(journal_key, path)
+        except (errors.ConductorError, EnvironmentError) as err:
+            logger.error("Could not fetch '{}': {}".format(inp.resource.name,
+                                                           err))
+            error = err
+        return inp, path, error
+
+    def clean_temporary_resources(self):
+        """
+        Release the working directory, if it was ever used.
+
+        The directory is emptied in the background and reused by other tasks.
+        The working directories of journaled runs that did not finish are
+        kept, so that the next attempt can resume them. Tasks whose
+        `remove_working_dir` is unset keep their working directory as well.
+        """
+
+        if self.journal is not None:
+            self.journal = None
+        elif self._working_dir is not None and not self.remove_working_dir:
+            logger.info("Keeping the working directory {}".format(
+                self._working_dir))
+        elif self._working_dir is not None:
+            working_dir_manager.release(self._working_dir)
+        self._working_dir = None
+
+    def _open_journal(self):
+        """
+        Resume the journal of the task's run for the current timeslot.
+
+        The journal's working directory replaces the task's working directory.
+        """
+
+        if self.journal is None and self._working_dir is not None:
+            working_dir_manager.release(self._working_dir)
+        self.journal = journal_store.open(self.name, self.timeslot)
+        self._working_dir = self.journal.working_dir
+        if self.journal.attempts > 0:
+            logger.info("Resuming {} after {} attempts".format(
+                self, self.journal.attempts))
+        self.journal.record_start()
 
-    def run(self, mode):
+    def preflight(self):
+        """
+        Check that every mandatory input exists before fetching anything.
+
+        The URLs of all the active mandatory inputs are checked in batches,
+        one batch per URL scheme. The handlers group each batch by server
+        and directory, so each remote directory is listed only once. URLs
+        whose scheme does not support existence checks are assumed to exist.
+
+        :return: A tuple with a boolean indicating whether all of the
+            mandatory inputs are available and a string with details on
+            the missing ones
+        """
+
+        mandatory = self._get_partition(TaskResourceRole.INPUT)[
+            "mandatory_set"]
+        to_check = [inp for inp in self.active_inputs if inp in mandatory]
+        input_urls = dict((inp, inp.resource.get_urls()) for inp in to_check)
+        found = stat_urls([u for urls in input_urls.values() for u in urls])
+        details = []
+        for inp in to_check:
+            if all(found.get(u.url) is None for u in input_urls[inp]):
+                details.append("Mandatory input '{}' is not "
+                               "available".format(inp.resource.name))
+        return len(details) == 0, ", ".join(details)
+
+    def input_fingerprint(self):
+        """
+        Identify the active inputs by where they are found and their state.
+
+        :return: A list with the URN, URL, size and modification time of
+            each active input. The URL, size and modification time are None
+            for the inputs that are not found. URLs do not include passwords
+        """
+
+        input_urls = [(inp, inp.resource.get_urls())
+                      for inp in self.active_inputs]
+        found = stat_urls([u for inp, urls in input_urls for u in urls])
+        result = []
+        for inp, urls in input_urls:
+            located = [[u.without_password().url] + list(found[u.url])
+                       for u in urls if found.get(u.url) is not None]
+            result.append([inp.resource.urn] +
+                          (located[0] if any(located) else [None] * 3))
+        return result
+
+    def republish_if_up_to_date(self, input_fingerprint):
+        """
+        Check whether the stored outputs are still valid for the inputs.
+
+        The outputs are up to date when the stored fingerprint has the same
+        inputs and at least one published copy of every active output is
+        unchanged. Copies that are missing or were modified are published
+        again from an unchanged one. Inputs and copies whose size and
+        modification time cannot be known are never considered unchanged.
+
+        :param input_fingerprint: The result of `input_fingerprint`
+        :return: Whether the outputs are up to date
+        """
+
+        if any(e[1] is not None and e[2:] == [None, None]
+               for e in input_fingerprint):
+            return False
+        stored = fingerprint_store.load(self.name, self.timeslot)
+        if stored is None or stored["inputs"] != normalize(input_fingerprint):
+            return False
+        published = [stored["outputs"].get(o.resource.urn) or [] for o in
+                     self.active_outputs]
+        if not all(published):
+            return False
+        urls = self._restore_passwords(
+            [entry[0] for entries in published for entry in entries])
+        found = stat_urls(urls.values())
+        to_republish = []
+        for entries in published:
+            intact = [e for e in entries if e[1:] != [None, None] and
+                      normalize(found.get(urls[e[0]].url)) == e[1:]]
+            if not any(intact):
+                return False
+            to_republish.extend((intact[0][0], e[0]) for e in entries
+                                if e not in intact)
+        for source, target in to_republish:
+            logger.info("Republishing {} to {}".format(source, target))
+            target_url = urls[target]
+            stream_url(urls[source],
+                       target_url.with_path(
+                           posixpath.dirname(target_url.path_part)),
+                       posixpath.basename(target_url.path_part))
+        if any(to_republish):
+            stored["outputs"] = self._published_fingerprint(
+                [(o.resource.urn, urls[e[0]]) for o, entries in
+                 zip(self.active_outputs, published) for e in entries])
+            fingerprint_store.save(self.name, self.timeslot, stored)
+        return True
+
+    def _restore_passwords(self, url_strings):
+        """
+        Give stored URLs of published outputs their passwords back.
+
+        The passwords are taken from the post locations of the active
+        outputs with the same scheme, host, port and user.
+
+        :param url_strings: URL strings without passwords
+        :return: A mapping with the URL of each input string
+        :rtype: dict
+        """
+
+        passwords = dict(
+            (u.without_password().with_path("").url, u.user_password)
+            for o in self.active_outputs for u in o.resource.post_urls())
+        result = dict()
+        for u in url_strings:
+            url = Url.from_string(u)
+            url.user_password = passwords.get(url.with_path("").url)
+            result[u] = url
+        return result
+
+    @staticmethod
+    def _published_fingerprint(published):
+        """
+        Identify published outputs by their URL, size and modification time.
+
+        :param published: A list of (output URN, URL) tuples
+        :return: A mapping with the identities of the copies of each output
+            that were found, indexed by the output's URN. URLs do not
+            include passwords
+        """
+
+        found = stat_urls([u for urn, u in published])
+        result = dict()
+        for urn, u in published:
+            if found.get(u.url) is not None:
+                result.setdefault(urn, []).append(
+                    [u.without_password().url] + list(found[u.url]))
+        return result
+
+    def run(self, mode, preflight=True, force=False):
         """
         Execute the sequence of operations defined by the active_mode.
 
+        When fingerprints are enabled in the settings and the task's
+        `skip_up_to_date` is set, runs whose inputs did not change since
+        the outputs were produced are skipped and only missing copies of the
+        outputs are published again.
+
+        Inputs that were already fetched, for example by a pipelined runner,
+        are taken from `prefetched_inputs` instead of being fetched again.
+
+        When journals are enabled in the settings, the completed fetches,
+        the execution and the completed posts are journaled in a working
+        directory that is kept until the run succeeds. A new attempt after a
+        failure resumes at the first incomplete step.
+
+        :param mode:
+        :param preflight: Whether to check that all of the mandatory inputs
+            exist before fetching any of them
+        :param force: Whether to run even if the outputs are up to date
         :return:
+        :raises: conductor.errors.InputsNotAvailableError,
+            conductor.errors.OutputsNotPublishedError
         """
+        try:
+            return self._run(mode, preflight, force)
+        finally:
+            # deliver the final state of the run before returning
+            taskobserver.event_bus.flush()
+
+    def _run(self, mode, preflight, force):
         result = True
-        fetched = self.fetch_inputs()
-        able, able_details = self.able_to_execute(fetched)
-        if able:
-            execution_result = self.execute(fetched)
-            generated_outputs, generated_details = self.check_for_outputs()
+        span = tracing.span
+        use_fingerprints = self.skip_up_to_date and fingerprint_store.enabled
+        with span("run", "task", task=self.name,
+                  timeslot=self.timeslot_string):
+            if use_fingerprints:
+                with span("up_to_date", "task"):
+                    inputs = self.input_fingerprint()
+                    if not force and self.republish_if_up_to_date(inputs):
+                        logger.info("{} is up to date".format(self))
+                        self.run_state = "Up to date"
+                        return result
+            if journal_store.enabled and self.prefetched_inputs is None:
+                self._open_journal()
+            if self.prefetched_inputs is not None:
+                fetched = self.prefetched_inputs
+            else:
+                if preflight:
+                    with span("preflight", "task"):
+                        available, available_details = self.preflight()
+                    if not available:
+                        raise errors.InputsNotAvailableError(
+                            available_details)
+                with span("fetch_inputs", "task"):
+                    fetched = self.fetch_inputs()
+            with span("able_to_execute", "task"):
+                able, able_details = self.able_to_execute(fetched)
+            if not able:
+                raise errors.ExecutionCannotStartError(able_details)
+            resumed = False
+            if self.journal is not None:
+                # outputs are only reused if they come from the same inputs
+                identities = self.journal.input_identities(dict(
+                    ((i.resource.urn, i.resource.timeslot_string), p)
+                    for i, p in fetched.items()))
+                resumed = (self.journal.executed_with(identities) and
+                           all(p is not None for o, p in
+                               self.find_temporary_outputs()))
+            if resumed:
+                logger.info("Outputs were generated by a previous attempt")
+                execution_result = True
+            else:
+                with span("execute", "task"):
+                    execution_result = self.execute(fetched)
+                if self.journal is not None:
+                    self.journal.record_execution(identities)
+            with span("check_for_outputs", "task"):
+                generated_outputs, generated_details = \
+                    self.check_for_outputs()
             if not generated_outputs:
                 raise errors.InvalidExecutionError(
                     "The task executed correctly but not all of the expected "
                     "outputs were found: {}".format(generated_details)
                 )
-            self.move_outputs(execution_result)
-        else:
-            raise errors.ExecutionCannotStartError(able_details)
+            with span("move_outputs", "task"):
+                published = self.move_outputs(execution_result)
+        mandatory = self._get_partition(TaskResourceRole.OUTPUT)[
+            "mandatory_set"]
+        failed = ["{} -> {}: {}".format(r.output.resource.name,
+                                        r.destination, r.error)
+                  for r in published if r.error is not None and
+                  r.output in mandatory]
+        if any(failed):
+            raise errors.OutputsNotPublishedError(", ".join(failed))
+        if self.journal is not None:
+            self.journal.finish()
+            self.journal = None
+            self._working_dir = None
+        if use_fingerprints:
+            fingerprint_store.save(self.name, self.timeslot, {
+                "inputs": inputs,
+                "outputs": self._published_fingerprint([
+                    (r.output.resource.urn,
+                     Url.from_string(r.destination).with_path(r.path))
+                    for r in published if r.error is None
+                ]),
+            })
         return result
 
     def able_to_execute(self, fetched_inputs):
@@ -235,14 +720,19 @@ class Task(object):
 
         all_ok = []
         details = []
+        mandatory = self._get_partition(TaskResourceRole.INPUT)[
+            "mandatory_set"]
         for inp, path in fetched_inputs.iteritems():
-            if inp in self.mandatory_inputs:
+            if inp in mandatory:
                 if path is not None:
                     this_ok = True
                 else:
                     this_ok = False
-                    details.append("Mandatory input '{}' is not "
-                                   "available".format(inp.file_resource.name))
+                    msg = "Mandatory input '{}' is not available".format(
+                        inp.resource.name)
+                    if inp in self.fetch_errors:
+                        msg += ": {}".format(self.fetch_errors[inp])
+                    details.append(msg)
             else:
                 this_ok = True
             all_ok.append(this_ok)
@@ -275,8 +765,113 @@ class Task(object):
         """
         return True
 
+    def find_temporary_outputs(self):
+        """
+        Find the outputs that have been generated in the working directory.
+
+        :return: A list of (output, path) tuples. The path is None for the
+            outputs that were not found
+        """
+
+        return [(outp, outp.resource.find_local(self.working_dir_outputs))
+                for outp in self.active_outputs]
+
     def move_outputs(self, execution_result):
-        raise NotImplementedError
+        """
+        Publish the generated outputs to all of their post locations.
+
+        Outputs are copied to their destinations on a pool of up to
+        `publish_workers` threads. Once all the copies of an output are
+        done, the output is renamed into its last local destination, which
+        avoids a copy when the working directory and the destination are
+        in the same filesystem. Otherwise it is copied there too.
+
+        :param execution_result: The result of the `execute` method
+        :return: A result for each output and destination
+        :rtype: [PublishResult]
+        """
+
+        results = []
+        copies = []
+        renames = []
+        for outp, path in self.find_temporary_outputs():
+            if path is None:
+                results.append(PublishResult(outp, None, None, None,
+                                             "Output was not generated", 0.0))
+                continue
+            urls = outp.resource.post_urls()
+            if self.journal is not None:
+                urls = self._skip_published(outp, urls, results)
+            local = [u for u in urls if u.scheme == ConductorScheme.FILE]
+            # journaled runs keep their outputs until they finish
+            rename_to = (local[-1] if any(local) and self.journal is None
+                         else None)
+            for url in urls:
+                if url is rename_to:
+                    renames.append((outp, path, url, True))
+                else:
+                    copies.append((outp, path, url, False))
+        if any(copies) or any(renames):
+            pool = ThreadPool(max(1, min(self.publish_workers,
+                                         max(len(copies), len(renames)))))
+            try:
+                results.extend(pool.map(self._publish_output, copies))
+                results.extend(pool.map(self._publish_output, renames))
+            finally:
+                pool.close()
+                pool.join()
+        return results
+
+    def _skip_published(self, outp, urls, results):
+        """
+        Return the URLs that were not published by previous attempts.
+
+        Results are added for the URLs that were already published.
+        """
+
+        pending = []
+        for url in urls:
+            path = self.journal.published_path(
+                outp.resource.urn, url.without_password().url)
+            if path is not None:
+                results.append(PublishResult(outp, url.url, path, "resumed",
+                                             None, 0.0))
+            else:
+                pending.append(url)
+        return pending
+
+    def _publish_output(self, item):
+        outp, path, url, rename = item
+        start = time.time()
+        handler = url_handler_factory.get_handler(url.scheme)
+        method = "copy"
+        published = None
+        error = None
+        with tracing.span("publish", "output", output=outp.resource.name,
+                          destination=url.url):
+            try:
+                if rename:
+                    target = os.path.join(url.path_part,
+                                          os.path.basename(path))
+                    try:
+                        handler.create_local_directory(url.path_part)
+                        os.rename(path, target)
+                        published = target
+                        method = "rename"
+                    except OSError as err:
+                        if err.errno != errno.EXDEV:
+                            raise
+                if published is None:
+                    published = handler.post_to_url(url, path)
+            except (errors.ConductorError, EnvironmentError) as err:
+                logger.error("Could not publish {} to {}: {}".format(
+                    path, url.url, err))
+                error = str(err)
+        if self.journal is not None and error is None:
+            self.journal.record_publish(outp.resource.urn,
+                                        url.without_password().url, published)
+        return PublishResult(outp, url.url, published, method, error,
+                             time.time() - start)
 
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__, self.name)
@@ -4,11 +4,171 @@ Classes for aiding the timeslot displacement strategies used in conductor
 
 from datetime import datetime, timedelta
 from calendar import monthrange
+from fractions import gcd
 import logging
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 logger = logging.getLogger(__name__)
 
 
+def dekade_of_day(day):
+    """
+    Return the dekade (1, 2 or 3) that a day of the month belongs to.
+
+    This works both with plain integers and with NumPy integer arrays.
+    """
+
+    if np is not None and isinstance(day, np.ndarray):
+        result = np.minimum((day - 1) // 10, 2) + 1
+    else:
+        result = min((day - 1) // 10, 2) + 1
+    return result
+
+
+def to_datetime64(timeslots):
+    """
+    Convert a sequence of timeslots into a NumPy datetime64[m] array.
+
+    Timezone aware datetimes keep their wall clock time, just like in the
+    scalar methods of TimeslotDisplacement. Seconds are discarded.
+
+    :param timeslots: A sequence of datetime instances or a NumPy datetime64
+        array
+    :return: A NumPy array with dtype datetime64[m]
+    """
+
+    if isinstance(timeslots, np.ndarray):
+        result = timeslots.astype("datetime64[m]")
+    else:
+        result = np.array([t.replace(tzinfo=None) for t in timeslots],
+                          dtype="datetime64[m]")
+    return result
+
+
+def split_datetime64(timeslots):
+    """
+    Split a NumPy datetime64 array into its temporal parts.
+
+    :param timeslots: A NumPy datetime64 array
+    :return: A mapping with the year, month, day, hour, minute and dekade
+        integer arrays
+    :rtype: dict
+    """
+
+    slots = timeslots.astype("datetime64[m]")
+    years = slots.astype("datetime64[Y]")
+    months = slots.astype("datetime64[M]")
+    days = slots.astype("datetime64[D]")
+    minutes_of_day = (slots - days).astype(int)
+    day = (days - months).astype(int) + 1
+    return {
+        "year": years.astype(int) + 1970,
+        "month": (months - years).astype(int) + 1,
+        "day": day,
+        "hour": minutes_of_day // 60,
+        "minute": minutes_of_day % 60,
+        "dekade": dekade_of_day(day),
+    }
+
+
+class DekadeCalendar(object):
+    """
+    Closed-form arithmetic on dekades.
+
+    Each month is split in three dekades, starting on days 1, 11 and 21.
+    Dekades are numbered with a continuous ordinal, so converting between
+    timeslots and dekades and offsetting by any number of dekades are O(1)
+    operations.
+    """
+
+    @staticmethod
+    def to_ordinal(timeslot):
+        """
+        Return the ordinal of the dekade that contains the input timeslot.
+        """
+
+        return ((timeslot.year * 12 + timeslot.month - 1) * 3 +
+                dekade_of_day(timeslot.day) - 1)
+
+    @staticmethod
+    def from_ordinal(ordinal, hour=0, minute=0):
+        """
+        Return the first timeslot of the dekade with the input ordinal.
+        """
+
+        months, dekade_index = divmod(ordinal, 3)
+        year, month_index = divmod(months, 12)
+        return datetime(year, month_index + 1, 1 + 10 * dekade_index,
+                        hour, minute)
+
+    @classmethod
+    def offset(cls, timeslot, dekades):
+        """
+        Return the start of the dekade that is `dekades` away from timeslot.
+
+        The hour and minute of the input timeslot are preserved.
+        """
+
+        return cls.from_ordinal(cls.to_ordinal(timeslot) + dekades,
+                                timeslot.hour, timeslot.minute)
+
+    @classmethod
+    def range(cls, start, end, step=1):
+        """
+        Yield the start of each dekade between start and end, inclusive.
+
+        :param start: The first timeslot. It is moved back to the start of
+            its dekade
+        :param end: The last timeslot
+        :param step: The number of dekades between each yielded timeslot
+        """
+
+        for ordinal in xrange(cls.to_ordinal(start),
+                              cls.to_ordinal(end) + 1, step):
+            yield cls.from_ordinal(ordinal, start.hour, start.minute)
+
+    @staticmethod
+    def to_ordinals(timeslots):
+        """
+        Vectorized counterpart of `to_ordinal` for NumPy datetime64 arrays.
+        """
+
+        parts = split_datetime64(timeslots)
+        return ((parts["year"] * 12 + parts["month"] - 1) * 3 +
+                parts["dekade"] - 1)
+
+    @staticmethod
+    def from_ordinals(ordinals):
+        """
+        Vectorized counterpart of `from_ordinal`.
+
+        :return: A NumPy array with dtype datetime64[D]
+        """
+
+        months, dekade_index = np.divmod(np.asarray(ordinals), 3)
+        month_start = (months - 1970 * 12).astype("datetime64[M]")
+        return (month_start.astype("datetime64[D]") +
+                (10 * dekade_index).astype("timedelta64[D]"))
+
+    @classmethod
+    def range_array(cls, start, end, step=1):
+        """
+        Vectorized counterpart of `range`.
+
+        :return: A NumPy array with dtype datetime64[m]
+        """
+
+        ordinals = np.arange(cls.to_ordinal(start), cls.to_ordinal(end) + 1,
+                             step)
+        time_of_day = np.timedelta64(start.hour * 60 + start.minute, "m")
+        return cls.from_ordinals(ordinals).astype("datetime64[m]") + \
+            time_of_day
+
+
 class TimeslotDisplacement(object):
 
     base_timeslot = None
@@ -55,42 +215,358 @@ class TimeslotDisplacement(object):
         candidate = datetime(new_year, new_month, new_day, timeslot.hour,
                              timeslot.minute)
         offset_time = (hour * 60 * 60) + minute * 60
-        if dekade != 0:
-            t_day = timeslot.day
-            first_day = 1 if t_day < 11 else (11 if t_day < 21 else 21)
-            timeslot_first_day = datetime(timeslot.year, timeslot.month,
-                                          first_day, timeslot.hour,
-                                          timeslot.minute)
-            end_timeslot = timeslot_first_day
-            forward = dekade / abs(dekade) > 0
-            factor = 1 if forward else -1
-            for d in range(abs(dekade)):
-                if (t_day < 21 and forward) or (t_day > 1 and not forward):
-                    end_timeslot += factor * timedelta(days=10)
-                else:
-                    the_ts = end_timeslot if forward else \
-                        end_timeslot - timedelta(days=1)
-                    n_days = monthrange(the_ts.year, the_ts.month)[1] - 20
-                    end_timeslot += factor * timedelta(days=n_days)
-            day += factor * abs((end_timeslot - timeslot).days)
+        day += cls._dekade_offset_days(timeslot, dekade)
         delta = timedelta(days=day, seconds=offset_time)
         return candidate + delta
 
+    @classmethod
+    def _dekade_offset_days(cls, timeslot, dekade):
+        day = 0
+        if dekade != 0:
+            target = DekadeCalendar.offset(timeslot, dekade)
+            day = (target.date() - timeslot.date()).days
+        return day
+
+    @classmethod
+    def offset_timeslots(cls, timeslots, year=0, month=0, day=0, hour=0,
+                         minute=0, dekade=0):
+        """
+        Apply temporal offsets to a whole array of timeslots at once.
+
+        This is the vectorized counterpart of `offset_timeslot`. It has the
+        same semantics, including the clamping of the day to the end of the
+        month when applying year and month offsets.
+
+        :param timeslots: A sequence of datetime instances or a NumPy
+            datetime64 array
+        :param year: The offset in years. It can be an integer or an
+            integer array that is broadcast against the timeslots. The same
+            goes for the other offsets
+        :return: A NumPy array with dtype datetime64[m]
+        :raises: ImportError, if NumPy is not available
+        """
+
+        if np is None:
+            raise ImportError("NumPy is required for vectorized timeslot "
+                              "displacements")
+        slots = to_datetime64(timeslots)
+        parts = split_datetime64(slots)
+        total_months = ((parts["year"] + year - 1970) * 12 +
+                        parts["month"] - 1 + month)
+        month_start = np.asarray(total_months).astype("datetime64[M]")
+        month_n_days = ((month_start + 1).astype("datetime64[D]") -
+                        month_start.astype("datetime64[D]")).astype(int)
+        new_day = np.minimum(parts["day"], month_n_days)
+        minutes = (parts["hour"] * 60 + parts["minute"] +
+                   (np.asarray(hour) * 60 + minute))
+        days = new_day - 1 + day
+        if np.any(np.asarray(dekade) != 0):
+            targets = DekadeCalendar.from_ordinals(
+                DekadeCalendar.to_ordinals(slots) + dekade)
+            days = days + (targets - slots.astype("datetime64[D]")).astype(int)
+        result = (month_start.astype("datetime64[D]").astype("datetime64[m]") +
+                  np.asarray(days).astype("timedelta64[D]") +
+                  np.asarray(minutes).astype("timedelta64[m]"))
+        return result
+
     def get_timeslots(self, start_years=0, start_months=0, start_days=0,
                       start_hours=0, start_minutes=0, start_dekades=0,
                       frequency_years=0, frequency_months=0, frequency_days=0,
                       frequency_hours=0, frequency_minutes=0,
                       frequency_dekades=0, number_of_timeslots=0):
-        result = []
-        for i in xrange(number_of_timeslots):
-            off_years = start_years + i * frequency_years
-            off_months = start_months + i * frequency_months
-            off_days = start_days + i * frequency_days
-            off_hours = start_hours + i * frequency_hours
-            off_minutes = start_minutes + i * frequency_minutes
-            off_dekades = start_dekades + i * frequency_dekades
-            result.append(self.offset_timeslot(self.reference_timeslot,
-                                               off_years, off_months, off_days,
-                                               off_hours, off_minutes,
-                                               off_dekades))
+        return list(self.get_schedule(
+            start_years, start_months, start_days, start_hours,
+            start_minutes, start_dekades, frequency_years, frequency_months,
+            frequency_days, frequency_hours, frequency_minutes,
+            frequency_dekades, number_of_timeslots
+        ))
+
+    def get_schedule(self, start_years=0, start_months=0, start_days=0,
+                     start_hours=0, start_minutes=0, start_dekades=0,
+                     frequency_years=0, frequency_months=0, frequency_days=0,
+                     frequency_hours=0, frequency_minutes=0,
+                     frequency_dekades=0, number_of_timeslots=0):
+        """
+        Return the same timeslots as `get_timeslots` as a lazy schedule.
+
+        :rtype: TimeslotSchedule
+        """
+
+        return TimeslotSchedule(
+            self.reference_timeslot, count=number_of_timeslots,
+            start_years=start_years, start_months=start_months,
+            start_days=start_days, start_hours=start_hours,
+            start_minutes=start_minutes, start_dekades=start_dekades,
+            frequency_years=frequency_years,
+            frequency_months=frequency_months,
+            frequency_days=frequency_days, frequency_hours=frequency_hours,
+            frequency_minutes=frequency_minutes,
+            frequency_dekades=frequency_dekades
+        )
+
+    def get_timeslots_array(self, start_years=0, start_months=0,
+                            start_days=0, start_hours=0, start_minutes=0,
+                            start_dekades=0, frequency_years=0,
+                            frequency_months=0, frequency_days=0,
+                            frequency_hours=0, frequency_minutes=0,
+                            frequency_dekades=0, number_of_timeslots=0):
+        """
+        Return the same timeslots as `get_timeslots` as a NumPy array.
+
+        :return: A NumPy array with dtype datetime64[m]
+        :raises: ImportError, if NumPy is not available
+        """
+
+        if np is None:
+            raise ImportError("NumPy is required for vectorized timeslot "
+                              "displacements")
+        i = np.arange(number_of_timeslots)
+        return self.offset_timeslots(
+            [self.reference_timeslot],
+            start_years + i * frequency_years,
+            start_months + i * frequency_months,
+            start_days + i * frequency_days,
+            start_hours + i * frequency_hours,
+            start_minutes + i * frequency_minutes,
+            start_dekades + i * frequency_dekades
+        )
+
+
+class TimeslotSchedule(object):
+    """
+    A lazy, regular sequence of timeslots.
+
+    The i-th timeslot of the schedule is the reference timeslot offset by
+    the start offsets plus i times the frequency offsets, with the same
+    semantics as `TimeslotDisplacement.offset_timeslot`. The length of the
+    schedule is given either by a count or by an end timeslot.
+
+    Timeslots are only generated when they are needed. Getting the n-th
+    timeslot and checking whether a timeslot belongs to the schedule are
+    O(1) operations.
+    """
+
+    UNITS = ("years", "months", "days", "hours", "minutes", "dekades")
+    _EPOCH = datetime(1970, 1, 1)
+    _UNIT_MINUTES = {
+        "years": 525960,  # average length, only used for estimates
+        "months": 43830,
+        "days": 1440,
+        "hours": 60,
+        "minutes": 1,
+        "dekades": 14610,
+    }
+
+    reference = None
+    count = 0
+
+    @property
+    def first(self):
+        return self[0] if self.count > 0 else None
+
+    @property
+    def last(self):
+        return self[-1] if self.count > 0 else None
+
+    @property
+    def is_fixed(self):
+        """
+        True if consecutive timeslots are always the same duration apart
+        """
+
+        return all(self.frequency[u] == 0 for u in
+                   ("years", "months", "dekades"))
+
+    def __init__(self, reference, count=None, end=None, start_years=0,
+                 start_months=0, start_days=0, start_hours=0,
+                 start_minutes=0, start_dekades=0, frequency_years=0,
+                 frequency_months=0, frequency_days=0, frequency_hours=0,
+                 frequency_minutes=0, frequency_dekades=0):
+        if count is None and end is None:
+            raise ValueError("Either count or end must be specified")
+        self.reference = reference
+        self.start = dict(zip(self.UNITS, (
+            start_years, start_months, start_days, start_hours,
+            start_minutes, start_dekades)))
+        self.frequency = dict(zip(self.UNITS, (
+            frequency_years, frequency_months, frequency_days,
+            frequency_hours, frequency_minutes, frequency_dekades)))
+        self._step = sum(self.frequency[u] * self._UNIT_MINUTES[u] for
+                         u in self.UNITS)
+        self._first = self._slot(0)
+        if count is None:
+            if self._step == 0:
+                raise ValueError("A schedule without frequency needs a "
+                                 "count")
+            count = self._floor_index(end) + 1
+        self.count = max(count, 0)
+
+    def __repr__(self):
+        return ("{0}.{1.__class__.__name__}({1.first!r}, "
+                "count={1.count!r}, frequency={1.frequency!r})".format(
+                    __name__, self))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        if self.is_fixed:
+            delta = timedelta(minutes=self._step)
+            current = self._first
+            for i in xrange(self.count):
+                yield current
+                current += delta
+        else:
+            for i in xrange(self.count):
+                yield self._slot(i)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("schedule index out of range")
+        return self._slot(index)
+
+    def __contains__(self, timeslot):
+        try:
+            self.index(timeslot)
+            result = True
+        except ValueError:
+            result = False
         return result
+
+    def index(self, timeslot):
+        """
+        Return the position of the input timeslot in the schedule.
+
+        :raises: ValueError, if the timeslot is not in the schedule
+        """
+
+        timeslot = timeslot.replace(tzinfo=None)
+        i = self._floor_index(timeslot) if self._step != 0 else 0
+        if not (0 <= i < self.count and self._slot(i) == timeslot):
+            raise ValueError("{} is not in the schedule".format(timeslot))
+        return i
+
+    def intersection(self, other):
+        """
+        Return the timeslots that are common to this and another schedule.
+
+        When both schedules have fixed frequencies the result is computed
+        arithmetically and is itself a TimeslotSchedule, in ascending
+        order. Otherwise the shorter schedule is iterated and the result is
+        a list with the common timeslots, in the order of the shorter
+        schedule.
+
+        :type other: TimeslotSchedule
+        """
+
+        if self.is_fixed and other.is_fixed:
+            result = self._fixed_intersection(other)
+        else:
+            shorter, longer = sorted((self, other), key=len)
+            result = [t for t in shorter if t in longer]
+        return result
+
+    def _slot(self, i):
+        offsets = [self.start[u] + i * self.frequency[u] for u in self.UNITS]
+        return TimeslotDisplacement.offset_timeslot(self.reference, *offsets)
+
+    def _floor_index(self, timeslot):
+        """
+        Return the index of the last timeslot that is not past the input.
+
+        'Past' follows the direction of the schedule, so for schedules that
+        go back in time it means 'earlier than'.
+        """
+
+        distance = self._to_minutes(timeslot) - self._to_minutes(self._first)
+        if self.is_fixed:
+            i = distance // self._step
+        else:
+            def is_past(index):
+                if self._step > 0:
+                    result = self._slot(index) > timeslot
+                else:
+                    result = self._slot(index) < timeslot
+                return result
+            i = int(round(distance / float(self._step)))
+            while is_past(i):
+                i -= 1
+            while not is_past(i + 1):
+                i += 1
+        return i
+
+    def _fixed_intersection(self, other):
+        ascending = []
+        for schedule in (self, other):
+            step = abs(schedule._step)
+            if schedule.count > 0:
+                if schedule._step >= 0:
+                    first = self._to_minutes(schedule[0])
+                else:
+                    first = self._to_minutes(schedule[-1])
+            else:
+                first = None
+            last = first + step * (schedule.count - 1) if first is not None \
+                else None
+            ascending.append((first, last, step))
+        (first1, last1, step1), (first2, last2, step2) = ascending
+        count = 0
+        start = self._EPOCH
+        step = 0
+        if first1 is not None and first2 is not None:
+            low, high = max(first1, first2), min(last1, last2)
+            if step1 == 0 or step2 == 0:
+                common = [first1] if step1 == 0 else [first2]
+                step = 0
+            else:
+                common, step = self._solve_congruence(first1, step1,
+                                                      first2, step2)
+                common = [] if common is None else [common]
+            for candidate in common:
+                if step > 0:
+                    candidate += -((candidate - low) // step) * step
+                on_both = all(
+                    f <= candidate <= l and (s == 0 or (candidate - f) % s == 0)
+                    for f, l, s in ascending)
+                if on_both and candidate <= high:
+                    start = self._EPOCH + timedelta(minutes=candidate)
+                    count = 1 if step == 0 else (high - candidate) // step + 1
+        return TimeslotSchedule(start, count=count, frequency_minutes=step)
+
+    @staticmethod
+    def _solve_congruence(a, step_a, b, step_b):
+        """
+        Find x such that x = a (mod step_a) and x = b (mod step_b).
+
+        :return: A tuple with one solution (or None if there is none) and
+            the least common multiple of the steps
+        """
+
+        g = gcd(step_a, step_b)
+        lcm = step_a // g * step_b
+        result = None
+        if (b - a) % g == 0:
+            modulus = step_b // g
+            k = 0
+            if modulus > 1:
+                k = ((b - a) // g * _modular_inverse(step_a // g, modulus) %
+                     modulus)
+            result = a + step_a * k
+        return result, lcm
+
+    @classmethod
+    def _to_minutes(cls, timeslot):
+        delta = timeslot.replace(tzinfo=None) - cls._EPOCH
+        return delta.days * 1440 + delta.seconds // 60
+
+
+def _modular_inverse(value, modulus):
+    old_r, r = value % modulus, modulus
+    old_s, s = 1, 0
+    while r != 0:
+        quotient = old_r // r
+        old_r, r = r, old_r - quotient * r
+        old_s, s = s, old_s - quotient * s
+    return old_s % modulus
@@ -0,0 +1,168 @@
+"""
+Working directories for running tasks
+"""
+
+import os
+import errno
+import atexit
+import Queue
+import shutil
+import logging
+import tempfile
+import threading
+
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class WorkingDirectoryManager(object):
+    """
+    Hand out working directories and recycle them once they are released.
+
+    Directories are created under `root`, which can be placed on a fast
+    volume such as a tmpfs. Released directories are emptied by a
+    background thread and kept for reuse, up to `max_pooled` of them, so
+    that running a task does not wait for the previous one to be cleaned.
+    The pooled directories are removed when the process exits.
+
+    :arg root: The directory where working directories are created. It
+        defaults to the `root` of the `working_directories` settings and
+        then to the system's temporary directory
+    :arg max_pooled: Maximum number of empty directories to keep for reuse.
+        It defaults to the `max_pooled` of the `working_directories`
+        settings and then to 16
+    """
+
+    def __init__(self, root=None, max_pooled=None):
+        self._root = root
+        self._max_pooled = max_pooled
+        self._pool = []
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._cleaner = None
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.root!r})".format(__name__, self)
+
+    @property
+    def root(self):
+        root = self._root or settings.working_directories.get("root")
+        return root if root is not None else tempfile.gettempdir()
+
+    @property
+    def max_pooled(self):
+        if self._max_pooled is not None:
+            result = self._max_pooled
+        else:
+            result = settings.working_directories.get("max_pooled", 16)
+        return result
+
+    def acquire(self):
+        """
+        Return an empty working directory.
+
+        :return: The path to the directory
+        :rtype: str
+        """
+
+        self._check_process()
+        root = self.root
+        path = None
+        with self._lock:
+            while path is None and any(self._pool):
+                candidate = self._pool.pop()
+                if os.path.dirname(candidate) == root:
+                    path = candidate
+        if path is None:
+            try:
+                os.makedirs(root)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+            path = tempfile.mkdtemp(prefix="conductor_", dir=root)
+        return path
+
+    def release(self, path):
+        """
+        Give a working directory back to be emptied and reused.
+
+        The directory is emptied in a background thread, so this method
+        returns immediately.
+        """
+
+        self._check_process()
+        self._start_cleaner()
+        self._queue.put(path)
+
+    def wait(self):
+        """
+        Block until all of the released directories have been processed.
+        """
+
+        self._queue.join()
+
+    def clear(self):
+        """
+        Remove all of the directories that are waiting to be reused.
+
+        Directories that are still being emptied are waited for, so that
+        none of them is left half deleted.
+        """
+
+        self._check_process()
+        self.wait()
+        with self._lock:
+            pooled = self._pool
+            self._pool = []
+        for path in pooled:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _check_process(self):
+        # forked processes must not reuse the directories of their parent
+        if os.getpid() != self._pid:
+            with self._lock:
+                self._pid = os.getpid()
+                self._pool = []
+                self._queue = Queue.Queue()
+                self._cleaner = None
+
+    def _start_cleaner(self):
+        with self._lock:
+            if self._cleaner is None or not self._cleaner.is_alive():
+                self._cleaner = threading.Thread(target=self._clean_loop,
+                                                 args=(self._queue,),
+                                                 name="working-dir-cleaner")
+                self._cleaner.daemon = True
+                self._cleaner.start()
+
+    def _clean_loop(self, queue):
+        while True:
+            path = queue.get()
+            try:
+                self._recycle(path)
+            except Exception:
+                logger.exception("Could not clean {}".format(path))
+            finally:
+                queue.task_done()
+
+    def _recycle(self, path):
+        with self._lock:
+            keep = (len(self._pool) < self.max_pooled and
+                    os.path.dirname(path) == self.root)
+        if not keep:
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.isdir(path):
+            for name in os.listdir(path):
+                full_path = os.path.join(path, name)
+                if os.path.isdir(full_path) and not os.path.islink(full_path):
+                    shutil.rmtree(full_path)
+                else:
+                    os.remove(full_path)
+            with self._lock:
+                self._pool.append(path)
+
+
+working_dir_manager = WorkingDirectoryManager()
+atexit.register(working_dir_manager.clear)
@@ -0,0 +1,573 @@
+"""
+Shared queues of task runs for workers on many nodes
+
+Jobs are (task, timeslot) pairs. A worker claims a job by taking a lease on
+it and keeps the lease alive with heartbeats while the job runs. Jobs whose
+lease expires, for example because their worker died, are claimed again by
+other workers.
+"""
+
+import os
+import json
+import time
+import errno
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+import contextlib
+from datetime import datetime
+from collections import namedtuple
+
+import dateutil.parser
+
+from .. import errors
+from ..settings import settings
+from . import timeslotdisplacement as tsd
+from .backfill import run_timeslot
+from .taskobserver import event_bus
+
+logger = logging.getLogger(__name__)
+
+TIMESLOT_FORMAT = "%Y%m%d%H%M"
+
+Job = namedtuple("Job", ["job_id", "task_name", "timeslot", "attempts"])
+
+
+class JobQueue(object):
+    """
+    Base class for job queues.
+
+    :arg max_attempts: Number of times a job is claimed before it is
+        marked as failed
+    """
+
+    QUEUED = "queued"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+
+    def put(self, task_name, timeslot):
+        """
+        Add a job to the queue, unless it is already there.
+
+        :return: The identifier of the job
+        """
+
+        raise NotImplementedError
+
+    def put_many(self, task_name, timeslots):
+        return [self.put(task_name, ts) for ts in timeslots]
+
+    def claim(self, worker_id, lease_seconds):
+        """
+        Take a lease on the next available job.
+
+        Jobs are available when they are queued or when their lease has
+        expired. Jobs whose lease expired after their last allowed attempt
+        are marked as failed instead of being claimed again.
+
+        :return: The claimed job or None, if no job is available
+        :rtype: Job
+        """
+
+        raise NotImplementedError
+
+    def heartbeat(self, job, worker_id, lease_seconds):
+        """
+        Extend the lease of a job.
+
+        :return: Whether the worker still holds the lease
+        """
+
+        raise NotImplementedError
+
+    def complete(self, job, worker_id, success, details=""):
+        """
+        Record the end of a job.
+
+        Failed jobs are queued again until they reach `max_attempts`.
+
+        :return: Whether the worker still held the lease
+        """
+
+        raise NotImplementedError
+
+    def counts(self):
+        """
+        Return the number of jobs in each state.
+
+        :rtype: dict
+        """
+
+        raise NotImplementedError
+
+    @staticmethod
+    def _expired_details(attempts):
+        return "Lease expired after {} attempts".format(attempts)
+
+    def _next_state(self, attempts, success):
+        if success:
+            result = self.DONE
+        elif attempts >= self.max_attempts:
+            result = self.FAILED
+        else:
+            result = self.QUEUED
+        return result
+
+
+class SqliteJobQueue(JobQueue):
+    """
+    A job queue stored in a SQLite database.
+
+    Claims are made in immediate transactions, so that only one worker
+    can claim each job. Every connection is closed as soon as its
+    statements have run. The database file can be placed on shared storage
+    whose file locking works reliably.
+
+    :arg path: The path to the database file. It is created if needed
+    """
+
+    def __init__(self, path, max_attempts=3):
+        super(SqliteJobQueue, self).__init__(max_attempts=max_attempts)
+        self.path = path
+        with contextlib.closing(self._connect()) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY, task_name TEXT, timeslot TEXT, "
+                "state TEXT, worker TEXT, lease_expires REAL, "
+                "attempts INTEGER DEFAULT 0, details TEXT, "
+                "UNIQUE (task_name, timeslot))"
+            )
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.path!r})".format(__name__, self)
+
+    def put(self, task_name, timeslot):
+        ts = timeslot.strftime(TIMESLOT_FORMAT)
+        with contextlib.closing(self._connect()) as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO jobs (task_name, timeslot, state) "
+                "VALUES (?, ?, ?)", (task_name, ts, self.QUEUED))
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE task_name = ? AND timeslot = ?",
+                (task_name, ts)).fetchone()
+        return row[0]
+
+    def claim(self, worker_id, lease_seconds):
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for job_id, attempts in connection.execute(
+                    "SELECT id, attempts FROM jobs WHERE state = ? AND "
+                    "lease_expires < ? AND attempts >= ?",
+                    (self.LEASED, now, self.max_attempts)).fetchall():
+                logger.warning("Job {} failed: its lease expired after {} "
+                               "attempts".format(job_id, attempts))
+                connection.execute(
+                    "UPDATE jobs SET state = ?, worker = NULL, details = ? "
+                    "WHERE id = ?",
+                    (self.FAILED, self._expired_details(attempts), job_id))
+            row = connection.execute(
+                "SELECT id, task_name, timeslot, attempts FROM jobs "
+                "WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                "ORDER BY timeslot, id LIMIT 1",
+                (self.QUEUED, self.LEASED, now)).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET state = ?, worker = ?, "
+                    "lease_expires = ?, attempts = attempts + 1 "
+                    "WHERE id = ?",
+                    (self.LEASED, worker_id, now + lease_seconds, row[0]))
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        result = None
+        if row is not None:
+            result = Job(row[0], row[1],
+                         datetime.strptime(row[2], TIMESLOT_FORMAT),
+                         row[3] + 1)
+        return result
+
+    def heartbeat(self, job, worker_id, lease_seconds):
+        with contextlib.closing(self._connect()) as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ? "
+                "WHERE id = ? AND state = ? AND worker = ?",
+                (time.time() + lease_seconds, job.job_id, self.LEASED,
+                 worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, job, worker_id, success, details=""):
+        with contextlib.closing(self._connect()) as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET state = ?, worker = NULL, details = ? "
+                "WHERE id = ? AND state = ? AND worker = ?",
+                (self._next_state(job.attempts, success), details,
+                 job.job_id, self.LEASED, worker_id))
+        return cursor.rowcount == 1
+
+    def counts(self):
+        with contextlib.closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+
+class LockfileJobQueue(JobQueue):
+    """
+    A job queue stored as files in a directory.
+
+    Each job is a JSON file. A lease is a lock file that is created
+    exclusively by the worker that claims the job. Expired leases are
+    broken by atomically renaming their lock file, so that only one worker
+    can break each of them. Heartbeats and completions rename the lock file
+    aside in the same way before checking its owner, so a worker whose
+    lease was broken never renews or removes the lease of another worker.
+
+    :arg directory: The directory of the queue. It is created if needed
+    """
+
+    def __init__(self, directory, max_attempts=3):
+        super(LockfileJobQueue, self).__init__(max_attempts=max_attempts)
+        self.directory = directory
+        self.jobs_dir = os.path.join(directory, "jobs")
+        self.leases_dir = os.path.join(directory, "leases")
+        for path in (self.jobs_dir, self.leases_dir):
+            try:
+                os.makedirs(path)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.directory!r})".format(
+            __name__, self)
+
+    def put(self, task_name, timeslot):
+        ts = timeslot.strftime(TIMESLOT_FORMAT)
+        job_id = "{}_{}".format(task_name.replace(" ", "_"), ts)
+        path = self._job_path(job_id)
+        if not os.path.isfile(path):
+            self._write_json(path, {"task_name": task_name, "timeslot": ts,
+                                    "state": self.QUEUED, "attempts": 0,
+                                    "details": ""})
+        return job_id
+
+    def claim(self, worker_id, lease_seconds):
+        now = time.time()
+        result = None
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith(".json"):
+                continue
+            job_id = name[:-len(".json")]
+            record = self._read_json(self._job_path(job_id))
+            if record is None or record["state"] not in (self.QUEUED,
+                                                         self.LEASED):
+                continue
+            lease = self._read_json(self._lease_path(job_id))
+            if lease is not None:
+                if lease["expires"] >= now:
+                    continue
+                self._break_lease(job_id, now)
+            if self._take_lease(job_id, worker_id, now + lease_seconds):
+                # read again, the job may have been completed meanwhile
+                record = self._read_json(self._job_path(job_id))
+                if record["state"] not in (self.QUEUED, self.LEASED):
+                    os.remove(self._lease_path(job_id))
+                    continue
+                if (record["state"] == self.LEASED and
+                        record["attempts"] >= self.max_attempts):
+                    # the previous lease expired on the last attempt
+                    logger.warning("Job {} failed: its lease expired after "
+                                   "{} attempts".format(job_id,
+                                                        record["attempts"]))
+                    record["state"] = self.FAILED
+                    record["details"] = self._expired_details(
+                        record["attempts"])
+                    self._write_json(self._job_path(job_id), record)
+                    os.remove(self._lease_path(job_id))
+                    continue
+                record["state"] = self.LEASED
+                record["attempts"] += 1
+                self._write_json(self._job_path(job_id), record)
+                result = Job(job_id, record["task_name"],
+                             datetime.strptime(record["timeslot"],
+                                               TIMESLOT_FORMAT),
+                             record["attempts"])
+                break
+        return result
+
+    def heartbeat(self, job, worker_id, lease_seconds):
+        return self._renew_lease(job.job_id, worker_id,
+                                 time.time() + lease_seconds)
+
+    def complete(self, job, worker_id, success, details=""):
+        owned = self._renew_lease(job.job_id, worker_id)
+        if owned:
+            path = self._job_path(job.job_id)
+            record = self._read_json(path)
+            record["state"] = self._next_state(job.attempts, success)
+            record["details"] = details
+            self._write_json(path, record)
+            os.remove(self._lease_path(job.job_id))
+        return owned
+
+    def counts(self):
+        result = dict()
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith(".json"):
+                record = self._read_json(os.path.join(self.jobs_dir, name))
+                if record is not None:
+                    result[record["state"]] = result.get(
+                        record["state"], 0) + 1
+        return result
+
+    def _take_lease(self, job_id, worker_id, expires):
+        try:
+            fd = os.open(self._lease_path(job_id),
+                         os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as err:
+            if err.errno == errno.EEXIST:
+                return False
+            raise
+        with os.fdopen(fd, "w") as fh:
+            json.dump({"worker": worker_id, "expires": expires}, fh)
+        return True
+
+    def _break_lease(self, job_id, now):
+        path = self._lease_path(job_id)
+        broken = "{}.broken.{}.{}".format(path, socket.gethostname(),
+                                          os.getpid())
+        try:
+            os.rename(path, broken)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return
+        lease = self._read_json(broken)
+        if lease is not None and lease["expires"] >= now:
+            # another worker broke the expired lease first and this is its
+            # new lease, so put it back unless a third one was taken
+            try:
+                os.link(broken, path)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+        os.remove(broken)
+
+    def _renew_lease(self, job_id, worker_id, expires=None):
+        """
+        Check that the worker holds the lease of a job and optionally
+        extend it.
+
+        The lock file is renamed aside while it is checked, so that no
+        other worker can break or replace it meanwhile. It is linked back
+        afterwards, unless another worker took a new lease in between.
+
+        :return: Whether the worker still holds the lease
+        """
+
+        path = self._lease_path(job_id)
+        renewing = "{}.renew.{}.{}".format(path, socket.gethostname(),
+                                           os.getpid())
+        try:
+            os.rename(path, renewing)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return False
+        lease = self._read_json(renewing)
+        owned = lease is not None and lease["worker"] == worker_id
+        if owned and expires is not None:
+            self._write_json(renewing, {"worker": worker_id,
+                                        "expires": expires})
+        try:
+            os.link(renewing, path)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+            owned = False
+        os.remove(renewing)
+        return owned
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, job_id + ".json")
+
+    def _lease_path(self, job_id):
+        return os.path.join(self.leases_dir, job_id + ".lease")
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            # the file is being written by another worker
+            pass
+        return None
+
+    @staticmethod
+    def _write_json(path, record):
+        temp_path = "{}.{}.{}.tmp".format(path, socket.gethostname(),
+                                          os.getpid())
+        with open(temp_path, "w") as fh:
+            json.dump(record, fh)
+        os.rename(temp_path, path)
+
+
+BACKENDS = {
+    "sqlite": SqliteJobQueue,
+    "lockfile": LockfileJobQueue,
+}
+
+
+def get_job_queue(backend, location, **kwargs):
+    """
+    Create a job queue.
+
+    :arg backend: The name of the backend, either 'sqlite' or 'lockfile'
+    :arg location: The database file or the directory of the queue
+    :raises: conductor.errors.InvalidSettingsError
+    """
+
+    try:
+        queue_class = BACKENDS[backend]
+    except KeyError:
+        raise errors.InvalidSettingsError(
+            "Unknown job queue backend: {!r}".format(backend))
+    return queue_class(location, **kwargs)
+
+
+class Worker(object):
+    """
+    Claim and run jobs from a queue.
+
+    While a job runs, a background thread renews its lease every
+    `heartbeat_interval` seconds. If the lease is lost, the outcome of the
+    job is not recorded, since another worker has claimed it.
+
+    :arg queue: The queue to take jobs from
+    :type queue: JobQueue
+    :arg worker_id: Identifies the worker. Defaults to the host name and
+        the process identifier
+    :arg lease_seconds: The duration of each lease
+    :arg heartbeat_interval: Seconds between heartbeats. Defaults to a third
+        of the lease duration
+    :arg mode_name: The name of the run mode used for every job
+    """
+
+    def __init__(self, queue, worker_id=None, lease_seconds=300,
+                 heartbeat_interval=None, mode_name="CREATION_MODE"):
+        self.queue = queue
+        self.worker_id = worker_id or "{}-{}".format(socket.gethostname(),
+                                                     os.getpid())
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = (heartbeat_interval if heartbeat_interval
+                                   is not None else lease_seconds / 3.0)
+        self.mode_name = mode_name
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.worker_id!r})".format(
+            __name__, self)
+
+    def run(self, max_jobs=None, wait_for_jobs=False, poll_interval=10):
+        """
+        Run jobs until the queue is empty or `max_jobs` have been run.
+
+        :arg wait_for_jobs: Whether to keep polling the queue when it is
+            empty instead of returning
+        :arg poll_interval: Seconds between polls of an empty queue
+        :return: The outcome of each job that was run
+        :rtype: [conductor.tasks.backfill.BackfillOutcome]
+        """
+
+        outcomes = []
+        while max_jobs is None or len(outcomes) < max_jobs:
+            job = self.queue.claim(self.worker_id, self.lease_seconds)
+            if job is None:
+                if not wait_for_jobs:
+                    break
+                time.sleep(poll_interval)
+                continue
+            outcomes.append(self.run_job(job))
+        event_bus.flush()
+        return outcomes
+
+    def run_job(self, job):
+        logger.info("{} claimed {} {:%Y%m%d%H%M} (attempt {})".format(
+            self.worker_id, job.task_name, job.timeslot, job.attempts))
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat,
+                                     args=(job, stop, lost))
+        heartbeat.daemon = True
+        heartbeat.start()
+        try:
+            outcome = run_timeslot(job.task_name, job.timeslot,
+                                   self.mode_name)
+        finally:
+            stop.set()
+            heartbeat.join()
+        if lost.is_set() or not self.queue.complete(
+                job, self.worker_id, outcome.success, outcome.details):
+            logger.warning("{} lost the lease of {}".format(self.worker_id,
+                                                            job.job_id))
+        return outcome
+
+    def _heartbeat(self, job, stop, lost):
+        while not stop.wait(self.heartbeat_interval):
+            if not self.queue.heartbeat(job, self.worker_id,
+                                        self.lease_seconds):
+                lost.set()
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Queue conductor tasks and run them on worker nodes")
+    parser.add_argument("settings", help="URL of the settings, for example "
+                                         "file:///path/to/settings.json")
+    parser.add_argument("backend", choices=sorted(BACKENDS),
+                        help="Job queue backend")
+    parser.add_argument("location", help="Database file or directory of "
+                                         "the job queue")
+    subparsers = parser.add_subparsers(dest="command")
+    enqueue_parser = subparsers.add_parser("enqueue",
+                                           help="Add jobs to the queue")
+    enqueue_parser.add_argument("task", help="Name of the task to run")
+    enqueue_parser.add_argument("start", help="First timeslot")
+    enqueue_parser.add_argument("end", help="Last timeslot")
+    enqueue_parser.add_argument("-f", "--frequency", type=int, default=1)
+    enqueue_parser.add_argument("-u", "--unit", default="hours",
+                                choices=tsd.TimeslotSchedule.UNITS)
+    work_parser = subparsers.add_parser("work", help="Run queued jobs")
+    work_parser.add_argument("-l", "--lease", type=int, default=300,
+                             help="Lease duration, in seconds")
+    work_parser.add_argument("-w", "--wait", action="store_true",
+                             help="Keep waiting for new jobs")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    settings.get_settings(args.settings)
+    queue = get_job_queue(args.backend, args.location)
+    if args.command == "enqueue":
+        frequency = {"frequency_{}".format(args.unit): args.frequency}
+        schedule = tsd.TimeslotSchedule(dateutil.parser.parse(args.start),
+                                        end=dateutil.parser.parse(args.end),
+                                        **frequency)
+        queue.put_many(args.task, schedule)
+    else:
+        Worker(queue, lease_seconds=args.lease).run(wait_for_jobs=args.wait)
+    print(queue.counts())
+    return 0
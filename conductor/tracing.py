@@ -0,0 +1,154 @@
+"""
+Timing instrumentation for conductor
+
+Code is instrumented by wrapping the interesting parts in spans:
+
+    with tracing.span("fetch_inputs", task=task.name):
+        ...
+
+Spans are only recorded while the tracer is enabled. When it is disabled,
+opening a span returns a shared no-op context manager. Recorded spans can
+be exported in the Chrome trace event format and viewed as a timeline in
+chrome://tracing or Perfetto.
+"""
+
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Span = namedtuple("Span", ["name", "category", "start", "duration", "pid",
+                           "tid", "args"])
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ActiveSpan(object):
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.time() - self.start
+        if exc_type is not None:
+            self.args["error"] = repr(exc_value)
+        self.tracer.record(Span(self.name, self.category, self.start,
+                                duration, os.getpid(),
+                                threading.current_thread().ident, self.args))
+        return False
+
+
+class Tracer(object):
+    """
+    Collect timing spans.
+
+    :arg enabled: Whether spans are recorded
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}(enabled={1.enabled!r})".format(
+            __name__, self)
+
+    def span(self, name, category="conductor", **args):
+        """
+        Return a context manager that times the managed block.
+
+        :arg name: The name of the span
+        :arg category: The category of the span
+        :arg args: Additional information stored in the span
+        """
+
+        if not self.enabled:
+            return _NULL_SPAN
+        return _ActiveSpan(self, name, category, args)
+
+    def record(self, span):
+        with self._lock:
+            self._spans.append(span)
+
+    @property
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def pop_spans(self):
+        """
+        Return the recorded spans and forget them.
+        """
+
+        with self._lock:
+            spans = self._spans
+            self._spans = []
+        return spans
+
+    def to_chrome_trace(self, spans=None):
+        """
+        Convert spans to the Chrome trace event format.
+
+        :arg spans: The spans to convert. Defaults to the recorded spans
+        :return: A dictionary that can be serialized to JSON
+        """
+
+        spans = spans if spans is not None else self.spans
+        events = []
+        for s in spans:
+            events.append({
+                "name": s.name,
+                "cat": s.category,
+                "ph": "X",
+                "ts": int(s.start * 1e6),
+                "dur": int(s.duration * 1e6),
+                "pid": s.pid,
+                "tid": s.tid,
+                "args": s.args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path, spans=None):
+        """
+        Write spans to a file in the Chrome trace event format.
+        """
+
+        with open(path, "w") as fh:
+            json.dump(self.to_chrome_trace(spans), fh)
+        logger.info("Trace written to {}".format(path))
+
+
+tracer = Tracer()
+
+
+def span(name, category="conductor", **args):
+    """
+    Time the managed block with the module's tracer.
+    """
+
+    return tracer.span(name, category, **args)
@@ -26,3 +26,25 @@ class UrlHandlerFactory(object):
 
 
 url_handler_factory = UrlHandlerFactory()
+
+
+def stream_url(source, destination, name):
+    """
+    Copy the resource at a URL into a directory of another URL.
+
+    The data is streamed from the source's handler straight into the
+    destination's handler, without staging a copy on the local disk.
+
+    :arg source: The URL to copy
+    :type source: conductor.urlparser.Url
+    :arg destination: A URL whose path_part is the destination directory
+    :type destination: conductor.urlparser.Url
+    :arg name: The name of the new file
+    :return: The path of the new file
+    """
+
+    source_handler = url_handler_factory.get_handler(source.scheme)
+    destination_handler = url_handler_factory.get_handler(destination.scheme)
+    with source_handler.open_url(source) as stream:
+        result = destination_handler.post_stream(destination, name, stream)
+    return result
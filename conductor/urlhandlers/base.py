@@ -4,26 +4,288 @@ Base implementation for URLhandlers for conductor
 
 import os
 import os.path
+import errno
+import posixpath
 import re
 import logging
 
 import dateutil
 
-from .. import (ParameterSelectionRule, TemporalPart)
+from .. import errors
+from .. import (ParameterSelectionRule, TemporalPart, TemporalSelectionRule)
 
 logger = logging.getLogger(__name__)
 
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+
 
 class BaseUrlHandler(object):
 
     @staticmethod
     def create_local_directory(path):
         if not os.path.isdir(path):
-            os.makedirs(path)
+            try:
+                os.makedirs(path)
+            except OSError as err:
+                # another thread or process may have created it meanwhile
+                if err.errno != errno.EEXIST:
+                    raise
 
     def __repr__(self):
         return "{0}.{1.__class__.__name__}()".format(__name__, self)
 
+    def stat_urls(self, urls):
+        """
+        Check whether each of the input URLs exists, without retrieving it.
+
+        Implementations should be batched: the URLs are grouped by host and
+        by directory so that each directory is only listed once.
+
+        :arg urls: The URLs to check
+        :type urls: [conductor.urlparser.Url]
+        :return: A mapping with each URL string as key and either a
+            (size, mtime) tuple or None, in case the URL does not exist
+        :rtype: dict
+        :raises: NotImplementedError
+        """
+
+        raise NotImplementedError
+
+    def list_directory(self, url):
+        """
+        Return the names of the entries of the directory at the input URL.
+
+        :arg url: A URL whose path_part is a directory
+        :type url: conductor.urlparser.Url
+        :rtype: [str]
+        :raises: conductor.errors.ResourceNotFoundError, NotImplementedError
+        """
+
+        raise NotImplementedError
+
+    def open_url(self, url):
+        """
+        Open the resource available at the input URL for streamed reading.
+
+        This is a context manager that provides a file-like object.
+
+        :arg url: The URL to read from
+        :type url: conductor.urlparser.Url
+        :raises: conductor.errors.ResourceNotFoundError, NotImplementedError
+        """
+
+        raise NotImplementedError
+
+    def post_stream(self, url, name, stream):
+        """
+        Send the contents of a file-like object to the input URL.
+
+        Data is copied in chunks, so the whole stream is never held in
+        memory.
+
+        :arg url: A URL whose path_part is the destination directory
+        :type url: conductor.urlparser.Url
+        :arg name: The name of the file to create in the destination
+        :arg stream: A file-like object opened for reading
+        :return: The path of the new file
+        :raises: conductor.errors.ResourceNotFoundError, NotImplementedError
+        """
+
+        raise NotImplementedError
+
+    def delete_urls(self, urls):
+        """
+        Delete the resources available at the input URLs.
+
+        Implementations should reuse a single connection for all of the
+        URLs that belong to the same host.
+
+        :arg urls: The URLs to delete
+        :type urls: [conductor.urlparser.Url]
+        :return: A mapping with each URL string as key and either None, if
+            the URL was deleted, or a message describing the error
+        :rtype: dict
+        :raises: NotImplementedError
+        """
+
+        raise NotImplementedError
+
+    def list_names(self, url, path):
+        """
+        Return the names of the entries of a directory on the URL's host.
+
+        This is the listing used when finding resources. It defaults to
+        `list_directory` on a URL with the input path.
+
+        :arg url: A URL of the host to list
+        :type url: conductor.urlparser.Url
+        :arg path: The path of the directory
+        :rtype: [str]
+        :raises: conductor.errors.ResourceNotFoundError, NotImplementedError
+        """
+
+        return self.list_directory(url.with_path(path or "/"))
+
+    def find_resource_info(self, url, reference_resource,
+                           lock_timeslot=None, parameter=None,
+                           temporal_rule=TemporalSelectionRule.LATEST,
+                           parameter_rule=ParameterSelectionRule.HIGHEST):
+        dynamic_path = url.path_part
+        directory_pattern, sep, name_pattern = dynamic_path.rpartition("/")
+        name_pattern = name_pattern if name_pattern != "" else ".*"
+
+        resource_info = None
+        found = None
+        max_num_dirs = 20  # how many directories to scan before bailing
+        i = 0
+        exclude_dirs = []
+        while found is None and i < max_num_dirs:
+            try:
+                directory = self.find_directory(
+                    directory_pattern, url=url, resource=reference_resource,
+                    exclude=exclude_dirs, lock_timeslot=lock_timeslot,
+                    parameter=parameter, parameter_rule=parameter_rule,
+                    temporal_rule=temporal_rule
+                )
+                found = self.find_info(
+                    reference_resource, directory, url=url,
+                    name_pattern=name_pattern,
+                    lock_timeslot=lock_timeslot, temporal_rule=temporal_rule,
+                    parameter=parameter, parameter_rule=parameter_rule
+                )
+                if found is None:
+                    exclude_dirs.append(directory)
+                    i += 1
+            except (OSError, errors.ResourceNotFoundError) as err:
+                logger.error(err)
+                break
+        if found is not None:
+            path, params, slot = found
+            resource_info = slot, params
+        return resource_info
+
+    def find_directory(self, relative_path, url=None, resource=None,
+                       lock_timeslot=None, exclude=None, parameter=None,
+                       parameter_rule=ParameterSelectionRule.HIGHEST,
+                       temporal_rule=TemporalSelectionRule.LATEST):
+        lock_timeslot = lock_timeslot or []
+        exclude = exclude or []
+        parts = relative_path.split("/")
+        path = parts[0]
+        i = 1
+        while i < len(parts):
+            next_part = parts[i]
+            next_param_part = BaseUrlHandler.extract_parameter_spec(next_part)
+            next_temporal_part, format_string, re_pattern = (
+                BaseUrlHandler.extract_temporal_spec(next_part))
+            if not (next_param_part or next_temporal_part):
+                next_level = next_part  # lets go one level deeper
+            elif next_temporal_part and next_temporal_part in lock_timeslot:
+                the_string = "{{:{}}}".format(format_string)
+                next_level = the_string.format(
+                    getattr(resource.timeslot, next_temporal_part))
+            else:
+                next_parts = self.list_names(url, path)
+                if next_temporal_part:
+                    patt = re_pattern or r".*?"
+                    # lets choose next part according to the temporal rule
+                    candidates = [n for n in next_parts if re.search(patt, n)]
+                    candidates.sort(reverse=(
+                        temporal_rule == TemporalSelectionRule.LATEST))
+                    next_level = candidates[0]
+                elif next_param_part and next_param_part == parameter:
+                    # lets choose next part according to the param rule
+                    candidates = next_parts[:]
+                    candidates.sort(reverse=(
+                        parameter_rule == ParameterSelectionRule.HIGHEST))
+                    next_level = candidates[0]
+                else:
+                    logger.warning("Found parameter {!r} in path and "
+                                   "it is not being used for "
+                                   "finding... Selecting the first available "
+                                   "sub path".format(next_param_part))
+                    next_level = next_parts[0]
+            path = "/".join((path, next_level))
+            i += 1
+        return path
+
+    def find_info(self, resource, directory, url=None, name_pattern=r".*",
+                  lock_timeslot=None,
+                  temporal_rule=TemporalSelectionRule.LATEST,
+                  parameter=None,
+                  parameter_rule=ParameterSelectionRule.HIGHEST):
+        """
+        Return the resource info that fits the selection rules.
+
+        :param resource:
+        :param directory:
+        :param lock_timeslot:
+        :param temporal_rule:
+        :param parameter:
+        :param parameter_rule:
+        :return:
+        """
+
+        pattern = BaseUrlHandler.replace_temporal_specs_with_regex(
+            name_pattern.format(resource))
+        lock_timeslot = lock_timeslot or []
+        if any(lock_timeslot) and lock_timeslot[0] == "all":
+            lock_timeslot = [n.lower() for n, m in
+                             TemporalPart.__members__.items()]
+        self._validate_lock_timeslot_inputs(lock_timeslot)
+        self._validate_parameter_input(resource, parameter, parameter_rule)
+        candidates_with_timeslot = []
+        candidates_without_timeslot = []
+        for p in self.list_names(url, directory):
+            if re.search(pattern, p) is not None:
+                path_slot = self._extract_path_timeslot(p)
+                path_parameters = resource.extract_path_parameters(p)
+                if path_slot is not None:
+                    valid_slot = self._timeslot_is_valid(
+                        path_slot, lock_timeslot, resource.timeslot)
+                    if valid_slot:
+                        candidates_with_timeslot.append(
+                            (p, path_parameters, path_slot))
+                else:
+                    candidates_without_timeslot.append(
+                        (p, path_parameters, None))
+        temporal_sorted = sorted(
+            candidates_with_timeslot, key=lambda i: i[-1],
+            reverse=(temporal_rule == TemporalSelectionRule.LATEST)
+        )
+        result = temporal_sorted
+        if parameter is not None:
+            all_candidates = temporal_sorted + candidates_without_timeslot
+            parameter_sorted = sorted(
+                all_candidates, key=lambda i: i[1][parameter],
+                reverse=(parameter_rule == ParameterSelectionRule.HIGHEST)
+            )
+            result = parameter_sorted
+        return result[0] if any(result) else None
+
+    @staticmethod
+    def group_urls_by_directory(urls):
+        """
+        Group the input URLs by their host and by their parent directory.
+
+        :arg urls: The URLs to group
+        :type urls: [conductor.urlparser.Url]
+        :return: A mapping with (host_name, port_number, user_name,
+            user_password) tuples as keys. Each value is another mapping
+            with directory paths as keys and lists of (basename, url) tuples
+            as values
+        :rtype: dict
+        """
+
+        groups = dict()
+        for url in urls:
+            host = (url.host_name, url.port_number, url.user_name,
+                    url.user_password)
+            directory, name = posixpath.split(url.path_part)
+            host_group = groups.setdefault(host, dict())
+            host_group.setdefault(directory, []).append((name, url))
+        return groups
+
     def _timeslot_is_valid(self, timeslot, lock_timeslot,
                            reference_timeslot):
         valid = True
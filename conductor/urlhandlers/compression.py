@@ -0,0 +1,277 @@
+"""
+Streaming decompression for conductor's URL handlers
+
+Data is decompressed chunk by chunk while it is being transferred, so that
+compressed representations never need to be written to disk.
+"""
+
+import os
+import bz2
+import zlib
+import struct
+import logging
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from .. import errors
+from .base import TRANSFER_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+ZIP_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+ZIP_LOCAL_HEADER_SIGNATURE = 0x04034b50
+
+
+class ConcatenatedDecompressor(object):
+    """
+    Decompress a stream made of one or more compressed members.
+
+    :arg factory: A callable that returns a new decompressor object for
+        each member of the stream. Decompressor objects must provide the
+        `decompress` method and the `unused_data` attribute
+    """
+
+    name = None
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._current = factory()
+
+    def decompress(self, data):
+        result = []
+        while data:
+            try:
+                result.append(self._current.decompress(data))
+            except EOFError:
+                # the previous member ended exactly at the end of a chunk
+                self._current = self._factory()
+                continue
+            data = self._current.unused_data
+            if data:
+                self._current = self._factory()
+        return b"".join(result)
+
+    @property
+    def eof(self):
+        """
+        Whether the last member of the stream has been read completely.
+        """
+
+        return _stream_ended(self._current)
+
+
+class ZipEntryDecompressor(object):
+    """
+    Decompress the first entry of a zip archive as it is being read.
+
+    Only the stored and deflate methods are supported. The name of the
+    entry is available in the `name` attribute after its header has been
+    read.
+    """
+
+    name = None
+
+    def __init__(self):
+        self._header = b""
+        self._entry = None
+        self._done = False
+
+    def decompress(self, data):
+        if self._entry is None:
+            self._header += data
+            data = self._read_header()
+            if self._entry is None:
+                return b""
+        if self._done:
+            return b""
+        result = self._entry.decompress(data)
+        # any data after the first entry belongs to the rest of the archive
+        self._done = (bool(self._entry.unused_data) or
+                      getattr(self._entry, "remaining", None) == 0)
+        return result
+
+    @property
+    def eof(self):
+        """
+        Whether the entry has been read completely.
+        """
+
+        return self._done or (self._entry is not None and
+                              _stream_ended(self._entry))
+
+    def _read_header(self):
+        header = self._header
+        if len(header) < ZIP_LOCAL_HEADER.size:
+            return b""
+        (signature, version, flags, method, mod_time, mod_date, crc,
+         compressed_size, size, name_length,
+         extra_length) = ZIP_LOCAL_HEADER.unpack(
+            header[:ZIP_LOCAL_HEADER.size])
+        if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+            raise errors.DecompressionError("Not a zip archive")
+        data_start = ZIP_LOCAL_HEADER.size + name_length + extra_length
+        if len(header) < data_start:
+            return b""
+        self.name = header[ZIP_LOCAL_HEADER.size:
+                           ZIP_LOCAL_HEADER.size + name_length]
+        if method == 8:
+            self._entry = zlib.decompressobj(-zlib.MAX_WBITS)
+        elif method == 0 and not flags & 0x08:
+            self._entry = _StoredEntry(compressed_size)
+        else:
+            raise errors.DecompressionError(
+                "Unsupported zip entry: method {}, flags {}".format(method,
+                                                                    flags))
+        self._header = None
+        return header[data_start:]
+
+
+class _StoredEntry(object):
+
+    def __init__(self, size):
+        self.remaining = size
+        self.unused_data = b""
+
+    def decompress(self, data):
+        result = data[:self.remaining]
+        self.remaining -= len(result)
+        self.unused_data = data[len(result):]
+        return result
+
+    @property
+    def eof(self):
+        return self.remaining == 0
+
+
+def _stream_ended(decompressor):
+    """
+    Return whether a decompressor object has reached the end of its stream.
+    """
+
+    eof = getattr(decompressor, "eof", None)
+    if eof is not None:
+        result = eof
+    elif isinstance(decompressor, bz2.BZ2Decompressor):
+        # python 2 bz2 only tells by refusing more data
+        try:
+            decompressor.decompress(b"")
+            result = False
+        except EOFError:
+            result = True
+    else:
+        # python 2 zlib keeps the data after the end of the stream apart
+        probe = decompressor.copy()
+        try:
+            probe.decompress(b"\0")
+            result = probe.unused_data == b"\0"
+        except zlib.error:
+            result = False
+    return result
+
+
+def _gzip_factory():
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+CODECS = {
+    ".gz": lambda: ConcatenatedDecompressor(_gzip_factory),
+    ".bz2": lambda: ConcatenatedDecompressor(bz2.BZ2Decompressor),
+    ".zip": ZipEntryDecompressor,
+}
+if lzma is not None:
+    CODECS[".xz"] = lambda: ConcatenatedDecompressor(lzma.LZMADecompressor)
+
+
+def get_decompressor(name):
+    """
+    Return a decompressor suitable for the input file name.
+
+    :arg name: A file name, whose extension identifies the compression
+    :return: A new decompressor or None, if the name does not have the
+        extension of a supported compression format
+    """
+
+    extension = os.path.splitext(name)[1].lower()
+    factory = CODECS.get(extension)
+    return factory() if factory is not None else None
+
+
+def decompressed_name(name, decompressor=None):
+    """
+    Return the name of the decompressed version of the input file name.
+
+    Zip archives are named after their entry, when it is known.
+    """
+
+    if decompressor is not None and decompressor.name is not None:
+        result = os.path.basename(decompressor.name)
+    elif os.path.splitext(name)[1].lower() in CODECS:
+        result = os.path.splitext(name)[0]
+    else:
+        result = name
+    return result
+
+
+def copy_stream(source, destination, decompressor=None):
+    """
+    Copy a file-like object into another one, optionally decompressing it.
+
+    Data is read in chunks of TRANSFER_CHUNK_SIZE bytes.
+
+    :arg source: A file-like object opened for reading
+    :arg destination: A file-like object opened for writing
+    :arg decompressor: An object returned by `get_decompressor`
+    :raises: conductor.errors.DecompressionError, also when the compressed
+        data is truncated
+    """
+
+    chunk = source.read(TRANSFER_CHUNK_SIZE)
+    while chunk:
+        if decompressor is not None:
+            try:
+                chunk = decompressor.decompress(chunk)
+            except (zlib.error, IOError, EOFError) as err:
+                raise errors.DecompressionError(err.args)
+            except Exception as err:
+                if lzma is not None and isinstance(err, lzma.LZMAError):
+                    raise errors.DecompressionError(err.args)
+                raise
+        destination.write(chunk)
+        chunk = source.read(TRANSFER_CHUNK_SIZE)
+    if decompressor is not None and not decompressor.eof:
+        raise errors.DecompressionError(
+            "The compressed stream ended before its end marker")
+
+
+def save_stream(source, destination_directory, name, decompress=True):
+    """
+    Save a file-like object to a local directory.
+
+    When `decompress` is True and the name has the extension of a supported
+    compression format the data is decompressed while it is saved and the
+    file is saved without the compression extension. Partially written
+    files are removed when the transfer fails.
+
+    :return: The path of the saved file
+    :raises: conductor.errors.DecompressionError
+    """
+
+    decompressor = get_decompressor(name) if decompress else None
+    partial_path = os.path.join(destination_directory, name + ".part")
+    try:
+        with open(partial_path, "wb") as fh:
+            copy_stream(source, fh, decompressor)
+        path = os.path.join(destination_directory,
+                            decompressed_name(name, decompressor))
+        os.rename(partial_path, path)
+    except Exception:
+        if os.path.isfile(partial_path):
+            os.remove(partial_path)
+        raise
+    return path
@@ -0,0 +1,104 @@
+"""
+Connection pools for conductor's URL handlers
+"""
+
+import threading
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool(object):
+    """
+    A thread safe pool of reusable connections.
+
+    Connections are grouped by a key, usually a tuple with the host name,
+    port number and user credentials. Idle connections are kept for reuse
+    until the pool holds `max_idle` connections for the same key.
+
+    :arg factory: A callable that receives the items of the key as
+        positional arguments and returns a new connection
+    :arg closer: A callable that receives a connection and closes it. By
+        default the connection's `close` method is called
+    :arg max_idle: Maximum number of idle connections to keep for each key
+    """
+
+    def __init__(self, factory, closer=None, max_idle=4):
+        self.factory = factory
+        self.closer = closer or (lambda connection: connection.close())
+        self.max_idle = max_idle
+        self._idle = dict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.factory!r})".format(
+            __name__, self)
+
+    def acquire(self, key):
+        """
+        Return an idle connection for the input key or create a new one.
+        """
+
+        with self._lock:
+            idle = self._idle.get(key, [])
+            connection = idle.pop() if any(idle) else None
+        if connection is None:
+            logger.debug("Opening new connection for {}".format(key[0]))
+            connection = self.factory(*key)
+        return connection
+
+    def release(self, key, connection, reuse=True):
+        """
+        Give a connection back to the pool.
+
+        :arg reuse: Whether the connection can be handed out again. Broken
+            connections should be released with `reuse=False`, which closes
+            them
+        """
+
+        keep = False
+        if reuse:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append(connection)
+                    keep = True
+        if not keep:
+            self._close(connection)
+
+    @contextlib.contextmanager
+    def connection(self, key):
+        """
+        Context manager that acquires a connection and releases it on exit.
+
+        If the managed block raises an exception the connection is closed
+        instead of being returned to the pool.
+        """
+
+        connection = self.acquire(key)
+        try:
+            yield connection
+        except Exception:
+            self.release(key, connection, reuse=False)
+            raise
+        else:
+            self.release(key, connection)
+
+    def clear(self):
+        """
+        Close all of the idle connections.
+        """
+
+        with self._lock:
+            idle = self._idle
+            self._idle = dict()
+        for connections in idle.values():
+            for connection in connections:
+                self._close(connection)
+
+    def _close(self, connection):
+        try:
+            self.closer(connection)
+        except Exception as err:
+            logger.debug("Error closing connection: {}".format(err))
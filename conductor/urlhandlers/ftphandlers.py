@@ -1,41 +1,97 @@
 import os
 import os.path
+import errno
+import stat
+import socket
+import ftplib
+import posixpath
+import shutil
+import contextlib
 import logging
+from multiprocessing.pool import ThreadPool
 
 from ftputil import FTPHost
 import ftputil.error
+import ftputil.session
+
+try:
+    import paramiko
+except ImportError:
+    paramiko = None
 
 from .. import errors
-from .base import BaseUrlHandler
+from ..settings import settings
+from .base import BaseUrlHandler, TRANSFER_CHUNK_SIZE
+from . import compression
+from .connectionpool import ConnectionPool
 
 logger = logging.getLogger(__name__)
 
+session_pool = ConnectionPool(
+    lambda host_name, port_number, user_name, user_password: FTPHost(
+        host_name, user_name, user_password,
+        session_factory=ftputil.session.session_factory(port=port_number))
+)
+
+FTP_TIMEOUT = 60  # seconds
+ABORT_TIMEOUT = 5  # seconds
+
+
+def _open_segment_session(host_name, port_number, user_name, user_password):
+    session = ftplib.FTP(timeout=FTP_TIMEOUT)
+    session.connect(host_name, port_number)
+    session.login(user_name or "anonymous", user_password or "")
+    session.voidcmd("TYPE I")
+    return session
+
+
+# plain ftplib sessions, used for transfers that start at an offset
+segment_session_pool = ConnectionPool(_open_segment_session)
+
 
 class FtpUrlHandler(BaseUrlHandler):
 
-    def get_from_url(self, url, destination_directory):
+    def get_from_url(self, url, destination_directory, decompress=False):
         """
         Get the representation of the resource available at the input URL
 
         Copy the input url into the destination directory.
 
+        Files of at least `min_size` bytes, as given by the
+        `segmented_downloads` settings, are downloaded in parallel segments
+        with `get_segmented`.
+
         :arg url: The URL to be searched
         :type url: conductor.urlparser.Url
         :arg destination_directory: Directory where the resource's
             representation will be saved into. It must exist.
         :type destination_directory: str
+        :arg decompress: Whether to decompress compressed files while they
+            are downloaded
         :return: The full path to the representation that was retrieved
             from the input URL
         :rtype: str
         :raises: conductor.errors.ResourceNotFoundError,
             conductor.errors.InvalidUserCredentialsError,
-            conductor.errors.HostNotFoundError
+            conductor.errors.HostNotFoundError,
+            conductor.errors.DecompressionError
         """
 
         self.create_local_directory(destination_directory)
         path = url.path_part
-        destination = os.path.join(destination_directory,
-                                   os.path.basename(path))
+        name = os.path.basename(path)
+        if decompress and compression.get_decompressor(name) is not None:
+            with self.open_url(url) as fh:
+                return compression.save_stream(fh, destination_directory,
+                                               name)
+        destination = os.path.join(destination_directory, name)
+        min_size = settings.segmented_downloads.get("min_size")
+        if min_size is not None:
+            size = self.get_size(url)
+            if size is not None and size >= min_size:
+                return self.get_segmented(
+                    url, destination, size,
+                    segments=settings.segmented_downloads.get("segments", 4))
         try:
             with FTPHost(url.host_name, url.user_name, url.user_password) as h:
                 h.download(url.path_part, destination)
@@ -58,6 +114,77 @@ class FtpUrlHandler(BaseUrlHandler):
             raise errors.ResourceNotFoundError(err.args)
         return destination
 
+    def get_size(self, url):
+        """
+        Return the size of the remote file at the input URL.
+
+        :arg url: The URL of the file
+        :type url: conductor.urlparser.Url
+        :return: The size in bytes or None, if the server does not support
+            the SIZE command
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        with self.segment_session(url) as session:
+            try:
+                result = session.size(url.path_part)
+            except ftplib.error_perm as err:
+                if str(err).startswith("550"):
+                    raise errors.ResourceNotFoundError(err.args)
+                result = None
+        return result
+
+    def get_segmented(self, url, destination, size, segments=4):
+        """
+        Download a remote file in byte ranges over parallel FTP sessions.
+
+        The file is split into contiguous segments. Each one is retrieved on
+        its own pooled session, starting at its offset with the REST
+        command, and written in place into a partial file that is
+        preallocated to the final size. The partial file replaces the
+        destination only when every segment was received, and it is removed
+        when the download fails.
+
+        :arg url: The URL of the file
+        :type url: conductor.urlparser.Url
+        :arg destination: The local path to write to
+        :arg size: The size of the remote file
+        :arg segments: The number of segments, and of sessions
+        :return: The destination path
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        bounds = [size * i // segments for i in range(segments + 1)]
+        ranges = [(start, end) for start, end in zip(bounds, bounds[1:])
+                  if end > start]
+        partial = destination + ".part"
+        logger.debug("Downloading {} in {} segments".format(url.path_part,
+                                                            len(ranges)))
+        try:
+            with open(partial, "wb") as fh:
+                fh.truncate(size)
+            pool = ThreadPool(max(len(ranges), 1))
+            try:
+                received = pool.map(
+                    lambda r: self._get_segment(url, partial, *r), ranges)
+            finally:
+                pool.close()
+                pool.join()
+            if sum(received) != size or os.path.getsize(partial) != size:
+                raise errors.ResourceNotFoundError(
+                    "Incomplete download of {}: got {} of {} bytes".format(
+                        url.path_part, sum(received), size))
+        except BaseException:
+            if os.path.isfile(partial):
+                os.remove(partial)
+            raise
+        os.rename(partial, destination)
+        return destination
+
     @staticmethod
     def post_to_url(url, path):
         destination = os.path.join(url.path_part, os.path.basename(path))
@@ -80,6 +207,676 @@ class FtpUrlHandler(BaseUrlHandler):
                 raise errors.LocalPathNotFoundError(msg)
         return destination
 
+    def stat_urls(self, urls):
+        """
+        Check whether each of the input URLs exists in its FTP server.
+
+        A single pooled FTP session is used for each host and each remote
+        directory is listed only once, regardless of the number of URLs that
+        point to it.
+
+        :arg urls: The URLs to check
+        :type urls: [conductor.urlparser.Url]
+        :return: A mapping with each URL string as key and either a
+            (size, mtime) tuple or None
+        :rtype: dict
+        :raises: conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        result = dict()
+        for host, directories in self.group_urls_by_directory(urls).items():
+            first_url = directories.values()[0][0][1]
+            with self.pooled_session(first_url) as h:
+                for directory, named_urls in directories.items():
+                    try:
+                        contents = set(h.listdir(directory))
+                    except ftputil.error.PermanentError:
+                        contents = set()
+                    for name, url in named_urls:
+                        info = None
+                        if name in contents:
+                            st = h.stat(posixpath.join(directory, name))
+                            info = st.st_size, st.st_mtime
+                        result[url.url] = info
+        return result
+
+    @contextlib.contextmanager
+    def open_url(self, url):
+        """
+        Open the remote file at the input URL for streamed reading.
+
+        The FTP session is taken from the module's session pool.
+
+        :arg url: The URL to read from
+        :type url: conductor.urlparser.Url
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        with self.pooled_session(url) as h:
+            try:
+                fh = h.open(url.path_part, "rb")
+            except (ftputil.error.FTPIOError,
+                    ftputil.error.PermanentError) as err:
+                raise errors.ResourceNotFoundError(err.args)
+            try:
+                yield fh
+            finally:
+                fh.close()
+
+    def post_stream(self, url, name, stream):
+        """
+        Upload the contents of a file-like object to a remote directory.
+
+        :arg url: A URL whose path_part is the destination directory
+        :type url: conductor.urlparser.Url
+        :arg name: The name of the file to create in the destination
+        :arg stream: A file-like object opened for reading
+        :return: The path of the new remote file
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        destination = posixpath.join(url.path_part, name)
+        with self.pooled_session(url) as h:
+            try:
+                if not h.path.isdir(url.path_part):
+                    h.makedirs(url.path_part)
+                with h.open(destination, "wb") as fh:
+                    shutil.copyfileobj(stream, fh, TRANSFER_CHUNK_SIZE)
+            except (ftputil.error.FTPIOError,
+                    ftputil.error.PermanentError) as err:
+                raise errors.ResourceNotFoundError(err.args)
+        return destination
+
+    def list_directory(self, url):
+        """
+        Return the names of the entries of the remote directory at the URL.
+
+        The FTP session is taken from the module's session pool.
+
+        :arg url: A URL whose path_part is a directory
+        :type url: conductor.urlparser.Url
+        :rtype: [str]
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        with self.pooled_session(url) as h:
+            try:
+                result = h.listdir(url.path_part)
+            except ftputil.error.PermanentError as err:
+                raise errors.ResourceNotFoundError(err.args)
+        return result
+
+    def delete_urls(self, urls):
+        """
+        Delete the remote files at the input URLs.
+
+        One pooled FTP session is used for all the URLs of the same host and
+        the DELE commands are issued one after the other on it. When the
+        session breaks, the URLs that are left are tried once more on a new
+        session.
+
+        :arg urls: The URLs to delete
+        :type urls: [conductor.urlparser.Url]
+        :return: A mapping with each URL string as key and either None, if
+            the URL was deleted, or a message describing the error
+        :rtype: dict
+        :raises: conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        result = dict()
+        for host, directories in self.group_urls_by_directory(urls).items():
+            named_urls = [u for d in directories.values() for u in d]
+            for attempt in range(2):
+                try:
+                    self._delete_with_session(named_urls, result)
+                    break
+                except (ftputil.error.TemporaryError,
+                        ftputil.error.FTPOSError) as err:
+                    # the broken session has been discarded, so the URLs
+                    # that are left are tried once more on a new one
+                    if attempt == 1:
+                        raise
+                    logger.debug("Retrying deletions on {}: {}".format(
+                        host[0], err))
+        return result
+
+    def _delete_with_session(self, named_urls, result):
+        with self.pooled_session(named_urls[0][1]) as h:
+            for name, url in named_urls:
+                if url.url in result:
+                    continue
+                try:
+                    h.remove(url.path_part)
+                    result[url.url] = None
+                except ftputil.error.PermanentError as err:
+                    result[url.url] = str(err)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def pooled_session(url):
+        """
+        Context manager that provides a pooled FTP session for the URL's host
+
+        :type url: conductor.urlparser.Url
+        :raises: conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        key = (url.host_name, int(url.port_number or ftplib.FTP_PORT),
+               url.user_name, url.user_password)
+        try:
+            session = session_pool.acquire(key)
+        except ftputil.error.PermanentError as err:
+            if err.errno == 530:
+                raise errors.InvalidUserCredentialsError(err.args)
+            raise
+        except ftputil.error.FTPOSError as err:
+            code, msg = err.args
+            if code == -2:
+                logger.error("Server {} not found: {}".format(
+                    url.host_name, msg))
+                raise errors.HostNotFoundError(
+                    "Server {} not found".format(url.host_name))
+            raise
+        try:
+            yield session
+        except (ftputil.error.TemporaryError,
+                ftputil.error.FTPOSError):
+            # the session may be broken, do not reuse it
+            session_pool.release(key, session, reuse=False)
+            raise
+        except Exception:
+            session_pool.release(key, session)
+            raise
+        else:
+            session_pool.release(key, session)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def segment_session(url):
+        """
+        Context manager that provides a pooled ftplib session for the URL
+
+        Sessions that are closed inside the managed block are discarded
+        instead of going back to the pool. Connection errors inside the
+        block discard the session and are raised as ResourceNotFoundError.
+
+        :type url: conductor.urlparser.Url
+        :rtype: ftplib.FTP
+        :raises: conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError,
+            conductor.errors.ResourceNotFoundError
+        """
+
+        key = (url.host_name, int(url.port_number or ftplib.FTP_PORT),
+               url.user_name, url.user_password)
+        try:
+            session = segment_session_pool.acquire(key)
+        except ftplib.error_perm as err:
+            if str(err).startswith("530"):
+                raise errors.InvalidUserCredentialsError(err.args)
+            raise
+        except socket.gaierror as err:
+            logger.error("Server {} not found: {}".format(url.host_name, err))
+            raise errors.HostNotFoundError(
+                "Server {} not found".format(url.host_name))
+        except (ftplib.error_temp, ftplib.error_proto, socket.error,
+                EOFError) as err:
+            logger.error("Cannot connect to server {}:{}: {!r}".format(
+                key[0], key[1], err))
+            raise errors.HostNotFoundError(
+                "Cannot connect to server {}:{}".format(key[0], key[1]))
+        try:
+            yield session
+        except (ftplib.error_temp, ftplib.error_proto, socket.error,
+                EOFError) as err:
+            # the session may be broken, do not reuse it
+            segment_session_pool.release(key, session, reuse=False)
+            raise errors.ResourceNotFoundError(
+                "Transfer of {} failed: {!r}".format(url.path_part, err))
+        except Exception:
+            segment_session_pool.release(key, session,
+                                         reuse=session.sock is not None)
+            raise
+        else:
+            segment_session_pool.release(key, session,
+                                         reuse=session.sock is not None)
+
+    def _get_segment(self, url, path, start, end):
+        received = 0
+        with self.segment_session(url) as session:
+            try:
+                connection = session.transfercmd(
+                    "RETR {}".format(url.path_part), rest=start)
+            except ftplib.error_perm as err:
+                raise errors.ResourceNotFoundError(err.args)
+            try:
+                with open(path, "r+b") as fh:
+                    fh.seek(start)
+                    while received < end - start:
+                        chunk = connection.recv(min(TRANSFER_CHUNK_SIZE,
+                                                    end - start - received))
+                        if not chunk:
+                            break
+                        fh.write(chunk)
+                        received += len(chunk)
+                    finished = connection.recv(1) == ""
+            finally:
+                connection.close()
+            if finished:
+                session.voidresp()
+            else:
+                self._abort_transfer(session)
+        return received
+
+    @staticmethod
+    def _abort_transfer(session):
+        """
+        Stop a transfer that the client cut short, keeping the session.
+
+        After ABOR the server replies once for the interrupted transfer
+        and once for the ABOR command itself. Servers that do not answer
+        like that within ABORT_TIMEOUT seconds get their session closed,
+        since its replies cannot be told apart anymore.
+        """
+
+        timeout = session.sock.gettimeout()
+        session.sock.settimeout(ABORT_TIMEOUT)
+        try:
+            session.abort()
+            reply = session.getmultiline()
+            if reply[:3] not in ("225", "226"):
+                raise ftplib.error_proto(reply)
+        except (ftplib.Error, socket.error, EOFError) as err:
+            logger.debug("Closing the session after ABOR: {!r}".format(err))
+            session.close()
+        else:
+            session.sock.settimeout(timeout)
+
+
+SFTP_PORT = 22
+SFTP_TIMEOUT = 60  # seconds
+PREFETCH_WINDOW = 16 * 1024 * 1024  # bytes
+
+# names of the paramiko policies for hosts that are not in known_hosts
+HOST_KEY_POLICIES = {
+    "reject": "RejectPolicy",
+    "warning": "WarningPolicy",
+    "auto_add": "AutoAddPolicy",
+}
+
+
+class SftpSession(object):
+    """
+    An SFTP client together with the SSH connection that carries it.
+
+    The keys of the servers are checked against the system's known_hosts
+    and the `known_hosts` file of the `sftp` settings. Unknown servers are
+    rejected, unless the `missing_host_key_policy` of the `sftp` settings
+    is relaxed to 'warning' or 'auto_add'.
+    """
+
+    def __init__(self, host_name, port_number, user_name, user_password):
+        if paramiko is None:
+            raise errors.InvalidSchemeError(
+                "SFTP URLs need the paramiko package")
+        policy = settings.sftp.get("missing_host_key_policy", "reject")
+        try:
+            policy_class = getattr(paramiko, HOST_KEY_POLICIES[policy])
+        except KeyError:
+            raise errors.InvalidSettingsError(
+                "Unknown missing_host_key_policy: {!r}".format(policy))
+        self.client = paramiko.SSHClient()
+        self.client.load_system_host_keys()
+        if settings.sftp.get("known_hosts") is not None:
+            self.client.load_host_keys(settings.sftp["known_hosts"])
+        self.client.set_missing_host_key_policy(policy_class())
+        self.client.connect(host_name, port=port_number,
+                            username=user_name, password=user_password,
+                            timeout=SFTP_TIMEOUT)
+        self.sftp = self.client.open_sftp()
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.client!r})".format(__name__,
+                                                                 self)
+
+    def close(self):
+        try:
+            self.sftp.close()
+        finally:
+            self.client.close()
+
+
+sftp_session_pool = ConnectionPool(SftpSession)
+
+
+class WindowedPrefetch(object):
+    """
+    A sequential reader of an SFTP file that pipelines its read requests.
+
+    The file is requested one window at a time, so that reads do not wait
+    for a round trip to the server while no more than `window` bytes of
+    the file are buffered in memory.
+
+    :arg fh: The remote file, as opened by paramiko
+    :arg size: The size of the remote file
+    :arg window: The number of bytes that are requested at once
+    """
+
+    def __init__(self, fh, size, window=PREFETCH_WINDOW):
+        self.fh = fh
+        self.size = size
+        self.window = window
+        self._blocks = self._read_blocks()
+        self._buffer = []
+        self._buffered = 0
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.fh!r})".format(__name__, self)
+
+    def read(self, size=-1):
+        while size < 0 or self._buffered < size:
+            block = next(self._blocks, "")
+            if block == "":
+                break
+            self._buffer.append(block)
+            self._buffered += len(block)
+        data = "".join(self._buffer)
+        if size < 0:
+            size = len(data)
+        result, rest = data[:size], data[size:]
+        self._buffer = [rest] if rest else []
+        self._buffered = len(rest)
+        return result
+
+    def close(self):
+        self.fh.close()
+
+    def _read_blocks(self):
+        block_size = self.fh.MAX_REQUEST_SIZE
+        for start in xrange(0, self.size, self.window):
+            end = min(start + self.window, self.size)
+            blocks = [(offset, min(block_size, end - offset))
+                      for offset in xrange(start, end, block_size)]
+            for block in self.fh.readv(blocks):
+                yield block
+
 
 class SftpUrlHandler(BaseUrlHandler):
-    pass
+    """
+    Handles URLs on SFTP servers.
+
+    SSH connections are kept in the module's session pool and reused for
+    consecutive operations on the same host. Transfers are pipelined:
+    downloads keep a window of PREFETCH_WINDOW bytes of read requests
+    outstanding and uploads do not wait for each write to be acknowledged,
+    so their throughput is not bound by the latency of the link.
+    """
+
+    def get_from_url(self, url, destination_directory, decompress=False):
+        """
+        Get the representation of the resource available at the input URL
+
+        :arg url: The URL to be searched
+        :type url: conductor.urlparser.Url
+        :arg destination_directory: Directory where the resource's
+            representation will be saved into
+        :type destination_directory: str
+        :arg decompress: Whether to decompress compressed files while they
+            are downloaded
+        :return: The full path to the representation that was retrieved
+            from the input URL
+        :rtype: str
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError,
+            conductor.errors.DecompressionError
+        """
+
+        self.create_local_directory(destination_directory)
+        name = posixpath.basename(url.path_part)
+        with self.open_url(url) as fh:
+            if decompress and compression.get_decompressor(name) is not None:
+                destination = compression.save_stream(
+                    fh, destination_directory, name)
+            else:
+                destination = os.path.join(destination_directory, name)
+                with open(destination, "wb") as local:
+                    shutil.copyfileobj(fh, local, TRANSFER_CHUNK_SIZE)
+        return destination
+
+    def post_to_url(self, url, path):
+        """
+        Send a local file to the remote directory of the input URL.
+
+        :arg url: A URL whose path_part is the destination directory
+        :type url: conductor.urlparser.Url
+        :arg path: The local file to send
+        :return: The path of the new remote file
+        :raises: conductor.errors.LocalPathNotFoundError,
+            conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        try:
+            fh = open(path, "rb")
+        except IOError as err:
+            raise errors.LocalPathNotFoundError(err.args)
+        with fh:
+            return self.post_stream(url, os.path.basename(path), fh)
+
+    def post_stream(self, url, name, stream):
+        """
+        Upload the contents of a file-like object to a remote directory.
+
+        :arg url: A URL whose path_part is the destination directory
+        :type url: conductor.urlparser.Url
+        :arg name: The name of the file to create in the destination
+        :arg stream: A file-like object opened for reading
+        :return: The path of the new remote file
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        destination = posixpath.join(url.path_part, name)
+        with self.pooled_session(url) as session:
+            try:
+                self._makedirs(session.sftp, url.path_part)
+                with session.sftp.open(destination, "wb") as fh:
+                    fh.set_pipelined(True)
+                    shutil.copyfileobj(stream, fh, TRANSFER_CHUNK_SIZE)
+            except socket.error:
+                raise
+            except IOError as err:
+                raise errors.ResourceNotFoundError(err.args)
+        return destination
+
+    def stat_urls(self, urls):
+        """
+        Check whether each of the input URLs exists in its SFTP server.
+
+        Each remote directory is listed only once, with the attributes of
+        its entries, regardless of the number of URLs that point to it.
+
+        :arg urls: The URLs to check
+        :type urls: [conductor.urlparser.Url]
+        :return: A mapping with each URL string as key and either a
+            (size, mtime) tuple or None
+        :rtype: dict
+        :raises: conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        result = dict()
+        for host, directories in self.group_urls_by_directory(urls).items():
+            first_url = directories.values()[0][0][1]
+            with self.pooled_session(first_url) as session:
+                for directory, named_urls in directories.items():
+                    try:
+                        contents = dict(
+                            (a.filename, (a.st_size, a.st_mtime)) for a in
+                            session.sftp.listdir_attr(directory))
+                    except socket.error:
+                        raise
+                    except IOError:
+                        contents = dict()
+                    for name, url in named_urls:
+                        result[url.url] = contents.get(name)
+        return result
+
+    @contextlib.contextmanager
+    def open_url(self, url):
+        """
+        Open the remote file at the input URL for streamed reading.
+
+        The file is prefetched in windows of PREFETCH_WINDOW bytes, so
+        reads seldom wait for a round trip to the server.
+
+        :arg url: The URL to read from
+        :type url: conductor.urlparser.Url
+        :rtype: WindowedPrefetch
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        with self.pooled_session(url) as session:
+            try:
+                remote = session.sftp.open(url.path_part, "rb")
+                fh = WindowedPrefetch(remote, remote.stat().st_size)
+            except socket.error:
+                raise
+            except IOError as err:
+                raise errors.ResourceNotFoundError(err.args)
+            try:
+                yield fh
+            finally:
+                fh.close()
+
+    def list_directory(self, url):
+        """
+        Return the names of the entries of the remote directory at the URL.
+
+        :arg url: A URL whose path_part is a directory
+        :type url: conductor.urlparser.Url
+        :rtype: [str]
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        with self.pooled_session(url) as session:
+            try:
+                result = session.sftp.listdir(url.path_part)
+            except socket.error:
+                raise
+            except IOError as err:
+                raise errors.ResourceNotFoundError(err.args)
+        return result
+
+    def delete_urls(self, urls):
+        """
+        Delete the remote files at the input URLs.
+
+        One pooled session is used for all the URLs of the same host.
+
+        :arg urls: The URLs to delete
+        :type urls: [conductor.urlparser.Url]
+        :return: A mapping with each URL string as key and either None, if
+            the URL was deleted, or a message describing the error
+        :rtype: dict
+        :raises: conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        result = dict()
+        for host, directories in self.group_urls_by_directory(urls).items():
+            named_urls = [u for d in directories.values() for u in d]
+            with self.pooled_session(named_urls[0][1]) as session:
+                for name, url in named_urls:
+                    try:
+                        session.sftp.remove(url.path_part)
+                        result[url.url] = None
+                    except socket.error:
+                        raise
+                    except IOError as err:
+                        result[url.url] = str(err)
+        return result
+
+    @staticmethod
+    @contextlib.contextmanager
+    def pooled_session(url):
+        """
+        Context manager that provides a pooled SFTP session for the URL's host
+
+        Connection errors inside the managed block discard the session and
+        are raised as ResourceNotFoundError.
+
+        :type url: conductor.urlparser.Url
+        :rtype: SftpSession
+        :raises: conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError,
+            conductor.errors.ResourceNotFoundError
+        """
+
+        if paramiko is None:
+            raise errors.InvalidSchemeError(
+                "SFTP URLs need the paramiko package")
+        key = (url.host_name, int(url.port_number or SFTP_PORT),
+               url.user_name, url.user_password)
+        try:
+            session = sftp_session_pool.acquire(key)
+        except socket.gaierror as err:
+            logger.error("Server {} not found: {}".format(url.host_name, err))
+            raise errors.HostNotFoundError(
+                "Server {} not found".format(url.host_name))
+        except paramiko.AuthenticationException as err:
+            raise errors.InvalidUserCredentialsError(err.args)
+        except (paramiko.SSHException, socket.error, EOFError) as err:
+            # refused connections and rejected host keys
+            logger.error("Cannot connect to server {}:{}: {}".format(
+                key[0], key[1], err))
+            raise errors.HostNotFoundError(
+                "Cannot connect to server {}:{}: {}".format(key[0], key[1],
+                                                            err))
+        try:
+            yield session
+        except (paramiko.SSHException, socket.error, EOFError) as err:
+            # the session may be broken, do not reuse it
+            sftp_session_pool.release(key, session, reuse=False)
+            raise errors.ResourceNotFoundError(
+                "Transfer on server {}:{} failed: {!r}".format(
+                    key[0], key[1], err))
+        except Exception:
+            sftp_session_pool.release(key, session)
+            raise
+        else:
+            sftp_session_pool.release(key, session)
+
+    @staticmethod
+    def _makedirs(sftp, path):
+        try:
+            if stat.S_ISDIR(sftp.stat(path).st_mode):
+                return
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        parent = posixpath.dirname(path.rstrip("/"))
+        if parent not in ("", "/", path):
+            SftpUrlHandler._makedirs(sftp, parent)
+        try:
+            sftp.mkdir(path)
+        except IOError:
+            # another client may have created it meanwhile
+            if not stat.S_ISDIR(sftp.stat(path).st_mode):
+                raise
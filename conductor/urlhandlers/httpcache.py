@@ -0,0 +1,153 @@
+"""
+A local cache of HTTP resources that is revalidated with conditional requests
+
+Each cached URL keeps a copy of its body together with the validators that
+the server sent for it: the ETag, the Last-Modified date and the size. The
+validators are sent back in If-None-Match and If-Modified-Since headers, so
+that unchanged resources are answered with a small 304 Not Modified
+response instead of their whole body.
+"""
+
+import os
+import json
+import errno
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HttpCache(object):
+    """
+    Store the bodies and validators of HTTP resources, one directory per URL
+
+    :arg root: The directory where resources are cached. It defaults to
+        the `root` of the `http_cache` settings. Without a root the cache
+        is disabled
+    """
+
+    BODY = "body"
+    VALIDATORS = "validators.json"
+
+    def __init__(self, root=None):
+        self._root = root
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}({1.root!r})".format(__name__, self)
+
+    @property
+    def root(self):
+        return self._root or settings.http_cache.get("root")
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    def lookup(self, url):
+        """
+        Return the validators of a cached URL or None, if it is not cached.
+
+        Entries whose body is missing or does not have the recorded size
+        are ignored.
+
+        :type url: conductor.urlparser.Url
+        :rtype: dict
+        """
+
+        directory = self._get_directory(url)
+        try:
+            with open(os.path.join(directory, self.VALIDATORS)) as fh:
+                validators = json.load(fh)
+            size = os.path.getsize(os.path.join(directory, self.BODY))
+        except (IOError, OSError) as err:
+            if err.errno != errno.ENOENT:
+                raise
+            validators = None
+        except ValueError:
+            logger.warning("Ignoring corrupt cache entry for {}".format(
+                url.url))
+            validators = None
+        else:
+            if validators.get("size") not in (None, size):
+                validators = None
+        return validators
+
+    @staticmethod
+    def conditional_headers(validators):
+        """
+        Return the request headers that revalidate a cached entry.
+        """
+
+        headers = dict()
+        if validators is not None:
+            if validators.get("etag") is not None:
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified") is not None:
+                headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def body_path(self, url):
+        return os.path.join(self._get_directory(url), self.BODY)
+
+    def temporary_path(self, url):
+        """
+        Return a new path where the body of a URL can be downloaded to.
+
+        The path is unique, so concurrent downloads of the same URL do not
+        write over each other.
+        """
+
+        directory = self._get_directory(url)
+        try:
+            os.makedirs(directory)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        handle, path = tempfile.mkstemp(dir=directory, suffix=".part")
+        os.close(handle)
+        return path
+
+    def store(self, url, path, validators):
+        """
+        Make a downloaded body and its validators the cached entry of a URL.
+
+        The body is replaced before the validators. A concurrent lookup may
+        therefore see a new body with old validators, which only causes an
+        unneeded download, but never old contents with new validators.
+
+        :arg path: A path obtained from `temporary_path`
+        :return: The path of the cached body or None, if the validators
+            cannot be used for revalidation. In that case the input path is
+            left untouched
+        """
+
+        directory = self._get_directory(url)
+        if (validators.get("etag") is None and
+                validators.get("last_modified") is None):
+            return None
+        body = os.path.join(directory, self.BODY)
+        os.rename(path, body)
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        with os.fdopen(handle, "w") as fh:
+            json.dump(dict(validators, url=url.without_password().url), fh,
+                      sort_keys=True)
+        os.rename(temp_path, os.path.join(directory, self.VALIDATORS))
+        return body
+
+    def forget(self, url):
+        """
+        Remove the cached entry of a URL.
+        """
+
+        shutil.rmtree(self._get_directory(url), ignore_errors=True)
+
+    def _get_directory(self, url):
+        digest = hashlib.sha1(url.url.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+
+http_cache = HttpCache()
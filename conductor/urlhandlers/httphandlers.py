@@ -1,4 +1,506 @@
-from .base import BaseUrlHandler
+import os
+import os.path
+import base64
+import shutil
+import socket
+import urllib
+import urlparse
+import httplib
+import posixpath
+import contextlib
+import email.utils
+import logging
+
+from .. import errors
+from ..urlparser import Url
+from .base import BaseUrlHandler, TRANSFER_CHUNK_SIZE
+from . import compression
+from .httpcache import http_cache
+from .listings import ListingCache, parse_listing
+from .connectionpool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = 60  # seconds
+MAX_REDIRECTS = 5
+LISTING_TTL = 60  # seconds
+VALIDATOR_SUFFIX = ".validator"
+
+connection_pool = ConnectionPool(
+    lambda host_name, port_number: httplib.HTTPConnection(
+        host_name, port_number, timeout=TIMEOUT)
+)
+
+listing_cache = ListingCache(ttl=LISTING_TTL)
+
 
 class HttpUrlHandler(BaseUrlHandler):
-    pass
+    """
+    Handles URLs on HTTP servers.
+
+    Requests are sent over persistent connections that are kept in the
+    module's connection pool, so that consecutive requests to the same host
+    do not pay for new TCP connections. Bodies are streamed to and from disk
+    in chunks of TRANSFER_CHUNK_SIZE bytes.
+    """
+
+    def get_from_url(self, url, destination_directory, decompress=False):
+        """
+        Get the representation of the resource available at the input URL
+
+        The body is first written to a partial file next to the
+        destination. When a partial file is already there, left behind by
+        an interrupted download, only the missing bytes are requested with
+        a Range header.
+
+        When the HTTP cache is enabled the resource is instead revalidated
+        against its cached copy, which is only downloaded again if it
+        changed on the server.
+
+        :arg url: The URL to be searched
+        :type url: conductor.urlparser.Url
+        :arg destination_directory: Directory where the resource's
+            representation will be saved into
+        :type destination_directory: str
+        :arg decompress: Whether to decompress compressed files while they
+            are downloaded
+        :return: The full path to the representation that was retrieved
+            from the input URL
+        :rtype: str
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError,
+            conductor.errors.DecompressionError
+        """
+
+        self.create_local_directory(destination_directory)
+        name = posixpath.basename(url.path_part)
+        decompress = (decompress and
+                      compression.get_decompressor(name) is not None)
+        destination = os.path.join(destination_directory, name)
+        if http_cache.enabled:
+            source, cached = self._revalidate(url)
+            if decompress:
+                with open(source, "rb") as fh:
+                    destination = compression.save_stream(
+                        fh, destination_directory, name)
+                if not cached:
+                    os.remove(source)
+            elif cached:
+                shutil.copyfile(source, destination)
+            else:
+                shutil.move(source, destination)
+            return destination
+        if decompress:
+            with self.open_url(url) as response:
+                return compression.save_stream(response,
+                                               destination_directory, name)
+        partial = destination + ".part"
+        validator_path = partial + VALIDATOR_SUFFIX
+        offset, headers = 0, {}
+        if os.path.isfile(partial) and os.path.isfile(validator_path):
+            # a partial file is only resumed while the resource is unchanged
+            with open(validator_path) as fh:
+                validator = fh.read()
+            offset = os.path.getsize(partial)
+            headers = {"Range": "bytes={}-".format(offset),
+                       "If-Range": validator}
+        with self.request(url, headers=headers) as response:
+            if (response.status == httplib.REQUESTED_RANGE_NOT_SATISFIABLE or
+                    (response.status == httplib.PARTIAL_CONTENT and
+                     self._range_start(response) != offset)):
+                offset = None
+            else:
+                self.check_response(url, response)
+                if response.status != httplib.PARTIAL_CONTENT:
+                    offset = 0
+                    self._save_validator(response, validator_path)
+                self._save_body(response, partial, offset)
+        if offset is None:
+            # the partial file does not belong to the current resource
+            os.remove(partial)
+            os.remove(validator_path)
+            return self.get_from_url(url, destination_directory)
+        os.rename(partial, destination)
+        if os.path.isfile(validator_path):
+            os.remove(validator_path)
+        return destination
+
+    def post_to_url(self, url, path):
+        """
+        Send a local file to the input URL with a PUT request.
+
+        :arg url: A URL whose path_part is the destination directory
+        :type url: conductor.urlparser.Url
+        :arg path: The local file to send
+        :return: The path of the new remote file
+        :raises: conductor.errors.LocalPathNotFoundError,
+            conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError
+        """
+
+        try:
+            size = os.path.getsize(path)
+        except OSError as err:
+            raise errors.LocalPathNotFoundError(err.args)
+
+        def send_file(connection):
+            with open(path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(TRANSFER_CHUNK_SIZE), ""):
+                    connection.send(chunk)
+
+        destination = posixpath.join(url.path_part, os.path.basename(path))
+        with self.request(url.with_path(destination), "PUT",
+                          headers={"Content-Length": str(size)},
+                          body=send_file) as response:
+            response.read()
+            self.check_response(url, response)
+        self._invalidate_listing(url, url.path_part)
+        return destination
+
+    def stat_urls(self, urls):
+        """
+        Check whether each of the input URLs exists with HEAD requests.
+
+        The requests for the same host reuse a single pooled connection.
+        URLs that cannot be checked, because their server is unreachable or
+        answers HEAD requests with an error other than 404 or 410, are
+        reported with an unknown size and modification time.
+
+        :arg urls: The URLs to check
+        :type urls: [conductor.urlparser.Url]
+        :return: A mapping with each URL string as key and either a
+            (size, mtime) tuple or None. Either member of the tuple is None
+            when the server does not report it
+        :rtype: dict
+        """
+
+        result = dict()
+        for url in urls:
+            try:
+                with self.request(url, "HEAD") as response:
+                    response.read()
+            except errors.ConductorError as err:
+                logger.warning("Cannot check {}: {}".format(
+                    url.without_password().url, err))
+                info = (None, None)
+            else:
+                if response.status in (httplib.NOT_FOUND, httplib.GONE):
+                    info = None
+                elif response.status >= 300:
+                    logger.warning("Cannot check {}: {} {}".format(
+                        url.without_password().url, response.status,
+                        response.reason))
+                    info = (None, None)
+                else:
+                    info = self.response_info(response)
+            result[url.url] = info
+        return result
+
+    @contextlib.contextmanager
+    def open_url(self, url):
+        """
+        Open the resource at the input URL for streamed reading.
+
+        The connection goes back to the pool when the whole body has been
+        read. Otherwise it is closed.
+
+        :arg url: The URL to read from
+        :type url: conductor.urlparser.Url
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        with self.request(url) as response:
+            self.check_response(url, response)
+            yield response
+
+    def post_stream(self, url, name, stream):
+        """
+        Send the contents of a file-like object with a chunked PUT request.
+
+        :arg url: A URL whose path_part is the destination directory
+        :type url: conductor.urlparser.Url
+        :arg name: The name of the file to create in the destination
+        :arg stream: A file-like object opened for reading
+        :return: The path of the new remote file
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError
+        """
+
+        def send_chunks(connection):
+            for chunk in iter(lambda: stream.read(TRANSFER_CHUNK_SIZE), ""):
+                connection.send("{:x}\r\n".format(len(chunk)))
+                connection.send(chunk)
+                connection.send("\r\n")
+            connection.send("0\r\n\r\n")
+
+        destination = posixpath.join(url.path_part, name)
+        with self.request(url.with_path(destination), "PUT",
+                          headers={"Transfer-Encoding": "chunked"},
+                          body=send_chunks, retry=False) as response:
+            response.read()
+            self.check_response(url, response)
+        self._invalidate_listing(url, url.path_part)
+        return destination
+
+    def list_directory(self, url):
+        """
+        Return the names of the entries of a directory index page.
+
+        Both HTML autoindex pages and JSON listings are understood. Listings
+        are cached for LISTING_TTL seconds, so that many lookups in the same
+        directory share a single request.
+
+        :arg url: A URL whose path_part is a directory
+        :type url: conductor.urlparser.Url
+        :rtype: [str]
+        :raises: conductor.errors.ResourceNotFoundError,
+            conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.HostNotFoundError
+        """
+
+        directory_url = url.with_path(url.path_part.rstrip("/") + "/")
+
+        def load_listing():
+            with self.open_url(directory_url) as response:
+                return parse_listing(response, directory_url.url,
+                                     response.getheader("content-type"))
+
+        return listing_cache.get(directory_url.url, load_listing)
+
+    def delete_urls(self, urls):
+        """
+        Delete the resources at the input URLs with DELETE requests.
+
+        :arg urls: The URLs to delete
+        :type urls: [conductor.urlparser.Url]
+        :return: A mapping with each URL string as key and either None, if
+            the URL was deleted, or a message describing the error
+        :rtype: dict
+        """
+
+        result = dict()
+        for url in urls:
+            with self.request(url, "DELETE") as response:
+                response.read()
+                result[url.url] = None
+                if response.status >= 300:
+                    result[url.url] = "{} {}".format(response.status,
+                                                     response.reason)
+            self._invalidate_listing(url, posixpath.dirname(url.path_part))
+        return result
+
+    @contextlib.contextmanager
+    def request(self, url, method="GET", headers=None, body=None,
+                retry=True):
+        """
+        Context manager that sends a request and provides its response.
+
+        Redirections of GET and HEAD requests are followed. The status of
+        the response is not checked.
+
+        :arg url: The URL to request
+        :type url: conductor.urlparser.Url
+        :arg method: The HTTP method
+        :arg headers: Additional request headers
+        :arg body: A callable that receives the connection and sends the
+            body of the request
+        :arg retry: Whether the request can be sent again when a pooled
+            connection turns out to have been closed by the server
+        :rtype: httplib.HTTPResponse
+        :raises: conductor.errors.HostNotFoundError,
+            conductor.errors.ResourceNotFoundError
+        """
+
+        all_headers = self._authorization(url)
+        all_headers.update(headers or {})
+        origin = (url.host_name, int(url.port_number or httplib.HTTP_PORT))
+        for redirection in range(MAX_REDIRECTS + 1):
+            key = (url.host_name, int(url.port_number or httplib.HTTP_PORT))
+            if key != origin:
+                # credentials are never sent to another server
+                all_headers.pop("Authorization", None)
+            connection, response = self._send(key, method, url, all_headers,
+                                              body, retry)
+            location = response.getheader("location")
+            if (method not in ("GET", "HEAD") or location is None or
+                    response.status not in (301, 302, 303, 307, 308)):
+                break
+            response.read()
+            self._release(key, connection, response)
+            url = Url.from_string(urlparse.urljoin(url.url, location))
+            logger.debug("Following redirection to {}".format(url.url))
+        try:
+            yield response
+        except (httplib.HTTPException, socket.error) as err:
+            connection_pool.release(key, connection, reuse=False)
+            raise errors.ResourceNotFoundError(
+                "Transfer from server {}:{} failed: {!r}".format(
+                    key[0], key[1], err))
+        except Exception:
+            connection_pool.release(key, connection, reuse=False)
+            raise
+        else:
+            self._release(key, connection, response)
+
+    @staticmethod
+    def check_response(url, response):
+        """
+        Raise the conductor error that corresponds to an unsuccessful status
+
+        :raises: conductor.errors.InvalidUserCredentialsError,
+            conductor.errors.ResourceNotFoundError
+        """
+
+        message = "{} {}: {}".format(response.status, response.reason,
+                                     url.url)
+        if response.status in (httplib.UNAUTHORIZED, httplib.FORBIDDEN):
+            raise errors.InvalidUserCredentialsError(message)
+        elif response.status >= 300:
+            raise errors.ResourceNotFoundError(message)
+
+    @staticmethod
+    def response_info(response):
+        """
+        Return the (size, mtime) of the resource described by a response.
+        """
+
+        size = response.getheader("content-length")
+        modified = response.getheader("last-modified")
+        mtime = None
+        if modified is not None:
+            parsed = email.utils.parsedate_tz(modified)
+            mtime = email.utils.mktime_tz(parsed) if parsed else None
+        return int(size) if size is not None else None, mtime
+
+    def _revalidate(self, url):
+        """
+        Bring the cached copy of a URL up to date with a conditional request.
+
+        :return: A tuple with the path of the body and whether that path is
+            the cached copy. Resources that cannot be revalidated are not
+            cached and their path is a temporary file
+        """
+
+        validators = http_cache.lookup(url)
+        headers = http_cache.conditional_headers(validators)
+        with self.request(url, headers=headers) as response:
+            if (validators is not None and
+                    response.status == httplib.NOT_MODIFIED):
+                response.read()
+                logger.debug("{} is not modified".format(url.url))
+                return http_cache.body_path(url), True
+            self.check_response(url, response)
+            partial = http_cache.temporary_path(url)
+            try:
+                self._save_body(response, partial, 0)
+            except Exception:
+                os.remove(partial)
+                raise
+            validators = {
+                "etag": response.getheader("etag"),
+                "last_modified": response.getheader("last-modified"),
+                "size": os.path.getsize(partial),
+            }
+        body = http_cache.store(url, partial, validators)
+        return (body, True) if body is not None else (partial, False)
+
+    @staticmethod
+    def _save_body(response, path, offset):
+        expected = response.getheader("content-length")
+        with open(path, "ab" if offset else "wb") as fh:
+            for chunk in iter(lambda: response.read(TRANSFER_CHUNK_SIZE), ""):
+                fh.write(chunk)
+            written = fh.tell() - offset
+        if expected is not None and written != int(expected):
+            # the partial file is kept so that the download can be resumed
+            raise errors.ResourceNotFoundError(
+                "Incomplete download of {}: got {} of {} bytes".format(
+                    path, written, expected))
+
+    @staticmethod
+    def _range_start(response):
+        content_range = response.getheader("content-range", "")
+        try:
+            return int(content_range.split()[1].partition("-")[0])
+        except (IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_validator(response, path):
+        """
+        Remember the validator that a resumed download sends in If-Range.
+
+        Weak ETags cannot be used in If-Range. Without any validator the
+        download is started over instead of being resumed.
+        """
+
+        validator = response.getheader("etag")
+        if validator is None or validator.startswith("W/"):
+            validator = response.getheader("last-modified")
+        if validator is not None:
+            with open(path, "w") as fh:
+                fh.write(validator)
+        elif os.path.isfile(path):
+            os.remove(path)
+
+    @staticmethod
+    def _authorization(url):
+        headers = dict()
+        if url.user_name is not None:
+            credentials = "{}:{}".format(url.user_name,
+                                         url.user_password or "")
+            headers["Authorization"] = "Basic {}".format(
+                base64.b64encode(credentials))
+        return headers
+
+    @staticmethod
+    def _send(key, method, url, headers, body, retry):
+        target = urllib.quote(url.path_part or "/")
+        if url.query_part != "":
+            target = "{}?{}".format(target, url.query_part)
+        attempts = 2 if retry else 1
+        for attempt in range(attempts):
+            connection = connection_pool.acquire(key)
+            try:
+                connection.putrequest(method, target,
+                                      skip_accept_encoding=True)
+                for name, value in headers.items():
+                    connection.putheader(name, value)
+                connection.endheaders()
+                if body is not None:
+                    body(connection)
+                return connection, connection.getresponse()
+            except socket.gaierror as err:
+                connection_pool.release(key, connection, reuse=False)
+                logger.error("Server {} not found: {}".format(key[0], err))
+                raise errors.HostNotFoundError(
+                    "Server {} not found".format(key[0]))
+            except (httplib.HTTPException, socket.error) as err:
+                # pooled connections may have been closed by the server
+                connected = connection.sock is not None
+                connection_pool.release(key, connection, reuse=False)
+                if attempt < attempts - 1:
+                    logger.debug("Retrying {} {}: {!r}".format(
+                        method, target, err))
+                elif not connected:
+                    logger.error("Cannot connect to server {}:{}: {}".format(
+                        key[0], key[1], err))
+                    raise errors.HostNotFoundError(
+                        "Cannot connect to server {}:{}".format(*key))
+                else:
+                    raise errors.ResourceNotFoundError(
+                        "{} {} on server {}:{} failed: {!r}".format(
+                            method, target, key[0], key[1], err))
+
+    @staticmethod
+    def _invalidate_listing(url, directory):
+        listing_cache.invalidate(
+            url.with_path(directory.rstrip("/") + "/").url)
+
+    @staticmethod
+    def _release(key, connection, response):
+        reuse = response.isclosed() and not response.will_close
+        connection_pool.release(key, connection, reuse=reuse)
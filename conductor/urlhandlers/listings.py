@@ -0,0 +1,143 @@
+"""
+Parsing and caching of directory listings served over HTTP
+
+Web servers list directories either as HTML pages, like the ones produced
+by Apache's mod_autoindex or nginx's autoindex module, or as JSON documents,
+like nginx's `autoindex_format json`. The HTML is parsed incrementally while
+it is downloaded, so large listings are never held in memory as a whole.
+"""
+
+import json
+import time
+import codecs
+import urllib
+import urlparse
+import posixpath
+import threading
+import HTMLParser
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AutoindexParser(HTMLParser.HTMLParser):
+    """
+    Collect the entries that an HTML directory listing links to.
+
+    Only links that point to direct children of the listed directory are
+    kept. This skips the parent directory, column sorting links and links
+    to other sites.
+
+    :arg directory_url: The URL of the listed directory. It must end with
+        a slash
+    """
+
+    def __init__(self, directory_url):
+        HTMLParser.HTMLParser.__init__(self)
+        self.directory_url = directory_url
+        self.directory = urlparse.urlsplit(directory_url).path
+        self.names = []
+        self._seen = set()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.add_href(href)
+
+    def add_href(self, href):
+        target = urlparse.urlsplit(urlparse.urljoin(self.directory_url, href))
+        base = urlparse.urlsplit(self.directory_url)
+        if (target.query or target.netloc != base.netloc or
+                target.path.rstrip("/") == self.directory.rstrip("/")):
+            return
+        parent, name = posixpath.split(target.path.rstrip("/"))
+        if parent.rstrip("/") == self.directory.rstrip("/"):
+            name = urllib.unquote(name)
+            if name not in self._seen:
+                self._seen.add(name)
+                self.names.append(name)
+
+
+def parse_listing(stream, directory_url, content_type=None,
+                  chunk_size=64 * 1024):
+    """
+    Return the names of the entries of a directory listing.
+
+    :arg stream: A file-like object with the listing
+    :arg directory_url: The URL of the listed directory. It must end with
+        a slash
+    :arg content_type: The Content-Type of the listing. JSON listings are
+        recognized by it, everything else is parsed as HTML
+    :rtype: [str]
+    """
+
+    if content_type is not None and "json" in content_type:
+        entries = json.load(stream)
+        if isinstance(entries, dict):
+            entries = entries.get("entries", entries.get("files", []))
+        result = []
+        for entry in entries:
+            name = entry.get("name") if isinstance(entry, dict) else entry
+            if name not in (None, "", ".", ".."):
+                result.append(name.rstrip("/"))
+    else:
+        parser = AutoindexParser(directory_url)
+        # characters may be split across chunks
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        for chunk in iter(lambda: stream.read(chunk_size), ""):
+            parser.feed(decoder.decode(chunk))
+        parser.feed(decoder.decode("", final=True))
+        parser.close()
+        result = parser.names
+    return result
+
+
+class ListingCache(object):
+    """
+    A thread safe cache of directory listings that expire after a while.
+
+    Concurrent requests for the same listing wait for a single load
+    instead of loading it once each.
+
+    :arg ttl: Number of seconds a listing is reused for
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._listings = dict()
+        self._locks = dict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "{0}.{1.__class__.__name__}(ttl={1.ttl!r})".format(
+            __name__, self)
+
+    def get(self, key, loader):
+        """
+        Return the cached listing for the key, loading it when needed.
+
+        :arg key: Identifies the listing, usually the directory's URL
+        :arg loader: A callable without arguments that returns the listing
+        """
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            loaded_at, listing = self._listings.get(key, (None, None))
+            if loaded_at is None or time.time() - loaded_at > self.ttl:
+                logger.debug("Loading listing of {}".format(key))
+                listing = loader()
+                self._listings[key] = time.time(), listing
+        return list(listing)
+
+    def invalidate(self, key=None):
+        """
+        Forget the listing of the key or, without a key, every listing.
+        """
+
+        with self._lock:
+            if key is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(key, None)
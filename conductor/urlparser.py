@@ -109,6 +109,28 @@ class Url(object):
     def __str__(self):
         return self.url
 
+    def with_path(self, path_part):
+        """
+        Return a new URL with the same scheme and authority and another path.
+        """
+
+        return Url(self.scheme, host_name=self.host_name,
+                   port_number=self.port_number, user_name=self.user_name,
+                   user_password=self.user_password, path_part=path_part)
+
+    def without_password(self):
+        """
+        Return a copy of the URL without the user's password.
+
+        URLs are written to disk in this form, so that passwords are never
+        stored in plain text.
+        """
+
+        return Url(self.scheme, host_name=self.host_name,
+                   port_number=self.port_number, user_name=self.user_name,
+                   path_part=self.path_part, hash_part=self.hash_part,
+                   **self.query_params)
+
     @classmethod
     def from_string(cls, url):
         hash_part, dehashed = cls.extract_hash_part(url)
@@ -23,6 +23,8 @@ setup(
             'installhdf5:main',
             'install_giosystem_algorithms = giosystemcore.'
             'scripts.installalgorithms:main',
+            'conductor_backfill = conductor.tasks.backfill:main',
+            'conductor_worker = conductor.tasks.workqueue:main',
         ],
     },
     include_package_data=True,
@@ -31,5 +33,10 @@ setup(
         "ftputil",
         "enum34",  # python 3.4 enum class backported to earlier versions
         "python-dateutil",
-    ]
+    ],
+    extras_require={
+        "numpy": ["numpy"],  # vectorized timeslot evaluation
+        "xz": ["backports.lzma"],  # xz decompression on python 2
+        "sftp": ["paramiko"],  # SFTP URLs
+    },
 )
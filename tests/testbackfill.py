@@ -0,0 +1,93 @@
+"""
+Unit tests for conductor's backfill module
+"""
+
+import os
+import json
+import shutil
+import datetime
+import tempfile
+
+import mock
+from nose import tools
+
+from conductor import tracing
+from conductor.settings import settings
+from conductor.tasks import backfill
+from conductor.tasks import timeslotdisplacement as tsd
+
+
+def _fake_run(task, mode):
+    if task.timeslot.hour == 3:
+        raise ValueError("fake failure")
+    return os.getpid()
+
+
+class TestBackfill(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.schedule = tsd.TimeslotSchedule(
+            datetime.datetime(2015, 1, 1), end=datetime.datetime(2015, 1, 1, 5),
+            frequency_hours=1)
+
+    def setup(self):
+        settings.tasks = [{"name": "fake task", "urn": "fake:urn"}]
+
+    def teardown(self):
+        settings.tasks = []
+
+    def _check_report(self, report):
+        tools.eq_([o.timeslot for o in report.outcomes], list(self.schedule))
+        tools.eq_([o.timeslot.hour for o in report.failed], [3])
+        tools.assert_in("fake failure", report.failed[0].details)
+        tools.eq_(len(report.succeeded), 5)
+        tools.assert_true(report.throughput > 0)
+
+    @mock.patch("conductor.tasks.tasks.Task.run", _fake_run)
+    def test_backfill_processes(self):
+        """Timeslots are run on a pool of processes."""
+
+        self._check_report(backfill.backfill("fake task", self.schedule,
+                                             jobs=2))
+
+    @mock.patch("conductor.tasks.tasks.Task.run", _fake_run)
+    def test_backfill_single_job(self):
+        """A single job runs in the current process."""
+
+        self._check_report(backfill.backfill("fake task", self.schedule))
+
+    @mock.patch("conductor.tasks.tasks.Task.run", _fake_run)
+    def test_backfill_trace(self):
+        """Spans from every worker are exported to a single trace."""
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "trace.json")
+            backfill.backfill("fake task", self.schedule, jobs=2,
+                              trace_path=path)
+            with open(path) as fh:
+                events = json.load(fh)["traceEvents"]
+        finally:
+            shutil.rmtree(directory)
+        tools.eq_(sorted(e["args"]["timeslot"] for e in events),
+                  ["201501010{}00".format(h) for h in range(6)])
+        tools.assert_false(tracing.tracer.enabled)
+
+    def test_backfill_reloads_run_modes(self):
+        """Run modes from a previous backfill are not reused."""
+
+        stale_mode = mock.Mock()
+        backfill._run_modes[("fake task", "CREATION_MODE")] = stale_mode
+        with mock.patch("conductor.tasks.tasks.Task.run", _fake_run):
+            backfill.backfill("fake task", self.schedule)
+        tools.eq_(stale_mode.run.call_count, 0)
+
+    def test_backfill_restores_tracing(self):
+        """Tracing is restored when the backfill is interrupted."""
+
+        with mock.patch("conductor.tasks.backfill._run_timeslot",
+                        side_effect=KeyboardInterrupt):
+            tools.assert_raises(KeyboardInterrupt, backfill.backfill,
+                                "fake task", self.schedule, trace_path="x")
+        tools.assert_false(tracing.tracer.enabled)
@@ -0,0 +1,123 @@
+"""
+Unit tests for conductor's compression module
+"""
+
+import io
+import os
+import bz2
+import gzip
+import shutil
+import zipfile
+import tempfile
+
+import mock
+from nose import tools
+
+from conductor import errors
+from conductor.urlhandlers import compression
+from conductor.urlhandlers.filehandlers import FileUrlHandler
+from conductor.urlparser import Url
+
+
+class TestCompression(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.data = b"".join(b"line {}\n".format(i) for i in range(2000))
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def _gzip(self, data):
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode="wb") as fh:
+            fh.write(data)
+        return buf.getvalue()
+
+    def _zip(self, data, method):
+        buf = io.BytesIO()
+        archive = zipfile.ZipFile(buf, "w", method)
+        archive.writestr("inner/entry.txt", data)
+        archive.writestr("other.txt", b"ignored")
+        archive.close()
+        return buf.getvalue()
+
+    def _decompress(self, name, compressed):
+        out = io.BytesIO()
+        decompressor = compression.get_decompressor(name)
+        # small chunks exercise headers and members split across reads
+        with mock.patch.object(compression, "TRANSFER_CHUNK_SIZE", 7):
+            compression.copy_stream(io.BytesIO(compressed), out,
+                                    decompressor)
+        return out.getvalue(), decompressor
+
+    def test_gzip_members(self):
+        """Concatenated gzip members are decompressed."""
+
+        half = len(self.data) // 2
+        compressed = (self._gzip(self.data[:half]) +
+                      self._gzip(self.data[half:]))
+        tools.eq_(self._decompress("a.gz", compressed)[0], self.data)
+
+    def test_bz2(self):
+        tools.eq_(self._decompress("a.bz2", bz2.compress(self.data))[0],
+                  self.data)
+
+    def test_zip(self):
+        """The first entry of zip archives is extracted."""
+
+        for method in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+            result, decompressor = self._decompress(
+                "a.zip", self._zip(self.data, method))
+            tools.eq_(result, self.data)
+            tools.eq_(compression.decompressed_name("a.zip", decompressor),
+                      "entry.txt")
+
+    def test_unknown_extension(self):
+        tools.assert_is_none(compression.get_decompressor("a.txt"))
+        tools.eq_(compression.decompressed_name("a.txt"), "a.txt")
+        tools.eq_(compression.decompressed_name("a.tif.gz"), "a.tif")
+
+    def test_file_handler_decompresses(self):
+        """Local files are decompressed while they are copied."""
+
+        source = os.path.join(self.directory, "source.dat.gz")
+        with open(source, "wb") as fh:
+            fh.write(self._gzip(self.data))
+        destination = os.path.join(self.directory, "out")
+        path = FileUrlHandler().get_from_url(Url.from_string(source),
+                                             destination, decompress=True)
+        tools.eq_(path, os.path.join(destination, "source.dat"))
+        with open(path, "rb") as fh:
+            tools.eq_(fh.read(), self.data)
+
+    def test_corrupt_data(self):
+        """Corrupt data raises an error and leaves no partial files."""
+
+        tools.assert_raises(errors.DecompressionError,
+                            compression.save_stream,
+                            io.BytesIO(b"not compressed at all"),
+                            self.directory, "bad.gz")
+        tools.eq_(os.listdir(self.directory), [])
+
+    def test_truncated_data(self):
+        """Truncated compressed data is rejected."""
+
+        compressed = {
+            "a.gz": self._gzip(self.data),
+            "a.bz2": bz2.compress(self.data),
+            "a.zip": self._zip(self.data, zipfile.ZIP_DEFLATED),
+            "b.zip": self._zip(self.data, zipfile.ZIP_STORED),
+        }
+        for name, data in compressed.items():
+            end = len(data) // 2
+            tools.assert_raises(errors.DecompressionError,
+                                self._decompress, name, data[:end])
+        tools.assert_raises(errors.DecompressionError,
+                            compression.save_stream,
+                            io.BytesIO(compressed["a.gz"][:-10]),
+                            self.directory, "cut.gz")
+        tools.eq_(os.listdir(self.directory), [])
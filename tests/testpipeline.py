@@ -0,0 +1,89 @@
+"""
+Unit tests for conductor's pipeline module
+"""
+
+import os
+import datetime
+import threading
+
+import mock
+from nose import tools
+
+from conductor.settings import settings
+from conductor.tasks import pipeline
+from conductor.tasks import timeslotdisplacement as tsd
+from conductor.tasks.taskresources import TaskResource
+
+_lock = threading.Lock()
+_fetched = []
+_executed = []
+
+
+def _fake_fetch(task_resource, directory, decompress=False):
+    path = os.path.join(directory, task_resource.resource.timeslot_string)
+    with open(path, "w") as fh:
+        fh.write("x" * 10)
+    with _lock:
+        _fetched.append(task_resource.resource.timeslot)
+    return path
+
+
+def _fake_execute(task, fetched):
+    with _lock:
+        latest = max(_fetched)
+    _executed.append((task.timeslot, sorted(os.path.basename(p) for p in
+                                            fetched.values()), latest))
+    for path in fetched.values():
+        tools.assert_true(os.path.isfile(path))
+
+
+class TestPipelinedRunner(object):
+
+    def setup(self):
+        del _fetched[:]
+        del _executed[:]
+        settings.resources = [{"name": "raw",
+                               "urn": "urn:raw:{0.timeslot_string}",
+                               "local_pattern": "raw"}]
+        settings.tasks = [{
+            "name": "rolling", "urn": "urn:rolling",
+            "inputs": [{"name": "raw", "generate_multiple_timeslots": {
+                "frequency": -1, "number_of_timeslots": 3}}],
+        }]
+        self.schedule = tsd.TimeslotSchedule(
+            datetime.datetime(2015, 1, 1, 2), count=4, frequency_hours=1)
+
+    def teardown(self):
+        settings.resources = []
+        settings.tasks = []
+
+    @mock.patch("conductor.tasks.tasks.Task.execute", _fake_execute)
+    @mock.patch.object(TaskResource, "fetch", _fake_fetch)
+    def test_reuses_overlapping_inputs(self):
+        """Inputs shared by consecutive timeslots are fetched once."""
+
+        runner = pipeline.PipelinedRunner("rolling", self.schedule,
+                                          prefetch_depth=2)
+        report = runner.run()
+        tools.eq_(len(report.succeeded), 4)
+        tools.eq_(sorted(_fetched), [datetime.datetime(2015, 1, 1, h) for
+                                     h in range(6)])
+        tools.eq_(runner.cache.hits, 6)
+        tools.eq_([e[0].hour for e in _executed], [2, 3, 4, 5])
+        tools.eq_(_executed[-1][1], ["201501010300", "201501010400",
+                                     "201501010500"])
+        tools.eq_(runner.cache.size, 0)
+
+    @mock.patch("conductor.tasks.tasks.Task.execute", _fake_execute)
+    @mock.patch.object(TaskResource, "fetch", _fake_fetch)
+    def test_disk_budget(self):
+        """Fetching ahead pauses while the cache is over its budget."""
+
+        runner = pipeline.PipelinedRunner("rolling", self.schedule,
+                                          prefetch_depth=3, disk_budget=0)
+        report = runner.run()
+        tools.eq_(len(report.succeeded), 4)
+        tools.eq_(len(_fetched), 6)
+        for timeslot, names, latest in _executed:
+            tools.assert_true(latest <= timeslot + datetime.timedelta(
+                hours=1))
@@ -0,0 +1,51 @@
+"""
+Unit tests for conductor's resourcelocations module
+"""
+
+import datetime
+
+from nose import tools
+
+from conductor import ConductorScheme
+from conductor.resources.resources import Resource
+from conductor.resources.resourcelocations import ResourceLocation
+from conductor.servers import Server, ServerScheme
+
+
+class TestResourceLocation(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.timeslot = datetime.datetime(2015, 1, 1, 12)
+        scheme = ServerScheme("file", ["/fake/base", "/fake/base/",
+                                       "/other/base"])
+        cls.server = Server("fake server", domain="localhost",
+                            schemes_get=[scheme])
+
+    def setup(self):
+        self.resource = Resource("fake", "fake:urn", "fake_pattern",
+                                 timeslot=self.timeslot)
+        self.location = ResourceLocation(
+            ["{0.timeslot.year}/file_{0.timeslot_string}"], None,
+            server=self.server, scheme=ConductorScheme.FILE,
+            parent=self.resource
+        )
+
+    def test_create_urls_drops_duplicates(self):
+        """URLs from overlapping base paths are only created once."""
+
+        urls = self.location.create_urls()
+        tools.eq_([u.path_part for u in urls],
+                  ["/fake/base/2015/file_201501011200",
+                   "/other/base/2015/file_201501011200"])
+
+    def test_create_urls_cache(self):
+        """URLs are cached until the parent resource's state changes."""
+
+        first = self.location.create_urls()
+        second = self.location.create_urls()
+        tools.assert_is(first[0], second[0])
+        self.resource.timeslot = datetime.datetime(2016, 1, 1)
+        third = self.location.create_urls()
+        tools.assert_is_not(first[0], third[0])
+        tools.eq_(third[0].path_part, "/fake/base/2016/file_201601010000")
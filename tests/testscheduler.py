@@ -0,0 +1,94 @@
+"""
+Unit tests for conductor's scheduler module
+"""
+
+import datetime
+import threading
+
+import mock
+from nose import tools
+
+from conductor import errors
+from conductor.settings import settings
+from conductor.tasks import scheduler
+
+_lock = threading.Lock()
+_ran = []
+
+
+def _fake_run(task, mode):
+    with _lock:
+        _ran.append((task.name, task.timeslot))
+    if task.name == "level1" and task.timeslot.hour == 1:
+        raise ValueError("fake failure")
+
+
+class TestTaskScheduler(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.timeslots = [datetime.datetime(2015, 1, 1, h) for h in range(3)]
+
+    def setup(self):
+        del _ran[:]
+        settings.resources = [
+            {"name": n, "urn": "urn:fake:{}:{{0.timeslot_string}}".format(n),
+             "local_pattern": n} for n in ("raw", "level1", "level2")
+        ]
+        settings.tasks = [
+            {"name": "level2", "urn": "urn:level2",
+             "inputs": [{"name": "level1"}], "outputs": [{"name": "level2"}]},
+            {"name": "level1", "urn": "urn:level1", "expected_duration": 5,
+             "inputs": [{"name": "raw"}], "outputs": [{"name": "level1"}]},
+            {"name": "independent", "urn": "urn:independent",
+             "inputs": [{"name": "raw"}]},
+        ]
+
+    def teardown(self):
+        settings.resources = []
+        settings.tasks = []
+
+    def test_build_graph(self):
+        """Tasks depend on the producers of their inputs."""
+
+        s = scheduler.TaskScheduler(["level2", "level1", "independent"],
+                                    self.timeslots)
+        nodes = s.build_graph()
+        tools.eq_(len(nodes), 9)
+        for ts in self.timeslots:
+            level2 = nodes[("level2", ts)]
+            tools.eq_([n.key for n in level2.upstream], [("level1", ts)])
+            tools.eq_(nodes[("independent", ts)].upstream, set())
+            tools.eq_(nodes[("level1", ts)].priority, 6)
+        order = [n.key for n in s.topological_order()]
+        for ts in self.timeslots:
+            tools.assert_true(order.index(("level1", ts)) <
+                              order.index(("level2", ts)))
+
+    @mock.patch("conductor.tasks.tasks.Task.run", _fake_run)
+    def test_run(self):
+        """Downstream tasks run after their upstream and skip failures."""
+
+        s = scheduler.TaskScheduler(["level2", "level1", "independent"],
+                                    self.timeslots, max_workers=1)
+        outcomes = s.run()
+        tools.eq_(len(outcomes), 9)
+        # the critical path goes first
+        tools.eq_(_ran[0][0], "level1")
+        for ts in self.timeslots:
+            if ts.hour != 1:
+                tools.assert_true(_ran.index(("level1", ts)) <
+                                  _ran.index(("level2", ts)))
+        failed = sorted(k for k, o in outcomes.items() if not o.success)
+        tools.eq_(failed, [("level1", self.timeslots[1]),
+                           ("level2", self.timeslots[1])])
+        tools.assert_not_in(("level2", self.timeslots[1]), _ran)
+        tools.assert_in("upstream",
+                        outcomes[("level2", self.timeslots[1])].details)
+
+    def test_cycle(self):
+        """Cyclic dependencies are rejected."""
+
+        settings.tasks[1]["inputs"] = [{"name": "level2"}]
+        s = scheduler.TaskScheduler(["level2", "level1"], self.timeslots[:1])
+        tools.assert_raises(errors.TaskDependencyCycleError, s.build_graph)
@@ -2,7 +2,10 @@
 Unit tests for conductor's servers module
 """
 
+import time
 import logging
+import threading
+
 import mock
 from nose import tools
 
@@ -43,3 +46,45 @@ class TestServer(object):
 
     def test_post_representation(self):
         raise NotImplementedError
+
+
+class TestConnectionSlots(object):
+
+    def _run_concurrently(self, server, workers=6):
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def transfer():
+            with server.connection_slot():
+                with lock:
+                    state["active"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                time.sleep(0.02)
+                with lock:
+                    state["active"] -= 1
+
+        threads = [threading.Thread(target=transfer) for i in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return state["peak"]
+
+    def test_max_connections(self):
+        """Server instances with the same name share their slots."""
+
+        first = conductor.servers.Server("limited", max_connections=2)
+        second = conductor.servers.Server("limited", max_connections=2)
+        peak = self._run_concurrently(first)
+        tools.assert_true(peak <= 2)
+        with first.connection_slot():
+            with second.connection_slot():
+                tools.assert_false(
+                    conductor.servers._connection_slots[
+                        ("limited", 2)].acquire(False))
+
+    def test_unlimited(self):
+        """Servers without max_connections do not wait for slots."""
+
+        server = conductor.servers.Server("unlimited")
+        tools.eq_(self._run_concurrently(server, workers=4), 4)
@@ -0,0 +1,112 @@
+"""
+Unit tests for conductor's taskobserver module
+"""
+
+import io
+import json
+import time
+import datetime
+import threading
+
+from nose import tools
+
+from conductor.settings import settings
+from conductor.tasks import taskobserver
+from conductor.tasks import tasks
+
+
+def _event(progress, state="running"):
+    return taskobserver.TaskEvent("fake task", datetime.datetime(2015, 1, 1),
+                                  progress, state, "", time.time())
+
+
+class TestEventBus(object):
+
+    def test_coalesces_events(self):
+        """Only the latest pending event of each source is delivered."""
+
+        bus = taskobserver.EventBus(max_rate=0)
+        received = []
+        # block the dispatcher so that events accumulate
+        bus._delivery_lock.acquire()
+        try:
+            for progress in range(50):
+                bus.publish("first", [received.append], _event(progress))
+            bus.publish("second", [received.append], _event(7))
+        finally:
+            bus._delivery_lock.release()
+        bus.flush()
+        deadline = time.time() + 2
+        while len(received) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        tools.eq_([e.run_progress for e in received], [49, 7])
+
+    def test_delivers_off_thread(self):
+        """Observers are called from the dispatcher thread."""
+
+        bus = taskobserver.EventBus()
+        delivered = threading.Event()
+        threads = []
+
+        def observer(event):
+            threads.append(threading.current_thread())
+            delivered.set()
+
+        bus.publish("key", [observer], _event(1))
+        delivered.wait(2)
+        tools.eq_(len(threads), 1)
+        tools.assert_not_equal(threads[0], threading.current_thread())
+
+    def test_max_rate_setting(self):
+        """The rate of deliveries is taken from the settings by default."""
+
+        bus = taskobserver.EventBus()
+        tools.eq_(bus.max_rate, taskobserver.MAX_RATE)
+        settings.events = {"max_rate": 2}
+        try:
+            tools.eq_(bus.max_rate, 2)
+            tools.eq_(taskobserver.EventBus(max_rate=5).max_rate, 5)
+        finally:
+            settings.events = dict()
+
+    def test_task_run_flushes(self):
+        """Events published during a run are delivered when it returns."""
+
+        stream = io.BytesIO()
+        task = tasks.Task("fake task", "fake:urn",
+                          datetime.datetime(2015, 1, 1))
+        task._run_observers = []
+        task.add_observer(taskobserver.JsonLinesObserver(stream))
+
+        def fake_run(mode, preflight, force):
+            task.run_state = "finished"
+
+        task._run = fake_run
+        # pretend that a dispatcher is running, so that only the flush
+        # delivers the event
+        dispatcher = taskobserver.event_bus._dispatcher
+        taskobserver.event_bus._dispatcher = threading.current_thread()
+        try:
+            task.run(None)
+        finally:
+            taskobserver.event_bus._dispatcher = dispatcher
+        tools.eq_(json.loads(stream.getvalue().splitlines()[-1])[
+            "run_state"], "finished")
+
+    def test_task_publishes(self):
+        """Task setters publish events instead of calling observers."""
+
+        stream = io.BytesIO()
+        task = tasks.Task("fake task", "fake:urn",
+                          datetime.datetime(2015, 1, 1))
+        task._run_observers = []
+        task.add_observer(taskobserver.JsonLinesObserver(stream))
+        task.run_progress = 50
+        task.run_state = "running"
+        taskobserver.event_bus.flush()
+        lines = stream.getvalue().splitlines()
+        tools.assert_true(len(lines) >= 1)
+        record = json.loads(lines[-1])
+        tools.eq_(record["run_progress"], 50)
+        tools.eq_(record["run_state"], "running")
+        tools.eq_(record["timeslot"], "201501010000")
@@ -0,0 +1,63 @@
+"""
+Unit tests for conductor's taskresources module
+"""
+
+import datetime
+
+import mock
+from nose import tools
+
+from conductor.resources.resources import Resource
+from conductor.tasks import taskresources
+from conductor.tasks import timeslotdisplacement
+
+
+class TestTaskResource(object):
+
+    @classmethod
+    def setup_class(cls):
+        start = datetime.datetime(2015, 1, 1)
+        cls.timeslots = [start + datetime.timedelta(hours=7 * i)
+                         for i in range(500)]
+        cls.except_when = {"hour": [1, 2, 3], "dekade": [2]}
+        cls.optional_when = {"month": [2], "day": [31]}
+
+    def _scalar_flags(self):
+        active = []
+        optional = []
+        for ts in self.timeslots:
+            resource = Resource("fake", "fake:urn", "fake", timeslot=ts)
+            tr = taskresources.TaskResource(resource,
+                                            except_when=self.except_when,
+                                            optional_when=self.optional_when)
+            active.append(tr.active)
+            optional.append(tr.optional)
+        return active, optional
+
+    def test_active_optional(self):
+        """Active and optional flags follow the conditions."""
+
+        resource = Resource("fake", "fake:urn", "fake",
+                            timeslot=datetime.datetime(2015, 2, 15, 2))
+        tr = taskresources.TaskResource(resource,
+                                        except_when=self.except_when,
+                                        optional_when=self.optional_when)
+        tools.assert_false(tr.active)
+        tools.assert_true(tr.optional)
+        resource.timeslot = datetime.datetime(2015, 3, 1, 12)
+        tools.assert_true(tr.active)
+        tools.assert_false(tr.optional)
+
+    def test_evaluate(self):
+        """Batch evaluation matches the per-timeslot properties."""
+
+        tr = taskresources.TaskResource(None, except_when=self.except_when,
+                                        optional_when=self.optional_when)
+        expected_active, expected_optional = self._scalar_flags()
+        active, optional = tr.evaluate(self.timeslots)
+        tools.eq_(list(active), expected_active)
+        tools.eq_(list(optional), expected_optional)
+        with mock.patch.object(timeslotdisplacement, "np", None):
+            active, optional = tr.evaluate(self.timeslots)
+        tools.eq_(active, expected_active)
+        tools.eq_(optional, expected_optional)
@@ -0,0 +1,227 @@
+"""
+Unit tests for conductor's taskrunmode module
+"""
+
+import os
+import errno
+import shutil
+import tempfile
+import datetime
+
+import mock
+from nose import tools
+
+from conductor import ConductorScheme
+from conductor import errors
+from conductor import ServerSchemeMethod
+from conductor import TaskResourceRole
+from conductor.resources.resources import Resource
+from conductor.resources.resourcelocations import ResourceLocation
+from conductor.servers import Server, ServerScheme
+from conductor.settings import settings
+from conductor.tasks import taskrunmode
+from conductor.tasks.taskresources import TaskResource
+from conductor.tasks.tasks import Task
+from conductor.urlparser import Url
+
+
+class TestDeletionMode(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.timeslot = datetime.datetime(2015, 1, 1, 12)
+
+    def setup(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.server = Server(
+            "local", domain="localhost",
+            schemes_get=[ServerScheme("file", [
+                os.path.join(self.data_dir, "get")])],
+            schemes_post=[ServerScheme("file", [
+                os.path.join(self.data_dir, "post")])],
+        )
+        self.task = Task("fake task", "fake:urn", self.timeslot)
+        resource = Resource("out", "fake:{0.timeslot_string}",
+                            r"out_{0.timeslot_string}\.txt",
+                            timeslot=self.timeslot)
+        for method, path in [
+                (ServerSchemeMethod.GET,
+                 "{0.timeslot.year}/out_{0.timeslot_string}.txt"),
+                (ServerSchemeMethod.POST, "{0.timeslot.year}")]:
+            rl = ResourceLocation([path], None, server=self.server,
+                                  scheme=ConductorScheme.FILE,
+                                  location_for=method, parent=resource)
+            resource.add_location(rl, method)
+        self.task.add_task_resource(TaskResource(resource),
+                                    TaskResourceRole.OUTPUT)
+        self.expected = []
+        for base in ("get", "post"):
+            directory = os.path.join(self.data_dir, base, "2015")
+            os.makedirs(directory)
+            for hour in (10, 11, 12, 13):
+                path = os.path.join(
+                    directory, "out_20150101{}00.txt".format(hour))
+                with open(path, "w") as fh:
+                    fh.write("fake")
+                if hour != 13:
+                    self.expected.append("file://localhost{}".format(path))
+            with open(os.path.join(directory, "unrelated.txt"), "w") as fh:
+                fh.write("fake")
+
+    def teardown(self):
+        shutil.rmtree(self.data_dir)
+        self.task.clean_temporary_resources()
+
+    def test_dry_run(self):
+        """Dry runs report the files to delete and keep them."""
+
+        mode = taskrunmode.DeletionMode(None, frequency_hours=-1,
+                                        number_of_timeslots=3)
+        report = mode.run(self.task, dry_run=True)
+        tools.eq_(sorted(report.matched), sorted(self.expected))
+        tools.eq_(report.deleted, [])
+        tools.eq_(len(os.listdir(os.path.join(self.data_dir, "get",
+                                              "2015"))), 5)
+        tools.eq_(self.task.timeslot, self.timeslot)
+
+    def test_positional_schedule(self):
+        """The schedule can still be given as positional arguments."""
+
+        mode = taskrunmode.DeletionMode(None, 0, 0, 0, 0, 0, 0, 0, 0, 0, -1,
+                                        0, 0, 3)
+        tools.eq_(mode.frequency_hours, -1)
+        tools.eq_(mode.number_of_timeslots, 3)
+        tools.eq_(mode.max_workers, 4)
+
+    def test_run(self):
+        """Expired outputs are deleted, listing each directory once."""
+
+        mode = taskrunmode.DeletionMode(None, frequency_hours=-1,
+                                        number_of_timeslots=3,
+                                        batch_size=2)
+        with mock.patch("conductor.urlhandlers.filehandlers.os.listdir",
+                        wraps=os.listdir) as mock_listdir:
+            report = mode.run(self.task)
+            tools.eq_(mock_listdir.call_count, 2)
+        tools.eq_(sorted(report.deleted), sorted(self.expected))
+        tools.eq_(report.errors, {})
+        for base in ("get", "post"):
+            tools.eq_(sorted(os.listdir(os.path.join(self.data_dir, base,
+                                                     "2015"))),
+                      ["out_201501011300.txt", "unrelated.txt"])
+
+    def test_neighbours_are_kept(self):
+        """Only whole file names matching an output are deleted."""
+
+        neighbours = ["out_201501011200.txt.gz", "xout_201501011200.txt",
+                      "out_201501011200.txt.part"]
+        for base in ("get", "post"):
+            for name in neighbours:
+                path = os.path.join(self.data_dir, base, "2015", name)
+                with open(path, "w") as fh:
+                    fh.write("fake")
+        mode = taskrunmode.DeletionMode(None, frequency_hours=-1,
+                                        number_of_timeslots=3)
+        report = mode.run(self.task)
+        tools.eq_(sorted(report.deleted), sorted(self.expected))
+        for base in ("get", "post"):
+            tools.eq_(sorted(os.listdir(os.path.join(self.data_dir, base,
+                                                     "2015"))),
+                      sorted(neighbours + ["out_201501011300.txt",
+                                           "unrelated.txt"]))
+
+
+class TestMovingMode(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.timeslot = datetime.datetime(2015, 1, 1, 12)
+
+    def setup(self):
+        self.data_dir = tempfile.mkdtemp()
+        settings.servers = [{
+            "name": "local",
+            "domain": "localhost",
+            "schemes": [
+                {"method": "GET", "scheme_name": "file",
+                 "base_paths": [os.path.join(self.data_dir, "get")]},
+                {"method": "POST", "scheme_name": "file",
+                 "base_paths": [os.path.join(self.data_dir, "archive")]},
+            ]
+        }]
+        self.task = Task("fake task", "fake:urn", self.timeslot)
+        resource = Resource("out", "fake:{0.timeslot_string}", "out",
+                            timeslot=self.timeslot)
+        rl = ResourceLocation(
+            ["{0.timeslot.year}/out_{0.timeslot_string}.txt"], None,
+            server=Server("local", domain="localhost",
+                          schemes_get=[ServerScheme(
+                              "file", [os.path.join(self.data_dir, "get")])]),
+            scheme=ConductorScheme.FILE, parent=resource
+        )
+        resource.add_location(rl, ServerSchemeMethod.GET)
+        self.task.add_task_resource(TaskResource(resource),
+                                    TaskResourceRole.OUTPUT)
+        self.mode = taskrunmode.MovingMode(
+            None, frequency_hours=-1, number_of_timeslots=3,
+            destinations=[{"server": "local", "scheme": "file",
+                           "relative_paths": ["{0.timeslot.year}"]}],
+        )
+        directory = os.path.join(self.data_dir, "get", "2015")
+        os.makedirs(directory)
+        for hour in (10, 11, 12, 13):
+            path = os.path.join(directory,
+                                "out_20150101{}00.txt".format(hour))
+            with open(path, "w") as fh:
+                fh.write("data for {}".format(hour))
+
+    def teardown(self):
+        settings.servers = []
+        shutil.rmtree(self.data_dir)
+        self.task.clean_temporary_resources()
+
+    def _check_moved(self, results, method):
+        tools.eq_(len(results), 3)
+        tools.eq_(set(r.method for r in results), set([method]))
+        tools.eq_([r.error for r in results], [None] * 3)
+        tools.eq_(os.listdir(os.path.join(self.data_dir, "get", "2015")),
+                  ["out_201501011300.txt"])
+        archive = os.path.join(self.data_dir, "archive", "2015")
+        tools.eq_(sorted(os.listdir(archive)),
+                  ["out_20150101{}00.txt".format(h) for h in (10, 11, 12)])
+        with open(os.path.join(archive, "out_201501011000.txt")) as fh:
+            tools.eq_(fh.read(), "data for 10")
+
+    def test_rename(self):
+        """Outputs in the same filesystem are moved by renaming them."""
+
+        results = self.mode.run(self.task)
+        self._check_moved(results, "rename")
+
+    def test_stream(self):
+        """Outputs are streamed when they cannot be renamed."""
+
+        with mock.patch("conductor.tasks.taskrunmode.os.rename",
+                        side_effect=OSError(errno.EXDEV, "cross-device")):
+            results = self.mode.run(self.task)
+        self._check_moved(results, "stream")
+
+    def test_invalid_destinations(self):
+        """Moving modes without a valid destination are rejected."""
+
+        tools.assert_raises(errors.InvalidSettingsError,
+                            taskrunmode.MovingMode, None)
+        tools.assert_raises(
+            errors.InvalidSettingsError, taskrunmode.MovingMode, None,
+            destinations=[{"server": "local", "scheme": "ftp",
+                           "relative_paths": ["{0.timeslot.year}"]}])
+
+    def test_source_is_kept_without_destinations(self):
+        """Sources are never deleted unless they were copied somewhere."""
+
+        source = os.path.join(self.data_dir, "get", "2015",
+                              "out_201501011000.txt")
+        result = taskrunmode.MovingMode._move(
+            (Url.from_string(source), []))
+        tools.assert_is_not_none(result.error)
+        tools.assert_true(os.path.isfile(source))
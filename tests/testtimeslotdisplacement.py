@@ -0,0 +1,217 @@
+"""
+Unit tests for conductor's timeslotdisplacement module
+"""
+
+import random
+import datetime
+from calendar import monthrange
+
+import mock
+from nose import tools
+from nose.plugins.skip import SkipTest
+
+from conductor.tasks import timeslotdisplacement as tsd
+
+
+class TestTimeslotDisplacementArrays(object):
+
+    @classmethod
+    def setup_class(cls):
+        if tsd.np is None:
+            raise SkipTest("NumPy is not available")
+        rand = random.Random(42)
+        cls.timeslots = [
+            datetime.datetime(2012, 1, 31, 23, 45),
+            datetime.datetime(2015, 12, 31),
+            datetime.datetime(2016, 2, 29, 12, 15),
+            datetime.datetime(2015, 3, 10, 6, 30),
+            datetime.datetime(2015, 3, 21),
+        ]
+        start = datetime.datetime(2000, 1, 1)
+        for i in range(200):
+            cls.timeslots.append(start + datetime.timedelta(
+                minutes=15 * rand.randint(0, 24 * 4 * 365 * 20)))
+        cls.offsets = [
+            {"year": 1},
+            {"year": -3, "month": 13},
+            {"month": -1},
+            {"month": 1, "day": -1},
+            {"month": -25, "hour": 30, "minute": -15},
+            {"day": 400, "minute": 7},
+            {"dekade": 1},
+            {"dekade": -1, "hour": -1},
+        ]
+
+    def test_offset_timeslots(self):
+        """Array offsets are equivalent to the scalar offsets."""
+
+        for offset in self.offsets:
+            expected = [tsd.TimeslotDisplacement.offset_timeslot(t, **offset)
+                        for t in self.timeslots]
+            result = tsd.TimeslotDisplacement.offset_timeslots(
+                self.timeslots, **offset)
+            tools.eq_(result.tolist(), expected)
+
+    def test_get_timeslots_array(self):
+        """Array schedules are equivalent to the scalar schedules."""
+
+        displacement = tsd.TimeslotDisplacement(
+            datetime.datetime(2015, 1, 31, 10), hours=-2)
+        schedules = [
+            {"start_days": -1, "frequency_minutes": 15,
+             "number_of_timeslots": 96 * 3},
+            {"start_months": 1, "frequency_months": -1,
+             "number_of_timeslots": 40},
+            {"frequency_years": 1, "frequency_hours": 1,
+             "number_of_timeslots": 10},
+        ]
+        for schedule in schedules:
+            expected = displacement.get_timeslots(**schedule)
+            result = displacement.get_timeslots_array(**schedule)
+            tools.eq_(result.tolist(), expected)
+
+
+def _loop_dekade_step(timeslot, forward):
+    """The original loop implementation, applied for a single dekade."""
+
+    t_day = timeslot.day
+    factor = 1 if forward else -1
+    if (t_day < 21 and forward) or (t_day > 1 and not forward):
+        end_timeslot = timeslot + factor * datetime.timedelta(days=10)
+    else:
+        the_ts = timeslot if forward else \
+            timeslot - datetime.timedelta(days=1)
+        n_days = monthrange(the_ts.year, the_ts.month)[1] - 20
+        end_timeslot = timeslot + factor * datetime.timedelta(days=n_days)
+    return end_timeslot
+
+
+class TestDekadeCalendar(object):
+
+    @classmethod
+    def setup_class(cls):
+        start = datetime.datetime(2011, 12, 1, 6, 30)
+        cls.timeslots = [start + datetime.timedelta(days=i)
+                         for i in range(0, 3 * 366)]
+
+    def _loop_offset(self, timeslot, dekades):
+        day = tsd.dekade_of_day(timeslot.day) * 10 - 9
+        result = timeslot.replace(day=day)
+        for i in range(abs(dekades)):
+            result = _loop_dekade_step(result, dekades > 0)
+        return result
+
+    def test_ordinals(self):
+        """Timeslots map to dekade ordinals and back."""
+
+        for ts in self.timeslots:
+            ordinal = tsd.DekadeCalendar.to_ordinal(ts)
+            first = tsd.DekadeCalendar.from_ordinal(ordinal, ts.hour,
+                                                    ts.minute)
+            tools.eq_(first, self._loop_offset(ts, 0))
+            tools.eq_(tsd.DekadeCalendar.to_ordinal(first), ordinal)
+
+    def test_offset(self):
+        """Closed-form dekade offsets match stepping the loop."""
+
+        for ts in self.timeslots[::7]:
+            for dekades in (-40, -4, -1, 1, 2, 5, 37):
+                expected = self._loop_offset(ts, dekades)
+                tools.eq_(tsd.DekadeCalendar.offset(ts, dekades), expected)
+                tools.eq_(tsd.TimeslotDisplacement.offset_timeslot(
+                    ts, dekade=dekades), expected)
+
+    def test_range(self):
+        """Dekadal timeslots are enumerated between two timeslots."""
+
+        start = datetime.datetime(2015, 1, 15)
+        end = datetime.datetime(2015, 3, 1)
+        expected = [self._loop_offset(start, i) for i in range(6)]
+        tools.eq_(list(tsd.DekadeCalendar.range(start, end)), expected)
+        if tsd.np is not None:
+            tools.eq_(tsd.DekadeCalendar.range_array(start, end).tolist(),
+                      expected)
+
+
+class TestTimeslotSchedule(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.reference = datetime.datetime(2015, 1, 31, 10, 0)
+        cls.displacement = tsd.TimeslotDisplacement(cls.reference)
+        cls.schedules = [
+            {"start_days": -1, "frequency_minutes": 15,
+             "number_of_timeslots": 300},
+            {"start_hours": 5, "frequency_hours": -1,
+             "number_of_timeslots": 50},
+            {"start_months": 1, "frequency_months": 1,
+             "number_of_timeslots": 40},
+            {"frequency_years": -1, "frequency_days": 1,
+             "number_of_timeslots": 10},
+            {"start_dekades": -3, "frequency_dekades": 2,
+             "number_of_timeslots": 60},
+        ]
+
+    def test_matches_get_timeslots(self):
+        """Schedules hold the same timeslots as get_timeslots."""
+
+        for params in self.schedules:
+            expected = self.displacement.get_timeslots(**params)
+            schedule = self.displacement.get_schedule(**params)
+            tools.eq_(len(schedule), len(expected))
+            tools.eq_(list(schedule), expected)
+            for i in (0, 7, len(expected) - 1):
+                tools.eq_(schedule[i], expected[i])
+                tools.eq_(schedule.index(expected[i]), i)
+            tools.eq_(schedule[-1], expected[-1])
+            tools.assert_raises(IndexError, schedule.__getitem__,
+                                len(expected))
+
+    def test_contains(self):
+        """Membership is answered without iterating the schedule."""
+
+        schedule = tsd.TimeslotSchedule(self.reference, count=10 ** 9,
+                                        frequency_minutes=15)
+        with mock.patch.object(tsd.TimeslotSchedule, "__iter__") as m:
+            tools.assert_true(datetime.datetime(2999, 1, 1) in schedule)
+            tools.assert_false(datetime.datetime(2999, 1, 1, 0, 1) in
+                               schedule)
+            tools.assert_false(datetime.datetime(2000, 1, 1) in schedule)
+            tools.assert_false(m.called)
+        monthly = tsd.TimeslotSchedule(self.reference, count=100,
+                                       frequency_months=1)
+        tools.assert_true(datetime.datetime(2015, 2, 28, 10) in monthly)
+        tools.assert_true(datetime.datetime(2015, 3, 31, 10) in monthly)
+        tools.assert_false(datetime.datetime(2015, 3, 28, 10) in monthly)
+
+    def test_end(self):
+        """Schedules can be bounded by an end timeslot."""
+
+        schedule = tsd.TimeslotSchedule(
+            self.reference, end=datetime.datetime(2015, 2, 1, 10, 59),
+            frequency_minutes=15)
+        tools.eq_(len(schedule), 24 * 4 + 4)
+        backwards = tsd.TimeslotSchedule(
+            self.reference, end=datetime.datetime(2014, 1, 1),
+            frequency_months=-1)
+        tools.eq_(backwards[-1], datetime.datetime(2014, 1, 31, 10))
+
+    def test_intersection(self):
+        """Schedules are intersected with each other."""
+
+        quarter_hourly = tsd.TimeslotSchedule(
+            self.reference, count=24 * 4 * 10, frequency_minutes=15)
+        hourly = tsd.TimeslotSchedule(
+            datetime.datetime(2015, 2, 5), count=24 * 10,
+            frequency_hours=-1, start_minutes=30)
+        expected = sorted(set(quarter_hourly) & set(hourly))
+        result = quarter_hourly.intersection(hourly)
+        tools.assert_is_instance(result, tsd.TimeslotSchedule)
+        tools.eq_(list(result), expected)
+        tools.eq_(list(hourly.intersection(quarter_hourly)), expected)
+        daily = tsd.TimeslotSchedule(self.reference, count=5,
+                                     frequency_days=1, start_minutes=7)
+        tools.eq_(list(quarter_hourly.intersection(daily)), [])
+        monthly = tsd.TimeslotSchedule(self.reference, count=12,
+                                       frequency_months=1)
+        tools.eq_(quarter_hourly.intersection(monthly), [self.reference])
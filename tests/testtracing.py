@@ -0,0 +1,63 @@
+"""
+Unit tests for conductor's tracing module
+"""
+
+import os
+import json
+import shutil
+import tempfile
+
+from nose import tools
+
+from conductor import tracing
+
+
+class TestTracer(object):
+
+    def test_disabled(self):
+        """Disabled tracers record nothing."""
+
+        tracer = tracing.Tracer()
+        with tracer.span("ignored"):
+            pass
+        tools.assert_is(tracer.span("ignored"), tracing._NULL_SPAN)
+        tools.eq_(tracer.spans, [])
+
+    def test_spans(self):
+        """Spans record their duration, arguments and errors."""
+
+        tracer = tracing.Tracer(enabled=True)
+        with tracer.span("outer", "task", task="fake"):
+            try:
+                with tracer.span("inner"):
+                    raise ValueError("boom")
+            except ValueError:
+                pass
+        inner, outer = tracer.spans
+        tools.eq_(outer.name, "outer")
+        tools.eq_(outer.args, {"task": "fake"})
+        tools.assert_in("boom", inner.args["error"])
+        tools.assert_true(outer.start <= inner.start)
+        tools.assert_true(outer.duration >= inner.duration)
+        tools.eq_(len(tracer.pop_spans()), 2)
+        tools.eq_(tracer.spans, [])
+
+    def test_export(self):
+        """Spans are exported as complete Chrome trace events."""
+
+        tracer = tracing.Tracer(enabled=True)
+        with tracer.span("phase", "task"):
+            pass
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "trace.json")
+            tracer.export(path)
+            with open(path) as fh:
+                trace = json.load(fh)
+        finally:
+            shutil.rmtree(directory)
+        event, = trace["traceEvents"]
+        tools.eq_(event["ph"], "X")
+        tools.eq_(event["name"], "phase")
+        tools.eq_(event["pid"], os.getpid())
+        tools.assert_true(event["dur"] >= 0)
@@ -32,3 +32,12 @@ class TestUrl(object):
         u = conductor.urlparser.Url.from_string(self.ftp_url_string)
         eq_(u.url, self.ftp_url_string)
 
+
+    def test_without_password(self):
+        """
+        Passwords are removed from URLs that are stored
+        """
+
+        u = conductor.urlparser.Url.from_string(self.ftp_url_string)
+        eq_(u.without_password().url, "ftp://user@host/some/path/file_pattern")
+        eq_(u.url, self.ftp_url_string)
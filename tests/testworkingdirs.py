@@ -0,0 +1,107 @@
+"""
+Unit tests for conductor's workingdirs module
+"""
+
+import os
+import shutil
+import tempfile
+import datetime
+
+from nose import tools
+
+from conductor.settings import settings
+from conductor.tasks import tasks
+from conductor.tasks import workingdirs
+
+
+class TestWorkingDirectoryManager(object):
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+        self.manager = workingdirs.WorkingDirectoryManager(
+            root=os.path.join(self.root, "fast"), max_pooled=1)
+
+    def teardown(self):
+        self.manager.clear()
+        shutil.rmtree(self.root)
+
+    def test_acquire_creates_root(self):
+        """Directories are created under the configured root."""
+
+        path = self.manager.acquire()
+        tools.eq_(os.path.dirname(path), self.manager.root)
+        tools.eq_(os.listdir(path), [])
+
+    def test_release_recycles(self):
+        """Released directories are emptied and handed out again."""
+
+        first = self.manager.acquire()
+        second = self.manager.acquire()
+        os.makedirs(os.path.join(first, "inputs", "nested"))
+        with open(os.path.join(first, "file"), "w") as fh:
+            fh.write("data")
+        self.manager.release(first)
+        self.manager.release(second)
+        self.manager.wait()
+        # only one directory fits in the pool
+        tools.eq_(os.listdir(self.manager.root), [os.path.basename(first)])
+        recycled = self.manager.acquire()
+        tools.eq_(recycled, first)
+        tools.eq_(os.listdir(recycled), [])
+        tools.assert_not_equal(self.manager.acquire(), first)
+
+    def test_root_from_settings(self):
+        """The root defaults to the working_directories settings."""
+
+        settings.working_directories = {"root": self.root}
+        try:
+            manager = workingdirs.WorkingDirectoryManager()
+            tools.eq_(os.path.dirname(manager.acquire()), self.root)
+        finally:
+            settings.working_directories = dict()
+
+    def test_task_working_dir_is_lazy(self):
+        """Tasks only get a working directory when they use it."""
+
+        original = tasks.working_dir_manager
+        tasks.working_dir_manager = self.manager
+        try:
+            task = tasks.Task("fake task", "fake:urn",
+                              datetime.datetime(2015, 1, 1))
+            tools.eq_(os.listdir(self.root), [])
+            path = task.working_dir
+            tools.assert_true(os.path.isdir(path))
+            task.clean_temporary_resources()
+            self.manager.wait()
+            tools.eq_(self.manager.acquire(), path)
+        finally:
+            tasks.working_dir_manager = original
+
+    def test_clear_drains_released(self):
+        """Clearing waits for released directories and removes them."""
+
+        paths = [self.manager.acquire() for i in range(3)]
+        for path in paths:
+            with open(os.path.join(path, "file"), "w") as fh:
+                fh.write("data")
+            self.manager.release(path)
+        self.manager.clear()
+        tools.eq_(os.listdir(self.manager.root), [])
+
+    def test_task_keeps_working_dir(self):
+        """Tasks that must not remove their working directory keep it."""
+
+        original = tasks.working_dir_manager
+        tasks.working_dir_manager = self.manager
+        try:
+            task = tasks.Task("fake task", "fake:urn",
+                              datetime.datetime(2015, 1, 1),
+                              remove_working_dir=False)
+            path = task.working_dir
+            with open(os.path.join(path, "file"), "w") as fh:
+                fh.write("data")
+            task.clean_temporary_resources()
+            self.manager.clear()
+            tools.eq_(os.listdir(path), ["file"])
+        finally:
+            tasks.working_dir_manager = original
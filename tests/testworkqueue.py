@@ -0,0 +1,204 @@
+"""
+Unit tests for conductor's workqueue module
+"""
+
+import os
+import time
+import shutil
+import datetime
+import tempfile
+
+import mock
+from nose import tools
+
+from conductor import errors
+from conductor.settings import settings
+from conductor.tasks import workqueue
+
+
+def _fake_run(task, mode):
+    if task.timeslot.hour == 1:
+        raise ValueError("fake failure")
+
+
+class _JobQueueTests(object):
+
+    def setup(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.queue = self.make_queue(self.data_dir)
+        self.timeslots = [datetime.datetime(2015, 1, 1, h) for h in range(3)]
+        settings.tasks = [{"name": "fake task", "urn": "fake:urn"}]
+
+    def teardown(self):
+        shutil.rmtree(self.data_dir)
+        settings.tasks = []
+
+    def make_queue(self, directory):
+        raise NotImplementedError
+
+    def test_put_is_idempotent(self):
+        """Jobs are added to the queue only once."""
+
+        first = self.queue.put_many("fake task", self.timeslots)
+        second = self.queue.put_many("fake task", self.timeslots)
+        tools.eq_(first, second)
+        tools.eq_(self.queue.counts(), {workqueue.JobQueue.QUEUED: 3})
+
+    def test_claim(self):
+        """Each job is claimed by a single worker, in timeslot order."""
+
+        self.queue.put_many("fake task", reversed(self.timeslots))
+        claimed = [self.queue.claim("worker {}".format(i), 60)
+                   for i in range(4)]
+        tools.eq_([j.timeslot for j in claimed[:3]], self.timeslots)
+        tools.eq_([j.attempts for j in claimed[:3]], [1, 1, 1])
+        tools.assert_is_none(claimed[3])
+        tools.assert_true(self.queue.complete(claimed[0], "worker 0", True))
+        tools.assert_false(self.queue.complete(claimed[1], "worker 0", True))
+        tools.eq_(self.queue.counts(), {workqueue.JobQueue.DONE: 1,
+                                        workqueue.JobQueue.LEASED: 2})
+
+    def test_expired_leases_are_claimed_again(self):
+        """Jobs are claimed again when their lease is not renewed."""
+
+        self.queue.put("fake task", self.timeslots[0])
+        job = self.queue.claim("dead worker", 0.2)
+        tools.assert_is_none(self.queue.claim("worker", 60))
+        tools.assert_true(self.queue.heartbeat(job, "dead worker", 0.2))
+        time.sleep(0.3)
+        reclaimed = self.queue.claim("worker", 60)
+        tools.eq_(reclaimed.job_id, job.job_id)
+        tools.eq_(reclaimed.attempts, 2)
+        tools.assert_false(self.queue.heartbeat(job, "dead worker", 60))
+        tools.assert_false(self.queue.complete(job, "dead worker", True))
+        tools.assert_true(self.queue.heartbeat(reclaimed, "worker", 60))
+        tools.assert_true(self.queue.complete(reclaimed, "worker", True))
+        tools.eq_(self.queue.counts(), {workqueue.JobQueue.DONE: 1})
+
+    def test_expired_leases_fail_after_max_attempts(self):
+        """Jobs whose lease expires on the last attempt are failed."""
+
+        self.queue.max_attempts = 2
+        self.queue.put_many("fake task", self.timeslots[:2])
+        for attempt in range(2):
+            job = self.queue.claim("dead worker", 0.1)
+            tools.eq_(job.timeslot, self.timeslots[0])
+            time.sleep(0.2)
+        job = self.queue.claim("worker", 60)
+        tools.eq_(job.timeslot, self.timeslots[1])
+        tools.assert_is_none(self.queue.claim("worker", 60))
+        tools.eq_(self.queue.counts(), {workqueue.JobQueue.FAILED: 1,
+                                        workqueue.JobQueue.LEASED: 1})
+
+    def test_failed_jobs_are_retried(self):
+        """Failed jobs are queued again until they reach max_attempts."""
+
+        self.queue.max_attempts = 2
+        self.queue.put("fake task", self.timeslots[0])
+        for attempt in range(2):
+            job = self.queue.claim("worker", 60)
+            tools.eq_(job.attempts, attempt + 1)
+            self.queue.complete(job, "worker", False, "fake failure")
+        tools.assert_is_none(self.queue.claim("worker", 60))
+        tools.eq_(self.queue.counts(), {workqueue.JobQueue.FAILED: 1})
+
+    @mock.patch("conductor.tasks.tasks.Task.run", _fake_run)
+    def test_worker(self):
+        """Workers run queued jobs until the queue is empty."""
+
+        self.queue.max_attempts = 1
+        self.queue.put_many("fake task", self.timeslots)
+        worker = workqueue.Worker(self.queue, lease_seconds=60)
+        outcomes = worker.run()
+        tools.eq_([o.timeslot for o in outcomes], self.timeslots)
+        tools.eq_([o.success for o in outcomes], [True, False, True])
+        tools.eq_(self.queue.counts(), {workqueue.JobQueue.DONE: 2,
+                                        workqueue.JobQueue.FAILED: 1})
+
+    def test_worker_heartbeats(self):
+        """Workers renew the lease of long running jobs."""
+
+        self.queue.put("fake task", self.timeslots[0])
+        worker = workqueue.Worker(self.queue, lease_seconds=0.2,
+                                  heartbeat_interval=0.05)
+
+        def slow_run(task, mode):
+            time.sleep(0.5)
+            tools.assert_is_none(self.queue.claim("other worker", 60))
+
+        with mock.patch("conductor.tasks.tasks.Task.run", slow_run):
+            outcomes = worker.run()
+        tools.assert_true(outcomes[0].success, outcomes[0].details)
+        tools.eq_(self.queue.counts(), {workqueue.JobQueue.DONE: 1})
+
+
+class TestSqliteJobQueue(_JobQueueTests):
+
+    def make_queue(self, directory):
+        return workqueue.SqliteJobQueue(os.path.join(directory, "jobs.db"))
+
+    def test_connections_are_closed(self):
+        """Every connection to the database is closed after use."""
+
+        connections = []
+        connect = workqueue.sqlite3.connect
+
+        def fake_connect(*args, **kwargs):
+            connection = mock.Mock(wraps=connect(*args, **kwargs))
+            connections.append(connection)
+            return connection
+
+        with mock.patch("conductor.tasks.workqueue.sqlite3.connect",
+                        fake_connect):
+            queue = self.make_queue(self.data_dir)
+            queue.put("fake task", self.timeslots[0])
+            job = queue.claim("worker", 60)
+            queue.heartbeat(job, "worker", 60)
+            queue.complete(job, "worker", True)
+            queue.counts()
+        tools.eq_(len(connections), 6)
+        for connection in connections:
+            connection.close.assert_called_once_with()
+
+
+class TestLockfileJobQueue(_JobQueueTests):
+
+    def make_queue(self, directory):
+        return workqueue.LockfileJobQueue(os.path.join(directory, "queue"))
+
+    def test_late_workers_keep_off_new_leases(self):
+        """Expired workers never renew or remove a lease taken meanwhile."""
+
+        self.queue.put_many("fake task", self.timeslots[:2])
+        jobs = [self.queue.claim("dead worker", 0.1) for _ in range(2)]
+        time.sleep(0.2)
+        read_json = self.queue._read_json
+        reclaimed = []
+
+        def claim_while_reading(path):
+            result = read_json(path)
+            if path.startswith(self.queue.leases_dir) and not reclaimed:
+                # another worker claims the job while its lease is checked,
+                # the placeholder keeps the claim's own reads from recursing
+                reclaimed.append(None)
+                reclaimed[0] = self.queue.claim("worker", 60)
+            return result
+
+        for job, call in zip(jobs, [
+                lambda job: self.queue.heartbeat(job, "dead worker", 60),
+                lambda job: self.queue.complete(job, "dead worker", True)]):
+            del reclaimed[:]
+            with mock.patch.object(self.queue, "_read_json",
+                                   side_effect=claim_while_reading):
+                tools.assert_false(call(job))
+            tools.eq_(reclaimed[0].job_id, job.job_id)
+            tools.assert_true(self.queue.heartbeat(reclaimed[0], "worker",
+                                                   60))
+        tools.eq_(self.queue.counts(), {workqueue.JobQueue.LEASED: 2})
+
+
+def test_unknown_backend():
+    """Unknown backends are rejected."""
+
+    tools.assert_raises(errors.InvalidSettingsError,
+                        workqueue.get_job_queue, "redis", "localhost")